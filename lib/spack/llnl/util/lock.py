@@ -8,6 +8,7 @@
 import errno
 import time
 import socket
+import threading
 from datetime import datetime
 
 import llnl.util.tty as tty
@@ -16,7 +17,8 @@
 
 __all__ = ['Lock', 'LockTransaction', 'WriteTransaction', 'ReadTransaction',
            'LockError', 'LockTimeoutError',
-           'LockPermissionError', 'LockROFileError', 'CantCreateLockError']
+           'LockPermissionError', 'LockROFileError', 'CantCreateLockError',
+           'lock_statistics', 'merge_lock_statistics']
 
 #: Mapping of supported locks to description
 lock_type = {fcntl.LOCK_SH: 'read', fcntl.LOCK_EX: 'write'}
@@ -25,6 +27,148 @@
 #: for example.
 true_fn = lambda: True
 
+#: Timeouts shorter than this, in seconds, are polled even by blocking locks,
+#: as they are not worth a thread waiting for the lock.
+min_blocking_timeout = 0.1
+
+#: Upper bounds of the bins of the histograms of the times waited for locks,
+#: in seconds, and of the number of attempts to take them.  A last bin counts
+#: the larger values.
+wait_time_bins = (0.001, 0.01, 0.1, 1, 10, 100)
+attempt_bins = (1, 2, 5, 10, 50, 100)
+
+#: Statistics of the locks taken by this process, by path, byte range and
+#: type of lock.
+_statistics = {}
+_statistics_lock = threading.Lock()
+
+#: Serializes the changes to locks with the threads waiting for them
+_attempts_lock = threading.Lock()
+
+
+def _bin(bins, value):
+    for i, bound in enumerate(bins):
+        if value <= bound:
+            return i
+    return len(bins)
+
+
+def _record_wait(lock, op, wait_time, nattempts, timed_out=False):
+    """Add the wait for a lock, successful or not, to the statistics."""
+    key = (lock.path, lock._start, lock._length, lock_type[op])
+    with _statistics_lock:
+        stats = _statistics.get(key)
+        if stats is None:
+            stats = _statistics[key] = {
+                'path': lock.path, 'start': lock._start,
+                'length': lock._length, 'desc': lock.desc.strip(' ()'),
+                'type': lock_type[op], 'acquired': 0, 'timeouts': 0,
+                'total_wait': 0.0, 'max_wait': 0.0,
+                'wait_histogram': [0] * (len(wait_time_bins) + 1),
+                'attempt_histogram': [0] * (len(attempt_bins) + 1)}
+
+        stats['timeouts' if timed_out else 'acquired'] += 1
+        stats['total_wait'] += wait_time
+        stats['max_wait'] = max(stats['max_wait'], wait_time)
+        stats['wait_histogram'][_bin(wait_time_bins, wait_time)] += 1
+        stats['attempt_histogram'][_bin(attempt_bins, nattempts)] += 1
+
+
+def lock_statistics():
+    """Statistics of the waits for the locks taken by this process.
+
+    Returns:
+        (list): a dictionary for each lock and type of lock, with its
+            ``path``, ``start``, ``length``, ``desc`` and ``type``, how many
+            times it was ``acquired`` and ``timeouts``, the ``total_wait``
+            and ``max_wait`` in seconds, and the ``wait_histogram`` and
+            ``attempt_histogram`` over ``wait_time_bins`` and
+            ``attempt_bins``
+    """
+    with _statistics_lock:
+        return [dict(stats, wait_histogram=list(stats['wait_histogram']),
+                     attempt_histogram=list(stats['attempt_histogram']))
+                for stats in _statistics.values()]
+
+
+def merge_lock_statistics(statistics):
+    """Merge statistics of locks, e.g. from several processes, by lock.
+
+    Args:
+        statistics (list): dictionaries returned by ``lock_statistics()``
+
+    Returns:
+        (list): a dictionary for each lock and type of lock
+    """
+    merged = {}
+    for stats in statistics:
+        key = (stats['path'], stats['start'], stats['length'], stats['type'])
+        if key not in merged:
+            merged[key] = dict(
+                stats, wait_histogram=list(stats['wait_histogram']),
+                attempt_histogram=list(stats['attempt_histogram']))
+            continue
+
+        total = merged[key]
+        for field in ('acquired', 'timeouts', 'total_wait'):
+            total[field] += stats[field]
+        total['max_wait'] = max(total['max_wait'], stats['max_wait'])
+        total['desc'] = total['desc'] or stats['desc']
+        for field in ('wait_histogram', 'attempt_histogram'):
+            total[field] = [a + b for a, b in zip(total[field], stats[field])]
+    return list(merged.values())
+
+
+def _lockf_blocking(f, op, length, start):
+    """Wait in ``lockf()`` for a lock, even if interrupted by signals."""
+    while True:
+        try:
+            return fcntl.lockf(f, op, length, start, os.SEEK_SET)
+        except IOError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+class _LockAttempt(object):
+    """A thread waiting in ``lockf()`` for a lock, so that the wait can time
+    out.
+
+    ``lockf()`` cannot be interrupted, so the thread keeps waiting after a
+    timeout, and the attempt is abandoned.  If an abandoned attempt takes
+    the lock, it gives it back right away, leaving the lock as its ``Lock``
+    holds it then, unless another attempt to take the same lock adopted it
+    before.
+    """
+
+    def __init__(self, lock, op):
+        self.lock = lock
+        self.op = op
+        self.file = lock._file
+        self.pid = os.getpid()
+        self.abandoned = False
+        self.error = None
+        self.done = threading.Event()
+
+        thread = threading.Thread(target=self._wait)
+        thread.daemon = True
+        thread.start()
+
+    def _wait(self):
+        lock = self.lock
+        try:
+            _lockf_blocking(self.file, self.op, lock._length, lock._start)
+        except IOError as e:
+            self.error = e
+
+        with _attempts_lock:
+            if self.error is None:
+                if self.abandoned:
+                    _lockf_blocking(self.file, lock._held or fcntl.LOCK_UN,
+                                    lock._length, lock._start)
+                else:
+                    lock._held = self.op
+            self.done.set()
+
 
 def _attempts_str(wait_time, nattempts):
     # Don't print anything if we succeeded on the first try
@@ -47,10 +191,15 @@ class Lock(object):
     processes and not for managing contention between threads in a process: the
     functions of this object are not thread-safe. A process also must not
     maintain multiple locks on the same file.
+
+    By default, a contended lock is polled, with increasing intervals.  A
+    blocking lock waits in ``lockf()`` instead, so that it is taken as soon
+    as it is released.  As ``lockf()`` cannot be interrupted, a thread waits
+    for the lock when there is a timeout.
     """
 
     def __init__(self, path, start=0, length=0, default_timeout=None,
-                 debug=False, desc=''):
+                 debug=False, desc='', blocking=False):
         """Construct a new lock on the file at ``path``.
 
         By default, the lock applies to the whole file.  Optionally,
@@ -71,12 +220,19 @@ def __init__(self, path, start=0, length=0, default_timeout=None,
             debug (bool): debug mode specific to locking
             desc (str): optional debug message lock description, which is
                 helpful for distinguishing between different Spack locks.
+            blocking (bool): wait in ``lockf()`` for the lock rather than
+                polling it
         """
         self.path = path
         self._file = None
         self._reads = 0
         self._writes = 0
 
+        # type of the POSIX lock held, and attempt waiting in lockf()
+        self.blocking = blocking
+        self._held = None
+        self._attempt = None
+
         # byte range parameters
         self._start = start
         self._length = length
@@ -138,7 +294,9 @@ def _lock(self, op, timeout=None):
         """This takes a lock using POSIX locks (``fcntl.lockf``).
 
         The lock is implemented as a spin lock using a nonblocking call
-        to ``lockf()``.
+        to ``lockf()``, unless it is blocking: after a first nonblocking
+        call, it then waits in ``lockf()``, in a thread if there is a
+        timeout.
 
         If the lock times out, it raises a ``LockError``. If the lock is
         successfully acquired, the total wait time and the number of attempts
@@ -177,25 +335,112 @@ def _lock(self, op, timeout=None):
         tty.debug("{0} locking [{1}:{2}]: timeout {3} sec"
                   .format(lock_type[op], self._start, self._length, timeout))
 
-        poll_intervals = iter(Lock._poll_interval_generator())
         start_time = time.time()
-        num_attempts = 0
+        acquired, num_attempts = self._acquire(op, timeout, start_time)
+        total_wait_time = time.time() - start_time
+        _record_wait(self, op, total_wait_time, num_attempts, not acquired)
+        if acquired:
+            return total_wait_time, num_attempts
+
+        raise LockTimeoutError("Timed out waiting for a {0} lock."
+                               .format(lock_type[op]))
+
+    def _acquire(self, op, timeout, start_time):
+        """Poll the lock, or wait for it if it is blocking, until the
+        timeout.  Return whether it was acquired and the number of attempts.
+        """
+        if self._attempt is not None and self._attempt.pid != os.getpid():
+            # The thread waiting for the lock is left in the parent process
+            self._attempt = None
+
+        num_attempts = 1
+        if self._poll_lock(op):
+            if self._attempt is not None and self._attempt.done.is_set():
+                # The attempt that timed out got the lock in the meantime
+                self._attempt = None
+            return True, num_attempts
+
+        if self.blocking and (not timeout or timeout >= min_blocking_timeout
+                              or self._attempt is not None):
+            num_attempts += 1
+            acquired = self._wait_lock(op, timeout, start_time)
+            if acquired is not None:
+                return acquired, num_attempts
+
+        poll_intervals = iter(Lock._poll_interval_generator())
         while (not timeout) or (time.time() - start_time) < timeout:
+            time.sleep(next(poll_intervals))
             num_attempts += 1
             if self._poll_lock(op):
-                total_wait_time = time.time() - start_time
-                return total_wait_time, num_attempts
+                return True, num_attempts
 
-            time.sleep(next(poll_intervals))
+        return False, num_attempts
 
-        # TBD: Is an extra attempt after timeout needed/appropriate?
-        num_attempts += 1
-        if self._poll_lock(op):
-            total_wait_time = time.time() - start_time
-            return total_wait_time, num_attempts
+    def _wait_lock(self, op, timeout, start_time):
+        """Wait in ``lockf()`` for the lock, in a thread if there is a
+        timeout.  Return whether the lock was acquired, or None if it cannot
+        be waited for because ``lockf()`` detected a deadlock.
+        """
+        deadline = start_time + timeout if timeout else None
+        attempt = self._attempt
+        if attempt is not None:
+            # An attempt that timed out is still waiting for the lock
+            with _attempts_lock:
+                adopted = attempt.op == op and not attempt.done.is_set()
+                if adopted:
+                    attempt.abandoned = False
+            if not adopted:
+                if not self._wait_attempt(attempt, deadline):
+                    return False
+                attempt = None
+
+        if attempt is None:
+            if deadline is None:
+                return self._block_lock(op)
+            attempt = self._attempt = _LockAttempt(self, op)
+
+        if not self._wait_attempt(attempt, deadline):
+            return False
+        if attempt.error is not None:
+            if attempt.error.errno != errno.EDEADLK:
+                raise attempt.error
+            return None
+
+        self._log_owner(op)
+        return True
+
+    def _wait_attempt(self, attempt, deadline):
+        """Wait for the thread of an attempt until the deadline, and
+        abandon the attempt if it is still waiting for the lock.  Return
+        whether it finished.
+        """
+        try:
+            remaining = deadline and max(deadline - time.time(), 0)
+            attempt.done.wait(remaining)
+        finally:
+            with _attempts_lock:
+                finished = attempt.done.is_set()
+                if not finished:
+                    attempt.abandoned = True
+
+        if finished:
+            self._attempt = None
+        return finished
+
+    def _block_lock(self, op):
+        """Wait in ``lockf()`` for the lock.  Return True when it is
+        acquired, or None if ``lockf()`` detected a deadlock.
+        """
+        try:
+            _lockf_blocking(self._file, op, self._length, self._start)
+        except IOError as e:
+            if e.errno != errno.EDEADLK:
+                raise
+            return None
 
-        raise LockTimeoutError("Timed out waiting for a {0} lock."
-                               .format(lock_type[op]))
+        self._held = op
+        self._log_owner(op)
+        return True
 
     def _poll_lock(self, op):
         """Attempt to acquire the lock in a non-blocking manner. Return whether
@@ -205,29 +450,32 @@ def _poll_lock(self, op):
 
         try:
             # Try to get the lock (will raise if not available.)
-            fcntl.lockf(self._file, op | fcntl.LOCK_NB,
-                        self._length, self._start, os.SEEK_SET)
-
-            # help for debugging distributed locking
-            if self.debug:
-                # All locks read the owner PID and host
-                self._read_debug_data()
-                tty.debug('{0} locked {1} [{2}:{3}] (owner={4})'
-                          .format(lock_type[op], self.path,
-                                  self._start, self._length, self.pid))
-
-                # Exclusive locks write their PID/host
-                if op == fcntl.LOCK_EX:
-                    self._write_debug_data()
-
-            return True
+            with _attempts_lock:
+                fcntl.lockf(self._file, op | fcntl.LOCK_NB,
+                            self._length, self._start, os.SEEK_SET)
+                self._held = op
 
         except IOError as e:
             # EAGAIN and EACCES == locked by another process (so try again)
             if e.errno not in (errno.EAGAIN, errno.EACCES):
                 raise
+            return False
 
-        return False
+        self._log_owner(op)
+        return True
+
+    def _log_owner(self, op):
+        # help for debugging distributed locking
+        if self.debug:
+            # All locks read the owner PID and host
+            self._read_debug_data()
+            tty.debug('{0} locked {1} [{2}:{3}] (owner={4})'
+                      .format(lock_type[op], self.path,
+                              self._start, self._length, self.pid))
+
+            # Exclusive locks write their PID/host
+            if op == fcntl.LOCK_EX:
+                self._write_debug_data()
 
     def _ensure_parent_directory(self):
         parent = os.path.dirname(self.path)
@@ -279,10 +527,19 @@ def _unlock(self):
         be masquerading as write locks, but this removes either.
 
         """
-        fcntl.lockf(self._file, fcntl.LOCK_UN,
-                    self._length, self._start, os.SEEK_SET)
-        self._file.close()
-        self._file = None
+        with _attempts_lock:
+            fcntl.lockf(self._file, fcntl.LOCK_UN,
+                        self._length, self._start, os.SEEK_SET)
+            self._held = None
+            waiting = (self._attempt is not None and
+                       not self._attempt.done.is_set())
+
+        # Closing any descriptor of the file would release the lock that
+        # a thread still waiting for it may take
+        if not waiting:
+            self._attempt = None
+            self._file.close()
+            self._file = None
         self._reads = 0
         self._writes = 0
 
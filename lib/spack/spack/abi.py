@@ -8,7 +8,6 @@
 from llnl.util.lang import memoized
 
 import spack.spec
-from spack.build_environment import dso_suffix
 from spack.spec import CompilerSpec
 from spack.util.executable import Executable, ProcessError
 from spack.compilers.clang import Clang
@@ -27,6 +26,7 @@ def architecture_compatible(self, parent, child):
     def _gcc_get_libstdcxx_version(self, version):
         """Returns gcc ABI compatibility info by getting the library version of
            a compiler's libstdc++ or libgcc_s"""
+        from spack.build_environment import dso_suffix
         spec = CompilerSpec("gcc", version)
         compilers = spack.compilers.compilers_for_spec(spec)
         if not compilers:
@@ -66,7 +66,6 @@
 import llnl.util.tty as tty
 from llnl.util.lang import memoized, list_modules, key_ordering
 
-import spack.compiler
 import spack.paths
 import spack.error as serr
 import spack.util.executable
@@ -194,6 +193,7 @@ def optimization_flags(self, compiler):
                 name and the version of the compiler we want to use
         """
         # Mixed toolchains are not supported yet
+        import spack.compiler
         import spack.compilers
         if isinstance(compiler, spack.compiler.Compiler):
             if spack.compilers.is_mixed_toolchain(compiler):
@@ -3,14 +3,21 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import bz2
 import codecs
+import gzip
+import io
+import multiprocessing.pool
 import os
 import re
 import tarfile
 import shutil
+import subprocess
 import tempfile
+import threading
+import time
 import hashlib
-from contextlib import closing
+from contextlib import closing, contextmanager
 import ruamel.yaml as yaml
 
 import json
@@ -27,16 +34,43 @@
 import spack.relocate as relocate
 import spack.util.spack_yaml as syaml
 import spack.mirror
+import spack.stage
+import spack.util.spack_json as sjson
 import spack.util.url as url_util
 import spack.util.web as web_util
 
 from spack.spec import Spec
 from spack.stage import Stage
+from spack.util.executable import ProcessError, which
 from spack.util.gpg import Gpg
 import spack.architecture as architecture
 
 _build_cache_relative_path = 'build_cache'
 
+#: Name of the compressed index of all the specs in a build cache
+_build_cache_index_name = 'index.json.gz'
+
+#: Version of the format of the build cache index
+_build_cache_index_version = 1
+
+#: Maximum number of files downloaded concurrently from build caches
+_max_download_workers = 16
+
+#: Compression codecs of build cache tarballs, with the extension of the
+#: tarballs, and the programs that (de)compress them with several threads
+#: along with their option setting the number of threads. These programs
+#: are used when available, instead of the single threaded Python modules.
+#: pbzip2 is not among them: it writes several bzip2 streams that older
+#: Spack versions can't read.
+compression_codecs = {
+    'bz2': ('.tar.bz2', [('lbzip2', '-n{0}')]),
+    'gz': ('.tar.gz', [('pigz', '-p{0}')]),
+    'xz': ('.tar.xz', [('xz', '-T{0}')]),
+}
+
+#: Codec of the tarballs created before codecs were recorded in spec files
+_default_compression = 'bz2'
+
 BUILD_CACHE_INDEX_TEMPLATE = '''
 <html>
 <head>
@@ -110,6 +144,13 @@ class NewLayoutException(spack.error.SpackError):
     pass
 
 
+class UnknownCompressionException(spack.error.SpackError):
+    """
+    Raised if the tarball is compressed with an unknown codec.
+    """
+    pass
+
+
 def build_cache_relative_path():
     return _build_cache_relative_path
 
@@ -137,44 +178,50 @@ def read_buildinfo_file(prefix):
     return buildinfo
 
 
-def write_buildinfo_file(prefix, workdir, rel=False):
+def get_buildinfo_dict(prefix, rel=False):
     """
-    Create a cache file containing information
-    required for the relocation
+    Create the information required for the relocation of the
+    files in prefix
     """
     text_to_relocate = []
     binary_to_relocate = []
     link_to_relocate = []
     blacklist = (".spack", "man")
-    # Do this at during tarball creation to save time when tarball unpacked.
-    # Used by make_package_relative to determine binaries to change.
+    path_names = []
     for root, dirs, files in os.walk(prefix, topdown=True):
         dirs[:] = [d for d in dirs if d not in blacklist]
         for filename in files:
-            path_name = os.path.join(root, filename)
-            m_type, m_subtype = relocate.mime_type(path_name)
-            if os.path.islink(path_name):
-                link = os.readlink(path_name)
-                if os.path.isabs(link):
-                    # Relocate absolute links into the spack tree
-                    if link.startswith(spack.store.layout.root):
-                        rel_path_name = os.path.relpath(path_name, prefix)
-                        link_to_relocate.append(rel_path_name)
-                    else:
-                        msg = 'Absolute link %s to %s ' % (path_name, link)
-                        msg += 'outside of stage %s ' % prefix
-                        msg += 'cannot be relocated.'
-                        tty.warn(msg)
+            path_names.append(os.path.join(root, filename))
 
-            if relocate.needs_binary_relocation(m_type, m_subtype):
-                if not filename.endswith('.o'):
+    # Do this at during tarball creation to save time when tarball unpacked.
+    # Used when creating the tarball to determine binaries to change.
+    # The types of the files are detected concurrently, up front.
+    mime_types = relocate.mime_types(path_names)
+    for path_name in path_names:
+        filename = os.path.basename(path_name)
+        m_type, m_subtype = mime_types[path_name]
+        if os.path.islink(path_name):
+            link = os.readlink(path_name)
+            if os.path.isabs(link):
+                # Relocate absolute links into the spack tree
+                if link.startswith(spack.store.layout.root):
                     rel_path_name = os.path.relpath(path_name, prefix)
-                    binary_to_relocate.append(rel_path_name)
-            if relocate.needs_text_relocation(m_type, m_subtype):
+                    link_to_relocate.append(rel_path_name)
+                else:
+                    msg = 'Absolute link %s to %s ' % (path_name, link)
+                    msg += 'outside of stage %s ' % prefix
+                    msg += 'cannot be relocated.'
+                    tty.warn(msg)
+
+        if relocate.needs_binary_relocation(m_type, m_subtype):
+            if not filename.endswith('.o'):
                 rel_path_name = os.path.relpath(path_name, prefix)
-                text_to_relocate.append(rel_path_name)
+                binary_to_relocate.append(rel_path_name)
+        if relocate.needs_text_relocation(m_type, m_subtype):
+            rel_path_name = os.path.relpath(path_name, prefix)
+            text_to_relocate.append(rel_path_name)
 
-    # Create buildinfo data and write it to disk
+    # Create buildinfo data
     buildinfo = {}
     buildinfo['relative_rpaths'] = rel
     buildinfo['buildpath'] = spack.store.layout.root
@@ -184,9 +231,7 @@ def write_buildinfo_file(prefix, workdir, rel=False):
     buildinfo['relocate_textfiles'] = text_to_relocate
     buildinfo['relocate_binaries'] = binary_to_relocate
     buildinfo['relocate_links'] = link_to_relocate
-    filename = buildinfo_file_name(workdir)
-    with open(filename, 'w') as outfile:
-        outfile.write(syaml.dump(buildinfo, default_flow_style=True))
+    return buildinfo
 
 
 def tarball_directory_name(spec):
@@ -221,18 +266,23 @@ def tarball_path_name(spec, ext):
                         tarball_name(spec, ext))
 
 
-def checksum_tarball(file):
-    # calculate sha256 hash of tar file
+def _checksum_fileobj(tfile):
+    # calculate sha256 hash of the contents of a file object
     block_size = 65536
     hasher = hashlib.sha256()
-    with open(file, 'rb') as tfile:
+    buf = tfile.read(block_size)
+    while len(buf) > 0:
+        hasher.update(buf)
         buf = tfile.read(block_size)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = tfile.read(block_size)
     return hasher.hexdigest()
 
 
+def checksum_tarball(file):
+    # calculate sha256 hash of tar file
+    with open(file, 'rb') as tfile:
+        return _checksum_fileobj(tfile)
+
+
 def sign_tarball(key, force, specfile_path):
     # Sign the packages if keys available
     if spack.util.gpg.Gpg.gpg() is None:
@@ -263,21 +313,53 @@ def sign_tarball(key, force, specfile_path):
     Gpg.sign(key, specfile_path, '%s.asc' % specfile_path)
 
 
+def _read_url(url):
+    """Read the contents of a URL, or return None if it can't be read."""
+    try:
+        _, _, response = web_util.read_from_url(url)
+        return response.read()
+    except (URLError, web_util.SpackWebError, IOError) as e:
+        tty.debug('Could not read {0}: {1}'.format(url, str(e)))
+        return None
+
+
+def _map_downloads(function, items):
+    """Map function over items with a bounded pool of threads.
+
+    Downloads mostly wait on the network, so they are run concurrently.
+    """
+    items = list(items)
+    if len(items) < 2:
+        return [function(item) for item in items]
+
+    pool = multiprocessing.pool.ThreadPool(
+        min(len(items), _max_download_workers))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def generate_package_index(cache_prefix):
-    """Create the build cache index page.
+    """Create the build cache index page and the build cache index.
 
     Creates (or replaces) the "index.html" page at the location given in
     cache_prefix.  This page contains a link for each binary package (*.yaml)
     and public key (*.key) under cache_prefix.
+
+    Also creates (or replaces) "index.json.gz", a compressed index of the
+    contents and full hashes of all the spec.yaml files under cache_prefix,
+    so clients can read all the specs of the build cache in one request.
     """
     tmpdir = tempfile.mkdtemp()
     try:
         index_html_path = os.path.join(tmpdir, 'index.html')
-        file_list = (
+        file_list = [
             entry
             for entry in web_util.list_url(cache_prefix)
             if (entry.endswith('.yaml')
-                or entry.endswith('.key')))
+                or entry.endswith('.key'))]
 
         with open(index_html_path, 'w') as f:
             f.write(BUILD_CACHE_INDEX_TEMPLATE.format(
@@ -291,26 +373,97 @@ def generate_package_index(cache_prefix):
             url_util.join(cache_prefix, 'index.html'),
             keep_original=False,
             extra_args={'ContentType': 'text/html'})
+
+        # Read the spec.yaml files concurrently
+        spec_files = [f for f in file_list if f.endswith('.spec.yaml')]
+        contents = _map_downloads(
+            _read_url, (url_util.join(cache_prefix, f) for f in spec_files))
+
+        specs = {}
+        for spec_file, content in zip(spec_files, contents):
+            if content is None:
+                tty.warn('Could not read {0}, skipping it'.format(spec_file))
+                continue
+
+            content = codecs.decode(content, 'utf-8')
+            spec_dict = syaml.load(content)
+            specs[spec_file] = {
+                'full_hash': spec_dict.get('full_hash'),
+                'spec': content,
+            }
+
+        index_json_path = os.path.join(tmpdir, _build_cache_index_name)
+        with closing(gzip.open(index_json_path, 'wb')) as f:
+            index = {
+                'buildcache_index': {
+                    'version': _build_cache_index_version,
+                    'specs': specs,
+                }
+            }
+            f.write(json.dumps(index).encode('utf-8'))
+
+        web_util.push_to_url(
+            index_json_path,
+            url_util.join(cache_prefix, _build_cache_index_name),
+            keep_original=False,
+            extra_args={'ContentType': 'application/gzip'})
     finally:
         shutil.rmtree(tmpdir)
 
 
+def read_package_index(cache_prefix):
+    """Read the build cache index at the location given in cache_prefix.
+
+    Returns:
+        (dict or None): entries of the index, by spec.yaml file name, or
+            None if the build cache has no (valid) index
+    """
+    index_url = url_util.join(cache_prefix, _build_cache_index_name)
+    data = _read_url(index_url)
+    if data is None:
+        return None
+
+    try:
+        with closing(gzip.GzipFile(fileobj=io.BytesIO(data))) as f:
+            index = sjson.load(f.read().decode('utf-8'))
+        index = index['buildcache_index']
+        if index['version'] != _build_cache_index_version:
+            tty.debug('Ignoring {0}: unknown version {1}'.format(
+                url_util.format(index_url), index['version']))
+            return None
+        return index['specs']
+    except Exception as e:
+        tty.warn('Ignoring invalid build cache index {0}: {1}'.format(
+            url_util.format(index_url), str(e)))
+        return None
+
+
 def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
-                  allow_root=False, key=None, regenerate_index=False):
+                  allow_root=False, key=None, regenerate_index=False,
+                  compression=None):
     """
     Build a tarball from given spec and put it into the directory structure
     used at the mirror (following <tarball_directory_name>).
+
+    The tarball is compressed with the given codec, one of the keys of
+    ``compression_codecs``, or by default with the codec set in the
+    ``config:buildcache_compression`` setting.
     """
     if not spec.concrete:
         raise ValueError('spec must be concrete to build tarball')
 
+    if compression is None:
+        compression = config.get(
+            'config:buildcache_compression', _default_compression)
+    if compression not in compression_codecs:
+        raise ValueError('unknown compression codec: %s' % compression)
+
     # set up some paths
     tmpdir = tempfile.mkdtemp()
     cache_prefix = build_cache_prefix(tmpdir)
 
-    tarfile_name = tarball_name(spec, '.tar.bz2')
+    tarfile_name = tarball_name(spec, compression_codecs[compression][0])
     tarfile_dir = os.path.join(cache_prefix, tarball_directory_name(spec))
-    tarfile_path = os.path.join(tarfile_dir, tarfile_name)
     spackfile_path = os.path.join(
         cache_prefix, tarball_path_name(spec, '.spack'))
 
@@ -341,51 +494,14 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
         else:
             raise NoOverwriteException(url_util.format(remote_specfile_path))
 
-    # make a copy of the install directory to work with
-    workdir = os.path.join(tmpdir, os.path.basename(spec.prefix))
-    # install_tree copies hardlinks
-    # create a temporary tarfile from prefix and exract it to workdir
-    # tarfile preserves hardlinks
-    temp_tarfile_name = tarball_name(spec, '.tar')
-    temp_tarfile_path = os.path.join(tarfile_dir, temp_tarfile_name)
-    with closing(tarfile.open(temp_tarfile_path, 'w')) as tar:
-        tar.add(name='%s' % spec.prefix,
-                arcname='.')
-    with closing(tarfile.open(temp_tarfile_path, 'r')) as tar:
-        tar.extractall(workdir)
-    os.remove(temp_tarfile_path)
-
-    # create info for later relocation and create tar
-    write_buildinfo_file(spec.prefix, workdir, rel=rel)
-
-    # optionally make the paths in the binaries relative to each other
-    # in the spack install tree before creating tarball
-    if rel:
-        try:
-            make_package_relative(workdir, spec, allow_root)
-        except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
-            shutil.rmtree(tmpdir)
-            tty.die(e)
-    else:
-        try:
-            make_package_placeholder(workdir, spec, allow_root)
-        except Exception as e:
-            shutil.rmtree(workdir)
-            shutil.rmtree(tarfile_dir)
-            shutil.rmtree(tmpdir)
-            tty.die(e)
-
-    # create compressed tarball of the install prefix
-    with closing(tarfile.open(tarfile_path, 'w:bz2')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='%s' % os.path.basename(spec.prefix))
-    # remove copy of install directory
-    shutil.rmtree(workdir)
-
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
+    # write the compressed tarball of the install prefix straight into
+    # the .spack archive, and get its sha256 checksum on the way
+    try:
+        checksum = _write_spackfile(spec, spackfile_path, tarfile_name, rel,
+                                    allow_root, tmpdir, compression)
+    except Exception as e:
+        shutil.rmtree(tmpdir)
+        tty.die(e)
 
     # add sha256 checksum to spec.yaml
     with open(spec_file, 'r') as inputfile:
@@ -400,6 +516,8 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     buildinfo = {}
     buildinfo['relative_prefix'] = os.path.relpath(
         spec.prefix, spack.store.layout.root)
+    # Add the compression codec of the tarball, to read it on extraction
+    buildinfo['compression'] = compression
     spec_dict['buildinfo'] = buildinfo
     spec_dict['full_hash'] = spec.full_hash()
 
@@ -415,16 +533,14 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     # sign the tarball and spec file with gpg
     if not unsigned:
         sign_tarball(key, force, specfile_path)
-    # put tarball, spec and signature files in .spack archive
-    with closing(tarfile.open(spackfile_path, 'w')) as tar:
-        tar.add(name=tarfile_path, arcname='%s' % tarfile_name)
+    # add spec and signature files to the .spack archive
+    with closing(tarfile.open(spackfile_path, 'a')) as tar:
         tar.add(name=specfile_path, arcname='%s' % specfile_name)
         if not unsigned:
             tar.add(name='%s.asc' % specfile_path,
                     arcname='%s.asc' % specfile_name)
 
     # cleanup file moved to archive
-    os.remove(tarfile_path)
     if not unsigned:
         os.remove('%s.asc' % specfile_path)
 
@@ -445,6 +561,370 @@ def build_tarball(spec, outdir, force=False, rel=False, unsigned=False,
     return None
 
 
+class _HashingWriter(object):
+    """File object computing the size and the sha256 checksum of the data
+    written through it to another file object."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self.fileobj.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+
+class _MultiStreamBZ2Reader(object):
+    """File object decompressing all the bzip2 streams concatenated in the
+    data read from another file object, as written by pbzip2. The bz2 mode
+    of tarfile stops after the first stream."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.decompressor = bz2.BZ2Decompressor()
+        self.buffer = b''
+        self.offset = 0
+
+    def _decompress(self, data):
+        chunks = []
+        while data:
+            try:
+                chunks.append(self.decompressor.decompress(data))
+            except EOFError:
+                # the previous stream ended exactly before data
+                self.decompressor = bz2.BZ2Decompressor()
+                continue
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = bz2.BZ2Decompressor()
+        return b''.join(chunks)
+
+    def read(self, size):
+        if len(self.buffer) - self.offset < size:
+            chunks = [self.buffer[self.offset:]]
+            available = len(chunks[0])
+            while available < size:
+                data = self.fileobj.read(65536)
+                if not data:
+                    break
+                chunks.append(self._decompress(data))
+                available += len(chunks[-1])
+            self.buffer = b''.join(chunks)
+            self.offset = 0
+
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+
+def compression_program(compression):
+    """Return the command line of a program that (de)compresses data with
+    several threads in the given codec, or None if there's none."""
+    threads = config.get('config:build_jobs') or multiprocessing.cpu_count()
+    for name, threads_arg in compression_codecs[compression][1]:
+        program = which(name)
+        if program:
+            return [program.path, threads_arg.format(threads)]
+    return None
+
+
+def _check_program(proc, command):
+    returncode = proc.wait()
+    if returncode != 0:
+        raise ProcessError('Command exited with status %d:' % returncode,
+                           ' '.join(command))
+
+
+@contextmanager
+def _open_tarball_writer(fileobj, compression, parallel=True):
+    """Open a tarfile writing a tarball compressed with the given codec to
+    fileobj, as a stream.
+
+    If parallel is True and a program compressing with several threads is
+    available, the tarball is piped through it instead of being compressed
+    by Python.
+    """
+    command = parallel and compression_program(compression)
+    if not command:
+        with closing(tarfile.open(
+                fileobj=fileobj, mode='w|' + compression)) as tar:
+            yield tar
+        return
+
+    command = command + ['-c']
+    proc = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    errors = []
+
+    def copy_output():
+        try:
+            shutil.copyfileobj(proc.stdout, fileobj, 65536)
+        except Exception as e:
+            errors.append(e)
+            proc.kill()
+
+    thread = threading.Thread(target=copy_output)
+    thread.daemon = True
+    thread.start()
+    try:
+        with closing(tarfile.open(fileobj=proc.stdin, mode='w|')) as tar:
+            yield tar
+        proc.stdin.close()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        thread.join()
+        if errors:
+            raise errors[0]
+        raise
+
+    thread.join()
+    proc.stdout.close()
+    if errors:
+        raise errors[0]
+    _check_program(proc, command)
+
+
+@contextmanager
+def _open_tarball_reader(fileobj, compression, parallel=True):
+    """Open a tarfile reading a tarball compressed with the given codec from
+    fileobj, as a stream.
+
+    If parallel is True and a program decompressing with several threads is
+    available, the tarball is piped through it instead of being
+    decompressed by Python.
+    """
+    command = parallel and compression_program(compression)
+    if not command:
+        if compression == 'bz2':
+            fileobj, compression = _MultiStreamBZ2Reader(fileobj), ''
+        with closing(tarfile.open(
+                fileobj=fileobj, mode='r|' + compression)) as tar:
+            yield tar
+        return
+
+    command = command + ['-d', '-c']
+    proc = subprocess.Popen(
+        command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def copy_input():
+        try:
+            shutil.copyfileobj(fileobj, proc.stdin, 65536)
+            proc.stdin.close()
+        except (IOError, OSError):
+            # the program stopped reading, its status tells why
+            pass
+
+    thread = threading.Thread(target=copy_input)
+    thread.daemon = True
+    thread.start()
+    try:
+        with closing(tarfile.open(fileobj=proc.stdout, mode='r|')) as tar:
+            yield tar
+        # read the padding after the end of the archive
+        while proc.stdout.read(65536):
+            pass
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        thread.join()
+        raise
+
+    thread.join()
+    proc.stdout.close()
+    _check_program(proc, command)
+
+
+def _walk_prefix(prefix):
+    """Yield the paths under prefix, each directory before its contents."""
+    yield prefix
+    for root, dirs, files in os.walk(prefix):
+        dirs.sort()
+        for name in sorted(dirs + files):
+            yield os.path.join(root, name)
+
+
+def _write_prefix_tarball(spec, fileobj, rel, allow_root, tmpdir,
+                          compression):
+    """Write the compressed tarball of the install prefix of spec.
+
+    The prefix is read once and the tarball is streamed to fileobj: links
+    are relocated on the fly, and only the binaries whose RPATHs are made
+    relative are copied to tmpdir, one at a time, to be edited.
+
+    The offsets of the prefixes in the files to relocate, and the search
+    path entries of the binaries, are recorded in the buildinfo file as the
+    files are added, so that they need not be scanned when installed.
+    """
+    prefix = spec.prefix
+    buildinfo = get_buildinfo_dict(prefix, rel=rel)
+    textfiles = set(buildinfo['relocate_textfiles'])
+    binaries = set(buildinfo['relocate_binaries'])
+    links = set(buildinfo['relocate_links'])
+    text_offsets, binary_offsets, rpath_entries = {}, {}, {}
+
+    def record_offsets(rel_path, path):
+        if rel_path in textfiles:
+            text_offsets[rel_path] = relocate.text_prefix_offsets(
+                path, buildinfo['buildpath'], buildinfo['spackprefix'])
+        elif rel_path in binaries:
+            entries, offsets = relocate.binary_relocation_offsets(
+                path, buildinfo['buildpath'])
+            binary_offsets[rel_path] = offsets
+            if entries is not None:
+                rpath_entries[rel_path] = entries
+
+    if not rel:
+        relocate.check_files_relocatable(
+            [os.path.join(prefix, f) for f in sorted(binaries)], allow_root)
+
+    base = os.path.basename(prefix)
+    buildinfo_path = buildinfo_file_name(prefix)
+    with _open_tarball_writer(fileobj, compression) as tar:
+        for i, path in enumerate(_walk_prefix(prefix)):
+            # the buildinfo file is written from scratch below
+            if path == buildinfo_path:
+                continue
+
+            rel_path = os.path.relpath(path, prefix)
+            arcname = os.path.normpath(os.path.join(base, rel_path))
+            tarinfo = tar.gettarinfo(path, arcname)
+
+            if tarinfo.issym() and rel_path in links:
+                if rel:
+                    tarinfo.linkname = relocate.get_relative_link(
+                        tarinfo.linkname, path)
+                else:
+                    tarinfo.linkname = relocate.get_placeholder_link(
+                        tarinfo.linkname, prefix, prefix)
+
+            if not tarinfo.isreg():
+                tar.addfile(tarinfo)
+            elif rel and rel_path in binaries:
+                # names are unique as file types are memoized by path
+                cur_path = os.path.join(
+                    tmpdir, '%d-%s' % (i, os.path.basename(path)))
+                shutil.copy2(path, cur_path)
+                try:
+                    if spec.architecture.platform == 'darwin':
+                        relocate.make_macho_binaries_relative(
+                            [cur_path], [path], buildinfo['buildpath'],
+                            allow_root)
+                    else:
+                        relocate.make_elf_binaries_relative(
+                            [cur_path], [path], buildinfo['buildpath'],
+                            allow_root)
+                    tarinfo.size = os.path.getsize(cur_path)
+                    record_offsets(rel_path, cur_path)
+                    with open(cur_path, 'rb') as f:
+                        tar.addfile(tarinfo, f)
+                finally:
+                    os.remove(cur_path)
+            else:
+                record_offsets(rel_path, path)
+                with open(path, 'rb') as f:
+                    tar.addfile(tarinfo, f)
+
+        buildinfo['relocate_text_offsets'] = text_offsets
+        buildinfo['relocate_binary_offsets'] = binary_offsets
+        buildinfo['relocate_rpath_entries'] = rpath_entries
+        content = syaml.dump(buildinfo, default_flow_style=True)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        tarinfo = tarfile.TarInfo(os.path.join(
+            base, os.path.relpath(buildinfo_path, prefix)))
+        tarinfo.size = len(content)
+        tarinfo.mode = 0o644
+        tarinfo.mtime = int(time.time())
+        tar.addfile(tarinfo, io.BytesIO(content))
+
+
+def _write_spackfile(spec, spackfile_path, tarfile_name, rel, allow_root,
+                     tmpdir, compression):
+    """Write a .spack archive containing the compressed tarball of spec.
+
+    The tarball is compressed and checksummed while it is written into the
+    archive, and its header is filled in once its size is known. Spec
+    files can then be appended to the archive.
+
+    Returns:
+        (str): the sha256 checksum of the compressed tarball
+    """
+    tarinfo = tarfile.TarInfo(tarfile_name)
+    tarinfo.mode = 0o644
+    tarinfo.mtime = int(time.time())
+    header_size = len(tarinfo.tobuf(tarfile.GNU_FORMAT))
+
+    with open(spackfile_path, 'wb') as f:
+        f.write(tarfile.NUL * header_size)
+        writer = _HashingWriter(f)
+        _write_prefix_tarball(
+            spec, writer, rel, allow_root, tmpdir, compression)
+
+        # pad the tarball to a full block, and end the archive
+        remainder = writer.size % tarfile.BLOCKSIZE
+        if remainder:
+            f.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        f.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+
+        tarinfo.size = writer.size
+        header = tarinfo.tobuf(tarfile.GNU_FORMAT)
+        assert len(header) == header_size
+        f.seek(0)
+        f.write(header)
+
+    return writer.hexdigest()
+
+
+def benchmark_compression(prefix, compression, parallel=True):
+    """Compress the tarball of prefix with a codec, then decompress it.
+
+    Args:
+        prefix (str): directory to compress
+        compression (str): codec, one of the keys of ``compression_codecs``
+        parallel (bool): use a program compressing with several threads,
+            if one is available, instead of Python
+
+    Returns:
+        (dict): sizes of the files and of the compressed tarball, and the
+            time spent (de)compressing it, in seconds
+    """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tarball_path = os.path.join(tmpdir, 'prefix.tar')
+        with open(tarball_path, 'wb') as f:
+            writer = _HashingWriter(f)
+            start = time.time()
+            with _open_tarball_writer(writer, compression, parallel) as tar:
+                tar.add(prefix, arcname=os.path.basename(prefix))
+            compress_time = time.time() - start
+
+        size = 0
+        with open(tarball_path, 'rb') as f:
+            start = time.time()
+            with _open_tarball_reader(f, compression, parallel) as tar:
+                for member in tar:
+                    if member.isreg():
+                        member_file = tar.extractfile(member)
+                        for data in iter(lambda: member_file.read(65536), b''):
+                            size += len(data)
+            decompress_time = time.time() - start
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return {
+        'size': size,
+        'compressed_size': writer.size,
+        'compress_time': compress_time,
+        'decompress_time': decompress_time,
+    }
+
+
 def download_tarball(spec):
     """
     Download binary tarball for given package into stage area
@@ -471,54 +951,23 @@ def download_tarball(spec):
     return None
 
 
-def make_package_relative(workdir, spec, allow_root):
-    """
-    Change paths in binaries to relative paths. Change absolute symlinks
-    to relative symlinks.
-    """
-    prefix = spec.prefix
-    buildinfo = read_buildinfo_file(workdir)
-    old_path = buildinfo['buildpath']
-    orig_path_names = list()
-    cur_path_names = list()
-    for filename in buildinfo['relocate_binaries']:
-        orig_path_names.append(os.path.join(prefix, filename))
-        cur_path_names.append(os.path.join(workdir, filename))
-    if spec.architecture.platform == 'darwin':
-        relocate.make_macho_binaries_relative(cur_path_names, orig_path_names,
-                                              old_path, allow_root)
-    else:
-        relocate.make_elf_binaries_relative(cur_path_names, orig_path_names,
-                                            old_path, allow_root)
-    orig_path_names = list()
-    cur_path_names = list()
-    for filename in buildinfo.get('relocate_links', []):
-        orig_path_names.append(os.path.join(prefix, filename))
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_link_relative(cur_path_names, orig_path_names)
-
-
-def make_package_placeholder(workdir, spec, allow_root):
-    """
-    Check if package binaries are relocatable.
-    Change links to placeholder links.
-    """
-    prefix = spec.prefix
-    buildinfo = read_buildinfo_file(workdir)
-    cur_path_names = list()
-    for filename in buildinfo['relocate_binaries']:
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.check_files_relocatable(cur_path_names, allow_root)
-
-    cur_path_names = list()
-    for filename in buildinfo.get('relocate_links', []):
-        cur_path_names.append(os.path.join(workdir, filename))
-    relocate.make_link_placeholder(cur_path_names, workdir, prefix)
+def _buildinfo_paths(workdir, buildinfo, key):
+    """The dictionary in buildinfo under key, with its relative paths made
+    absolute, or None if it was not recorded in an older build cache."""
+    paths = buildinfo.get(key)
+    if paths is None:
+        return None
+    return dict((os.path.join(workdir, filename), value)
+                for filename, value in paths.items())
 
 
 def relocate_package(workdir, spec, allow_root):
     """
     Relocate the given package
+
+    Build caches record where the prefixes are found in the files to
+    relocate: these files are edited at the recorded offsets, and the
+    others are scanned for the prefixes.
     """
     buildinfo = read_buildinfo_file(workdir)
     new_path = str(spack.store.layout.root)
@@ -527,6 +976,8 @@ def relocate_package(workdir, spec, allow_root):
     old_prefix = str(buildinfo.get('spackprefix',
                                    '/not/in/buildinfo/dictionary'))
     rel = buildinfo.get('relative_rpaths', False)
+    binary_offsets = _buildinfo_paths(
+        workdir, buildinfo, 'relocate_binary_offsets') or {}
 
     tty.msg("Relocating package from",
             "%s to %s." % (old_path, new_path))
@@ -538,24 +989,31 @@ def relocate_package(workdir, spec, allow_root):
             path_names.add(path_name)
     relocate.relocate_text(path_names, oldpath=old_path,
                            newpath=new_path, oldprefix=old_prefix,
-                           newprefix=new_prefix)
+                           newprefix=new_prefix,
+                           offsets=_buildinfo_paths(
+                               workdir, buildinfo, 'relocate_text_offsets'))
     # If the binary files in the package were not edited to use
     # relative RPATHs, then the RPATHs need to be relocated
     if rel:
         if old_path != new_path:
-            files_to_relocate = list(filter(
-                lambda pathname: not relocate.file_is_relocatable(
-                    pathname, paths_to_relocate=[old_path, old_prefix]),
-                map(lambda filename: os.path.join(workdir, filename),
-                    buildinfo['relocate_binaries'])))
+            files_to_relocate = []
+            for filename in buildinfo['relocate_binaries']:
+                path_name = os.path.join(workdir, filename)
+                if path_name in binary_offsets:
+                    # The strings to relocate were recorded
+                    if binary_offsets[path_name]:
+                        files_to_relocate.append(path_name)
+                elif not relocate.file_is_relocatable(
+                        path_name, paths_to_relocate=[old_path, old_prefix]):
+                    files_to_relocate.append(path_name)
 
             if len(old_path) < len(new_path) and files_to_relocate:
                 tty.debug('Cannot do a binary string replacement with padding '
                           'for package because %s is longer than %s.' %
                           (new_path, old_path))
             else:
-                for path_name in files_to_relocate:
-                    relocate.replace_prefix_bin(path_name, old_path, new_path)
+                relocate.replace_prefix_bins(
+                    files_to_relocate, old_path, new_path, binary_offsets)
     else:
         path_names = set()
         for filename in buildinfo['relocate_binaries']:
@@ -565,8 +1023,11 @@ def relocate_package(workdir, spec, allow_root):
             relocate.relocate_macho_binaries(path_names, old_path,
                                              new_path, allow_root)
         else:
-            relocate.relocate_elf_binaries(path_names, old_path,
-                                           new_path, allow_root)
+            relocate.relocate_elf_binaries(
+                path_names, old_path, new_path, allow_root,
+                rpath_entries=_buildinfo_paths(
+                    workdir, buildinfo, 'relocate_rpath_entries'),
+                offsets=binary_offsets)
         path_names = set()
         for filename in buildinfo.get('relocate_links', []):
             path_name = os.path.join(workdir, filename)
@@ -574,6 +1035,35 @@ def relocate_package(workdir, spec, allow_root):
         relocate.relocate_links(path_names, old_path, new_path)
 
 
+def _prefix_members(tar, base):
+    """Yield the members of tar under base, renamed relative to base."""
+    top = base + '/'
+    for member in tar:
+        if member.name == base:
+            member.name = '.'
+        elif member.name.startswith(top):
+            member.name = member.name[len(top):]
+        else:
+            tty.debug('Skipping {0} outside of {1}'.format(member.name, base))
+            continue
+
+        # hard links point to other members of the tarball
+        if member.islnk() and member.linkname.startswith(top):
+            member.linkname = member.linkname[len(top):]
+        yield member
+
+
+def _extract_prefix_tarball(fileobj, prefix, compression):
+    """Extract the compressed tarball of an install prefix into prefix.
+
+    The tarball is read from fileobj as a stream, and its files are
+    written straight to their place in the install prefix.
+    """
+    base = os.path.basename(prefix)
+    with _open_tarball_reader(fileobj, compression) as tar:
+        tar.extractall(path=prefix, members=_prefix_members(tar, base))
+
+
 def extract_tarball(spec, filename, allow_root=False, unsigned=False,
                     force=False):
     """
@@ -589,83 +1079,93 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
     stagepath = os.path.dirname(filename)
     spackfile_name = tarball_name(spec, '.spack')
     spackfile_path = os.path.join(stagepath, spackfile_name)
-    tarfile_name = tarball_name(spec, '.tar.bz2')
-    tarfile_path = os.path.join(tmpdir, tarfile_name)
     specfile_name = tarball_name(spec, '.spec.yaml')
     specfile_path = os.path.join(tmpdir, specfile_name)
 
-    with closing(tarfile.open(spackfile_path, 'r')) as tar:
-        tar.extractall(tmpdir)
-    # older buildcache tarfiles use gzip compression
-    if not os.path.exists(tarfile_path):
-        tarfile_name = tarball_name(spec, '.tar.gz')
-        tarfile_path = os.path.join(tmpdir, tarfile_name)
-    if not unsigned:
-        if os.path.exists('%s.asc' % specfile_path):
-            try:
-                suppress = config.get('config:suppress_gpg_warnings', False)
-                Gpg.verify('%s.asc' % specfile_path, specfile_path, suppress)
-            except Exception as e:
+    # only the spec files are extracted to the temp directory, the
+    # tarball is read directly from the .spack archive
+    with closing(tarfile.open(spackfile_path, 'r')) as spackfile:
+        names = spackfile.getnames()
+        for name in (specfile_name, '%s.asc' % specfile_name):
+            if name in names:
+                spackfile.extract(name, tmpdir)
+
+        if not unsigned:
+            if os.path.exists('%s.asc' % specfile_path):
+                try:
+                    suppress = config.get(
+                        'config:suppress_gpg_warnings', False)
+                    Gpg.verify(
+                        '%s.asc' % specfile_path, specfile_path, suppress)
+                except Exception as e:
+                    shutil.rmtree(tmpdir)
+                    tty.die(e)
+            else:
                 shutil.rmtree(tmpdir)
-                tty.die(e)
-        else:
+                raise NoVerifyException(
+                    "Package spec file failed signature verification.\n"
+                    "Use spack buildcache keys to download "
+                    "and install a key for verification from the mirror.")
+        spec_dict = {}
+        with open(specfile_path, 'r') as inputfile:
+            content = inputfile.read()
+            spec_dict = syaml.load(content)
+        buildinfo = spec_dict.get('buildinfo', {})
+
+        # get the codec of the tarball recorded at creation
+        compression = buildinfo.get('compression')
+        if compression is None:
+            # older buildcache tarfiles use gzip compression
+            compression = _default_compression
+            if tarball_name(spec, '.tar.bz2') not in names:
+                compression = 'gz'
+        if compression not in compression_codecs:
             shutil.rmtree(tmpdir)
-            raise NoVerifyException(
-                "Package spec file failed signature verification.\n"
-                "Use spack buildcache keys to download "
-                "and install a key for verification from the mirror.")
-    # get the sha256 checksum of the tarball
-    checksum = checksum_tarball(tarfile_path)
-
-    # get the sha256 checksum recorded at creation
-    spec_dict = {}
-    with open(specfile_path, 'r') as inputfile:
-        content = inputfile.read()
-        spec_dict = syaml.load(content)
-    bchecksum = spec_dict['binary_cache_checksum']
+            raise UnknownCompressionException(
+                "Package tarball is compressed with an unknown codec: "
+                "%s.\nIt cannot be installed." % compression)
+        tarfile_name = tarball_name(spec, compression_codecs[compression][0])
 
-    # if the checksums don't match don't install
-    if bchecksum['hash'] != checksum:
-        shutil.rmtree(tmpdir)
-        raise NoChecksumException(
-            "Package tarball failed checksum verification.\n"
-            "It cannot be installed.")
-
-    new_relative_prefix = str(os.path.relpath(spec.prefix,
-                                              spack.store.layout.root))
-    # if the original relative prefix is in the spec file use it
-    buildinfo = spec_dict.get('buildinfo', {})
-    old_relative_prefix = buildinfo.get('relative_prefix', new_relative_prefix)
-    # if the original relative prefix and new relative prefix differ the
-    # directory layout has changed and the  buildcache cannot be installed
-    if old_relative_prefix != new_relative_prefix:
-        shutil.rmtree(tmpdir)
-        msg = "Package tarball was created from an install "
-        msg += "prefix with a different directory layout.\n"
-        msg += "It cannot be relocated."
-        raise NewLayoutException(msg)
-
-    # extract the tarball in a temp directory
-    with closing(tarfile.open(tarfile_path, 'r')) as tar:
-        tar.extractall(path=tmpdir)
-    # the base of the install prefix is used when creating the tarball
-    # so the pathname should be the same now that the directory layout
-    # is confirmed
-    workdir = os.path.join(tmpdir, os.path.basename(spec.prefix))
-    # install_tree copies hardlinks
-    # create a temporary tarfile from prefix and exract it to workdir
-    # tarfile preserves hardlinks
-    temp_tarfile_name = tarball_name(spec, '.tar')
-    temp_tarfile_path = os.path.join(tmpdir, temp_tarfile_name)
-    with closing(tarfile.open(temp_tarfile_path, 'w')) as tar:
-        tar.add(name='%s' % workdir,
-                arcname='.')
-    with closing(tarfile.open(temp_tarfile_path, 'r')) as tar:
-        tar.extractall(spec.prefix)
-    os.remove(temp_tarfile_path)
+        # get the sha256 checksum of the tarball
+        with closing(spackfile.extractfile(tarfile_name)) as tfile:
+            checksum = _checksum_fileobj(tfile)
+
+        # get the sha256 checksum recorded at creation
+        bchecksum = spec_dict['binary_cache_checksum']
+
+        # if the checksums don't match don't install
+        if bchecksum['hash'] != checksum:
+            shutil.rmtree(tmpdir)
+            raise NoChecksumException(
+                "Package tarball failed checksum verification.\n"
+                "It cannot be installed.")
+
+        new_relative_prefix = str(os.path.relpath(spec.prefix,
+                                                  spack.store.layout.root))
+        # if the original relative prefix is in the spec file use it
+        old_relative_prefix = buildinfo.get('relative_prefix',
+                                            new_relative_prefix)
+        # if the original relative prefix and new relative prefix differ the
+        # directory layout has changed and the  buildcache cannot be installed
+        if old_relative_prefix != new_relative_prefix:
+            shutil.rmtree(tmpdir)
+            msg = "Package tarball was created from an install "
+            msg += "prefix with a different directory layout.\n"
+            msg += "It cannot be relocated."
+            raise NewLayoutException(msg)
+
+        # extract the tarball straight into the install prefix. The base
+        # of the install prefix is used when creating the tarball, so the
+        # pathnames are the same now that the directory layout is confirmed
+        try:
+            with closing(spackfile.extractfile(tarfile_name)) as tfile:
+                _extract_prefix_tarball(tfile, spec.prefix, compression)
+        except Exception:
+            shutil.rmtree(spec.prefix, ignore_errors=True)
+            shutil.rmtree(tmpdir)
+            raise
 
     # cleanup
-    os.remove(tarfile_path)
     os.remove(specfile_path)
 
     try:
@@ -688,31 +1188,67 @@ def extract_tarball(spec, filename, allow_root=False, unsigned=False,
 _cached_specs = set()
 
 
+def _read_specs(contents):
+    """Read the specs from the contents of spec.yaml files and cache them"""
+    global _cached_specs
+    for content in contents:
+        # read the spec from the build cache file. All specs
+        # in build caches are concrete (as they are built) so
+        # we need to mark this spec concrete on read-in.
+        spec = Spec.from_yaml(content)
+        spec._mark_concrete()
+        _cached_specs.add(spec)
+
+    return _cached_specs
+
+
+def _download_spec_file(args):
+    """Download a spec.yaml file to the local cache, unless it is there.
+
+    Returns:
+        (str or None): local path of the file, or None if it can't be read
+    """
+    link, cache_dir, force = args
+    save_filename = os.path.join(cache_dir, os.path.basename(link))
+    if force and os.path.exists(save_filename):
+        os.remove(save_filename)
+
+    if not os.path.exists(save_filename):
+        content = _read_url(link)
+        if content is None:
+            return None
+
+        tmp_filename = '%s.%s.tmp' % (save_filename, os.getpid())
+        with open(tmp_filename, 'wb') as f:
+            f.write(content)
+        os.rename(tmp_filename, save_filename)
+
+    return save_filename
+
+
 def try_download_specs(urls=None, force=False):
     '''
     Try to download the urls and cache them
+
+    The files are downloaded concurrently.
     '''
-    global _cached_specs
     if urls is None:
         return {}
-    for link in urls:
-        with Stage(link, name="build_cache", keep=True) as stage:
-            if force and os.path.exists(stage.save_filename):
-                os.remove(stage.save_filename)
-            if not os.path.exists(stage.save_filename):
-                try:
-                    stage.fetch()
-                except fs.FetchError:
-                    continue
-            with open(stage.save_filename, 'r') as f:
-                # read the spec from the build cache file. All specs
-                # in build caches are concrete (as they are built) so
-                # we need to mark this spec concrete on read-in.
-                spec = Spec.from_yaml(f)
-                spec._mark_concrete()
-                _cached_specs.add(spec)
 
-    return _cached_specs
+    cache_dir = os.path.join(spack.stage.get_stage_root(), 'build_cache')
+    mkdirp(cache_dir)
+
+    paths = _map_downloads(
+        _download_spec_file, ((link, cache_dir, force) for link in urls))
+
+    contents = []
+    for path in paths:
+        if path is None:
+            continue
+        with open(path, 'r') as f:
+            contents.append(f.read())
+
+    return _read_specs(contents)
 
 
 def get_spec(spec=None, force=False):
@@ -786,6 +1322,15 @@ def get_specs(force=False, allarch=False):
         else:
             tty.msg("Finding buildcaches at %s" %
                     url_util.format(fetch_url_build_cache))
+
+            # Read all the specs at once from the index if there is one
+            index = read_package_index(fetch_url_build_cache)
+            if index is not None:
+                _read_specs(entry['spec'] for spec_file, entry
+                            in sorted(index.items())
+                            if arch_re.search(spec_file))
+                continue
+
             p, links = web_util.spider(
                 url_util.join(fetch_url_build_cache, 'index.html'))
             for link in links:
@@ -757,7 +757,7 @@ def modifications_from_dependencies(spec, context):
     return env
 
 
-def fork(pkg, function, dirty, fake):
+def fork(pkg, function, dirty, fake, jobs=None):
     """Fork a child process to do part of a spack build.
 
     Args:
@@ -769,6 +769,9 @@ def fork(pkg, function, dirty, fake):
         dirty (bool): If True, do NOT clean the environment before
             building.
         fake (bool): If True, skip package setup b/c it's not a real build
+        jobs (int or None): number of parallel build jobs to use in the
+            child process instead of ``config:build_jobs`` (or None to use
+            the configured value)
 
     Usage::
 
@@ -784,6 +787,36 @@ def child_fun():
     If something goes wrong, the child process catches the error and
     passes it to the parent wrapped in a ChildError.  The parent is
     expected to handle (or re-raise) the ChildError.
+
+    The steps of ``fork`` are also available separately, so the child can
+    be forked by one thread and waited for by another: ``start_fork``,
+    then ``wait_fork``, then ``fork_result``.
+    """
+    return fork_result(pkg, wait_fork(
+        start_fork(pkg, function, dirty, fake, jobs=jobs)))
+
+
+def start_fork(pkg, function, dirty, fake, jobs=None):
+    """Fork a child process to do part of a spack build, like ``fork``,
+    without waiting for it to finish.
+
+    Forking only from the main thread prevents the child from inheriting
+    locks held by other threads, e.g., on the standard streams.
+
+    Args:
+        pkg (PackageBase): package whose environment we should set up the
+            forked process for.
+        function (callable): argless function to run in the child
+            process.
+        dirty (bool): If True, do NOT clean the environment before
+            building.
+        fake (bool): If True, skip package setup b/c it's not a real build
+        jobs (int or None): number of parallel build jobs to use in the
+            child process instead of ``config:build_jobs``
+
+    Returns:
+        (tuple): the child process and the connection its result is
+            received from, to be passed to ``wait_fork``
     """
 
     def child_process(child_pipe, input_stream):
@@ -796,6 +829,11 @@ def child_process(child_pipe, input_stream):
             sys.stdin = input_stream
 
         try:
+            # The override only affects this (child) process, so concurrent
+            # builds can each be given their share of the available cores.
+            if jobs is not None:
+                spack.config.set('config:build_jobs', jobs,
+                                 scope='command_line')
             if not fake:
                 setup_package(pkg, dirty=dirty)
             return_value = function()
@@ -834,7 +872,7 @@ def child_process(child_pipe, input_stream):
         finally:
             child_pipe.close()
 
-    parent_pipe, child_pipe = multiprocessing.Pipe()
+    parent_pipe, child_pipe = multiprocessing.Pipe(duplex=False)
     input_stream = None
     try:
         # Forward sys.stdin when appropriate, to allow toggling verbosity
@@ -854,19 +892,61 @@ def child_process(child_pipe, input_stream):
         if input_stream is not None:
             input_stream.close()
 
-    child_result = parent_pipe.recv()
+        # Only the child writes to the pipe, so that reading it fails once
+        # the child is gone
+        child_pipe.close()
+
+    return p, parent_pipe
+
+
+def wait_fork(child):
+    """Wait for a child process started by ``start_fork`` to finish.
+
+    This does not print anything, so it can be called from any thread.
+
+    Args:
+        child (tuple): the child process and its connection, as returned
+            by ``start_fork``
+
+    Returns:
+        the result of the child, to be passed to ``fork_result``
+    """
+    p, parent_pipe = child
+    try:
+        # Poll so that a child killed before sending its result is noticed,
+        # even if processes it started keep its end of the pipe open
+        while not parent_pipe.poll(0.5) and p.is_alive():
+            pass
+        if not parent_pipe.poll():
+            raise EOFError
+        child_result = parent_pipe.recv()
+    except EOFError:
+        child_result = InstallError(
+            'The build process exited with status {0}'.format(p.exitcode))
+    finally:
+        parent_pipe.close()
     p.join()
+    return child_result
 
-    # let the caller know which package went wrong.
+
+def fork_result(pkg, child_result):
+    """Return the result of a child process waited for by ``wait_fork``,
+    or raise its error, like ``fork``.
+
+    Args:
+        pkg (PackageBase): package the child process was forked for
+        child_result: the result returned by ``wait_fork``
+    """
     if isinstance(child_result, InstallError):
+        # let the caller know which package went wrong.
         child_result.pkg = pkg
 
-    # If the child process raised an error, print its output here rather
-    # than waiting until the call to SpackError.die() in main(). This
-    # allows exception handling output to be logged from within Spack.
-    # see spack.main.SpackCommand.
-    if isinstance(child_result, ChildError):
-        child_result.print_context()
+        # If the child process raised an error, print its output here rather
+        # than waiting until the call to SpackError.die() in main(). This
+        # allows exception handling output to be logged from within Spack.
+        # see spack.main.SpackCommand.
+        if isinstance(child_result, ChildError):
+            child_result.print_context()
         raise child_result
 
     return child_result
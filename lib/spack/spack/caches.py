@@ -4,7 +4,9 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 """Caches used by Spack to store data"""
+import hashlib
 import os
+import sys
 
 import llnl.util.lang
 from llnl.util.filesystem import mkdirp
@@ -12,9 +14,10 @@
 import spack.error
 import spack.paths
 import spack.config
-import spack.fetch_strategy
 import spack.util.file_cache
+import spack.util.lock
 import spack.util.path
+from spack.util.crypto import prefix_bits, bit_length
 
 
 def _misc_cache():
@@ -41,6 +44,7 @@ def _fetch_cache():
     This prevents Spack from repeatedly fetch the same files when
     building the same package different ways or multiple times.
     """
+    import spack.fetch_strategy
     path = spack.config.get('config:source_cache')
     if not path:
         path = os.path.join(spack.paths.var_path, "cache")
@@ -53,6 +57,28 @@ class MirrorCache(object):
     def __init__(self, root):
         self.root = os.path.abspath(root)
 
+        # Locks of the archives, so that processes adding specs which
+        # share an archive store it only once
+        self._locks = {}
+
+    def lock(self, relative_dest):
+        """Lock to be held while checking for, fetching and storing the
+        archive at relative_dest in our mirror cache.
+
+        Like stage locks, these are byte ranges of the lock file in the
+        stage root, so that the mirror only contains archives.
+        """
+        import spack.stage
+        if relative_dest not in self._locks:
+            dst = os.path.join(self.root, relative_dest)
+            sha1 = hashlib.sha1(dst.encode('utf-8')).digest()
+            lock_id = prefix_bits(sha1, bit_length(sys.maxsize))
+            lock_path = os.path.join(
+                spack.stage.get_stage_root(), '.lock')
+            self._locks[relative_dest] = spack.util.lock.Lock(
+                lock_path, lock_id, 1, desc=relative_dest)
+        return spack.util.lock.WriteTransaction(self._locks[relative_dest])
+
     def store(self, fetcher, relative_dest):
         """Fetch and relocate the fetcher's target into our mirror cache."""
 
@@ -60,7 +86,13 @@ def store(self, fetcher, relative_dest):
         # normally be cached (e.g. the current tip of an hg/git branch)
         dst = os.path.join(self.root, relative_dest)
         mkdirp(os.path.dirname(dst))
-        fetcher.archive(dst)
+
+        # Archive to a temporary file first so that archives in the mirror
+        # are always complete, even if mirror creation was interrupted.
+        tmp = os.path.join(
+            os.path.dirname(dst), '.tmp-' + os.path.basename(dst))
+        fetcher.archive(tmp)
+        os.rename(tmp, dst)
 
     def symlink(self, mirror_ref):
         """Symlink a human readible path in our mirror to the actual
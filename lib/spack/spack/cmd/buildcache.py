@@ -3,9 +3,12 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+from __future__ import print_function
+
 import os
 import shutil
 import sys
+import time
 
 import llnl.util.tty as tty
 import spack.binary_distribution as bindist
@@ -62,6 +65,10 @@ def setup_parser(subparser):
                         help='Create buildcache entry for spec from yaml file')
     create.add_argument('--no-deps', action='store_true', default='false',
                         help='Create buildcache entry wo/ dependencies')
+    create.add_argument('-c', '--compression', default=None,
+                        choices=sorted(bindist.compression_codecs),
+                        help="codec compressing the tarballs (default is "
+                             "config:buildcache_compression)")
     arguments.add_common_arguments(create, ['specs'])
     create.set_defaults(func=createtarball)
 
@@ -210,6 +217,20 @@ def setup_parser(subparser):
         '-d', '--mirror-url', default=None, help='Destination mirror url')
     update_index.set_defaults(func=buildcache_update_index)
 
+    # Compare the compression codecs on installed packages
+    benchmark = subparsers.add_parser(
+        'benchmark', help=buildcache_benchmark.__doc__)
+    benchmark.add_argument(
+        '-c', '--compression', action='append',
+        choices=sorted(bindist.compression_codecs),
+        help='codec to benchmark (may be repeated, default is all of them)')
+    benchmark.add_argument(
+        '-t', '--file-types', action='store_true',
+        help='compare the detection of the types of files in Python and '
+             'with the file program, instead of the compression codecs')
+    arguments.add_common_arguments(benchmark, ['installed_specs'])
+    benchmark.set_defaults(func=buildcache_benchmark)
+
 
 def find_matching_specs(pkgs, allow_multiple_matches=False, env=None):
     """Returns a list of specs matching the not necessarily
@@ -300,7 +321,8 @@ def match_downloaded_specs(pkgs, allow_multiple_matches=False, force=False):
 
 
 def _createtarball(env, spec_yaml, packages, directory, key, no_deps, force,
-                   rel, unsigned, allow_root, no_rebuild_index):
+                   rel, unsigned, allow_root, no_rebuild_index,
+                   compression=None):
     if spec_yaml:
         packages = set()
         with open(spec_yaml, 'r') as fd:
@@ -364,7 +386,7 @@ def _createtarball(env, spec_yaml, packages, directory, key, no_deps, force,
         try:
             bindist.build_tarball(spec, outdir, force, rel,
                                   unsigned, allow_root, signkey,
-                                  not no_rebuild_index)
+                                  not no_rebuild_index, compression)
         except Exception as e:
             tty.warn('%s' % e)
             pass
@@ -378,7 +400,8 @@ def createtarball(args):
 
     _createtarball(env, args.spec_yaml, args.specs, args.directory,
                    args.key, args.no_deps, args.force, args.rel, args.unsigned,
-                   args.allow_root, args.no_rebuild_index)
+                   args.allow_root, args.no_rebuild_index,
+                   args.compression)
 
 
 def installtarball(args):
@@ -682,6 +705,91 @@ def buildcache_update_index(args):
         url_util.join(outdir, bindist.build_cache_relative_path()))
 
 
+def _benchmark_file_types(specs):
+    """Time the detection of the types of the files of installed specs in
+    Python and with the file program, which were used to tell what needs
+    to be relocated."""
+    row = '{0:<40} {1:>8} {2:>12} {3:>12} {4:>12}'
+    print(row.format('package', 'files', 'python (s)', 'file (s)',
+                     'mismatches'))
+    for spec in specs:
+        files = [os.path.join(root, f)
+                 for root, _, names in os.walk(spec.prefix) for f in names]
+
+        spack.relocate.mime_type.cache.clear()
+        start = time.time()
+        types = spack.relocate.mime_types(files)
+        python_time = time.time() - start
+
+        start = time.time()
+        file_types = [spack.relocate.file_command_mime_type(f) for f in files]
+        file_time = time.time() - start
+
+        # files that would be relocated differently
+        mismatches = 0
+        for f, file_type in zip(files, file_types):
+            for needs_relocation in (spack.relocate.needs_binary_relocation,
+                                     spack.relocate.needs_text_relocation):
+                if (needs_relocation(*types[f]) !=
+                        needs_relocation(*file_type)):
+                    tty.debug('{0}: {1} instead of {2}'.format(
+                        f, '/'.join(types[f]), '/'.join(file_type)))
+                    mismatches += 1
+                    break
+
+        print(row.format(spec.cformat('{name}{@version}{/hash:7}'),
+                         len(files), '%.3f' % python_time,
+                         '%.3f' % file_time, mismatches))
+
+
+def buildcache_benchmark(args):
+    """compare the compression codecs on installed packages"""
+    if not args.specs:
+        tty.die("buildcache benchmark requires at least one installed "
+                "package spec argument")
+    specs = find_matching_specs(args.specs, allow_multiple_matches=True)
+    if args.file_types:
+        _benchmark_file_types(specs)
+        return
+
+    codecs = args.compression or sorted(bindist.compression_codecs)
+
+    row = '{0:<6} {1:<16} {2:>12} {3:>12} {4:>8} {5:>14} {6:>14}'
+    for spec in specs:
+        print(spec.cformat('{name}{@version}{/hash:7}'))
+        print(row.format('codec', 'program', 'size (MB)', 'archive (MB)',
+                         'ratio', 'compress MB/s', 'decompress MB/s'))
+        for codec in codecs:
+            # compare Python with the parallel program, if there is one
+            programs = [('python', False)]
+            command = bindist.compression_program(codec)
+            if command:
+                programs.append((' '.join(
+                    [os.path.basename(command[0])] + command[1:]), True))
+
+            for program, parallel in programs:
+                try:
+                    result = bindist.benchmark_compression(
+                        spec.prefix, codec, parallel)
+                except Exception as e:
+                    tty.warn('Cannot benchmark {0} with {1}: {2}'.format(
+                        codec, program, str(e)))
+                    continue
+
+                megabytes = result['size'] / 1e6
+                print(row.format(
+                    codec, program,
+                    '%.1f' % megabytes,
+                    '%.1f' % (result['compressed_size'] / 1e6),
+                    '%.2f' % (float(result['size']) /
+                              result['compressed_size']),
+                    '%.1f' % (megabytes /
+                              max(result['compress_time'], 1e-6)),
+                    '%.1f' % (megabytes /
+                              max(result['decompress_time'], 1e-6))))
+        print()
+
+
 def buildcache(parser, args):
     if args.func:
         args.func(args)
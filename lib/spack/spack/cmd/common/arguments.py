@@ -275,3 +275,11 @@ def no_checksum():
     return Args(
         '-n', '--no-checksum', action='store_true', default=False,
         help="do not use checksums to verify downloaded files (unsafe)")
+
+
+@arg
+def no_concretization_cache():
+    return Args(
+        '--no-cache', action='store_true', default=False,
+        dest='no_concretization_cache',
+        help="concretize from scratch instead of reusing cached results")
@@ -3,6 +3,8 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import spack.cmd.common.arguments as arguments
+import spack.config
 import spack.environment as ev
 
 description = 'concretize an environment and write a lockfile'
@@ -14,11 +16,22 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-f', '--force', action='store_true',
         help="Re-concretize even if already concretized.")
+    subparser.add_argument(
+        '-j', '--jobs', type=int, default=None, metavar='N',
+        help="concretize up to N user specs at the same time, when they"
+             " are concretized separately (default: number of cores)")
+    arguments.add_common_arguments(subparser, ['no_concretization_cache'])
 
 
 def concretize(parser, args):
     env = ev.get_env(args, 'concretize', required=True)
+
+    if args.no_concretization_cache:
+        spack.config.set(
+            'config:concretization_cache', False, scope='command_line')
+
     with env.write_transaction():
-        concretized_specs = env.concretize(force=args.force)
+        concretized_specs = env.concretize(
+            force=args.force, jobs=args.jobs)
         ev.display_specs(concretized_specs)
         env.write()
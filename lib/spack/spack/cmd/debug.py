@@ -3,16 +3,32 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+from __future__ import absolute_import, print_function
+
+import multiprocessing
 import os
 import re
+import resource
+import sys
+import time
 from datetime import datetime
 from glob import glob
 
+import llnl.util.lock
 import llnl.util.tty as tty
 from llnl.util.filesystem import working_dir
 
+import spack.cmd
+import spack.cmd.common.arguments as arguments
+import spack.environment as ev
+import spack.hash_types as ht
 import spack.paths
-from spack.util.executable import which
+import spack.repo
+import spack.spec
+import spack.util.lock as lk
+import spack.util.spack_yaml as syaml
+from spack.util.string import plural
+from spack.util.executable import Executable, which
 
 description = "debugging commands for troubleshooting Spack"
 section = "developer"
@@ -24,6 +40,41 @@ def setup_parser(subparser):
     sp.add_parser('create-db-tarball',
                   help="create a tarball of Spack's installation metadata")
 
+    hash_parser = sp.add_parser(
+        'hash-benchmark', help=hash_benchmark.__doc__)
+    hash_parser.add_argument(
+        '-n', '--number', type=int, default=None, metavar='N',
+        help="only hash the first N packages of the repositories")
+    arguments.add_common_arguments(hash_parser, ['specs'])
+
+    copy_parser = sp.add_parser(
+        'copy-benchmark', help=copy_benchmark.__doc__)
+    copy_parser.add_argument(
+        '-c', '--copies', type=int, default=100, metavar='N',
+        help="number of copies of each spec to keep in memory")
+    arguments.add_common_arguments(copy_parser, ['specs'])
+
+    import_parser = sp.add_parser(
+        'import-time', help=import_time.__doc__)
+    import_parser.add_argument(
+        '-n', '--runs', type=int, default=3, metavar='N',
+        help="run each command N times, and report the fastest run")
+    import_parser.add_argument(
+        '-t', '--top', type=int, default=3, metavar='N',
+        help="show the N modules that take longest to import")
+    import_parser.add_argument(
+        'commands', nargs='*', metavar='COMMAND',
+        help="commands to measure (default: all of them)")
+
+    lock_parser = sp.add_parser(
+        'lock-report', help=lock_report.__doc__)
+    lock_parser.add_argument(
+        '-t', '--top', type=int, default=10, metavar='N',
+        help="show the N locks waited for longest")
+    lock_parser.add_argument(
+        '--clear', action='store_true',
+        help="remove the saved statistics of locks")
+
 
 def _debug_tarball_suffix():
     now = datetime.now()
@@ -67,6 +118,8 @@ def create_db_tarball(args):
     wd = os.path.dirname(str(spack.store.root))
     with working_dir(wd):
         files = [spack.store.db._index_path]
+        if os.path.exists(spack.store.db._journal_path):
+            files.append(spack.store.db._journal_path)
         files += glob('%s/*/*/*/.spack/spec.yaml' % base)
         files = [os.path.relpath(f) for f in files]
 
@@ -78,6 +131,227 @@ def create_db_tarball(args):
     tty.msg('Created %s' % tarball_name)
 
 
+def _benchmark_specs(args):
+    """Concretized specs given on the command line or, by default, the
+    normalized specs of the packages in the repositories."""
+    if args.specs:
+        return spack.cmd.parse_specs(args.specs, concretize=True)
+
+    specs = []
+    for name in spack.repo.path.all_package_names()[:args.number]:
+        spec = spack.spec.Spec(name)
+        try:
+            spec.normalize()
+        except Exception as e:
+            tty.debug('Skipping {0}: {1}'.format(name, str(e)))
+            continue
+        specs.append(spec)
+    return specs
+
+
+def hash_benchmark(args):
+    """compare the YAML and the flow encodings used to hash specs"""
+    specs = _benchmark_specs(args)
+
+    start = time.time()
+    for spec in specs:
+        spec.dag_hash()
+        spec.build_hash()
+    hash_time = time.time() - start
+
+    node_dicts = [
+        node.to_node_dict(hash=hash)
+        for spec in specs
+        for node in spec.traverse()
+        for hash in (ht.dag_hash, ht.build_hash)]
+
+    start = time.time()
+    yaml_texts = [syaml.dump(d, default_flow_style=True) for d in node_dicts]
+    yaml_time = time.time() - start
+
+    start = time.time()
+    flow_texts = [syaml.dump_flow(d) for d in node_dicts]
+    flow_time = time.time() - start
+
+    mismatches = sum(1 for a, b in zip(yaml_texts, flow_texts) if a != b)
+
+    print('Hashed {0} specs in {1:.3f}s'.format(len(specs), hash_time))
+    row = '{0:<8} {1:>10} {2:>12} {3:>14}'
+    print(row.format('encoder', 'nodes', 'time (s)', 'nodes/s'))
+    for encoder, encode_time in (('yaml', yaml_time), ('flow', flow_time)):
+        print(row.format(encoder, len(node_dicts), '%.3f' % encode_time,
+                         '%.0f' % (len(node_dicts) / max(encode_time, 1e-6))))
+    print('speedup: {0:.1f}x, mismatches: {1}'.format(
+        yaml_time / max(flow_time, 1e-6), mismatches))
+
+
+def _peak_rss():
+    """Peak resident set size of this process, in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        maxrss /= 1024
+    return maxrss / 1024.0
+
+
+def _copy_specs(specs, copies, share, conn):
+    """Copy specs in a child process, and send back the time it took
+    and how much the peak RSS grew."""
+    spack.spec.share_concrete_nodes = share
+    rss = _peak_rss()
+    start = time.time()
+    kept = [spec.copy() for _ in range(copies) for spec in specs]
+    copy_time = time.time() - start
+    conn.send((copy_time, _peak_rss() - rss, len(kept)))
+    conn.close()
+
+
+def copy_benchmark(args):
+    """compare copies of concrete specs with and without shared nodes"""
+    if args.specs:
+        specs = spack.cmd.parse_specs(args.specs, concretize=True)
+    else:
+        env = ev.get_env(args, 'debug copy-benchmark', required=True)
+        specs = [spec for _, spec in env.concretized_specs()]
+
+    nodes = sum(len(list(spec.traverse())) for spec in specs)
+    print('Copied {0} specs with {1} nodes {2} times'.format(
+        len(specs), nodes, args.copies))
+
+    # Each mode runs in its own process, so that its peak RSS is not
+    # hidden by the memory used by the other one
+    results = {}
+    for mode, share in (('copy', False), ('share', True)):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        p = multiprocessing.Process(
+            target=_copy_specs, args=(specs, args.copies, share, child_conn))
+        p.start()
+        child_conn.close()
+        results[mode] = parent_conn.recv()
+        p.join()
+
+    row = '{0:<8} {1:>10} {2:>12} {3:>14}'
+    print(row.format('mode', 'copies', 'time (s)', 'peak RSS (MB)'))
+    for mode in ('copy', 'share'):
+        copy_time, rss, copied = results[mode]
+        print(row.format(mode, copied, '%.3f' % copy_time, '%.1f' % rss))
+
+    print('speedup: {0:.1f}x, memory saved: {1:.1f} MB'.format(
+        results['copy'][0] / max(results['share'][0], 1e-6),
+        results['copy'][1] - results['share'][1]))
+
+
+def _import_times(argv):
+    """Run ``spack <argv>`` in a new interpreter, and return its wall time
+    with the import time of each module, as reported by ``-X importtime``."""
+    python = Executable(sys.executable)
+    if sys.version_info >= (3, 7):
+        python.add_default_arg('-X')
+        python.add_default_arg('importtime')
+
+    start = time.time()
+    err = python(spack.paths.spack_script, *argv,
+                 output=os.devnull, error=str, fail_on_error=False)
+    wall_time = time.time() - start
+
+    # Lines look like "import time: <self us> | <cumulative us> | <module>"
+    modules = []
+    for line in err.splitlines():
+        match = re.match(r'import time:\s*(\d+) \|\s*\d+ \|\s*(\S+)', line)
+        if match:
+            modules.append((match.group(2), int(match.group(1)) / 1e6))
+    return wall_time, modules
+
+
+def import_time(args):
+    """report how long commands take to start, and what they import"""
+    commands = args.commands or spack.cmd.all_commands()
+    unknown = [c for c in commands if c not in spack.cmd.all_commands()]
+    if unknown:
+        tty.die('Unknown commands: {0}'.format(' '.join(unknown)))
+    if sys.version_info < (3, 7):
+        tty.warn('Python {0}.{1} cannot report the time spent importing '
+                 'modules, only the wall time is measured'.format(
+                     *sys.version_info[:2]))
+
+    # Printing the shell variables is what every shell that sources
+    # setup-env.sh runs, and the least any command has to import
+    runs = [('(startup)', ['--print-shell-vars', 'sh'])]
+    runs += [(command, [command, '-h']) for command in commands]
+
+    row = '{0:<20} {1:>9} {2:>12} {3:>8}  {4}'
+    print(row.format('command', 'time (s)', 'imports (s)', 'modules',
+                     'slowest imports'))
+    for name, argv in runs:
+        wall_time, modules = min(
+            (_import_times(argv) for _ in range(max(args.runs, 1))),
+            key=lambda result: result[0])
+        slowest = sorted(modules, key=lambda m: m[1], reverse=True)
+        print(row.format(
+            name, '%.3f' % wall_time,
+            '%.3f' % sum(t for _, t in modules) if modules else '-',
+            len(modules) if modules else '-',
+            ', '.join('{0} ({1:.0f} ms)'.format(m, t * 1000)
+                      for m, t in slowest[:args.top])).rstrip())
+
+
+def _bin_labels(bins, unit):
+    labels = ['<={0}'.format(unit(bound)) for bound in bins]
+    return labels + ['>{0}'.format(unit(bins[-1]))]
+
+
+def _seconds(t):
+    return '{0:g}ms'.format(t * 1000) if t < 1 else '{0:g}s'.format(t)
+
+
+def lock_report(args):
+    """report the locks that Spack commands waited for longest"""
+    if args.clear:
+        lk.clear_statistics()
+        tty.msg('Removed the saved statistics of locks')
+        return
+
+    statistics, processes = lk.saved_statistics()
+    if not statistics:
+        tty.msg('No statistics of locks were saved',
+                'Set config:lock_statistics to true to save them')
+        return
+
+    statistics.sort(key=lambda s: s['total_wait'], reverse=True)
+    statistics = statistics[:args.top]
+    names = []
+    for s in statistics:
+        name = '{0}[{1}:{2}]'.format(s['path'], s['start'], s['length'])
+        names.append('{0}: {1}'.format(s['desc'], name) if s['desc'] else name)
+
+    tty.msg('Locks waited for longest by {0}'.format(
+        plural(processes, 'Spack process', 'Spack processes')))
+    row = '{0:>9} {1:>9} {2:>9} {3:>9} {4:<6} {5}'
+    print(row.format('wait (s)', 'max (s)', 'acquired', 'timeouts', 'type',
+                     'lock'))
+    for s, name in zip(statistics, names):
+        print(row.format('%.3f' % s['total_wait'], '%.3f' % s['max_wait'],
+                         s['acquired'], s['timeouts'], s['type'], name))
+
+    histograms = [
+        ('Wait times', 'wait_histogram',
+         _bin_labels(llnl.util.lock.wait_time_bins, _seconds)),
+        ('Attempts', 'attempt_histogram',
+         _bin_labels(llnl.util.lock.attempt_bins, str))]
+    for title, field, labels in histograms:
+        print()
+        tty.msg(title)
+        row = ' '.join(['{%d:>8}' % i for i in range(len(labels))])
+        print(row.format(*labels) + ' type   lock')
+        for s, name in zip(statistics, names):
+            print(row.format(*s[field]) +
+                  ' {0:<6} {1}'.format(s['type'], name))
+
+
 def debug(parser, args):
-    action = {'create-db-tarball': create_db_tarball}
+    action = {'create-db-tarball': create_db_tarball,
+              'hash-benchmark': hash_benchmark,
+              'copy-benchmark': copy_benchmark,
+              'import-time': import_time,
+              'lock-report': lock_report}
     action[args.debug_command](args)
@@ -14,8 +14,6 @@
 
 import spack.config
 import spack.schema.env
-import spack.cmd.install
-import spack.cmd.uninstall
 import spack.cmd.modules
 import spack.cmd.common.arguments as arguments
 import spack.environment as ev
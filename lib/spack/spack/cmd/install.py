@@ -44,6 +44,9 @@ def update_kwargs_from_args(args, kwargs):
         'explicit': True,  # Always true for install command
         'stop_at': args.until,
         'unsigned': args.unsigned,
+        'concurrent_builds': args.concurrent_builds,
+        'jobs_total': args.jobs_total,
+        'fetch_ahead': args.fetch_ahead,
     })
 
     kwargs.update({
@@ -75,6 +78,15 @@ def setup_parser(subparser):
         '-u', '--until', type=str, dest='until', default=None,
         help="phase to stop after when installing (default None)")
     arguments.add_common_arguments(subparser, ['jobs'])
+    subparser.add_argument(
+        '--concurrent-builds', type=int, default=None, metavar='K',
+        help="build up to K packages at the same time")
+    subparser.add_argument(
+        '--jobs-total', type=int, default=None, metavar='N',
+        help="total number of parallel jobs split between concurrent builds")
+    subparser.add_argument(
+        '--fetch-ahead', type=int, default=None, metavar='N',
+        help="download the sources of up to N packages while others build")
     subparser.add_argument(
         '--overwrite', action='store_true',
         help="reinstall an existing spec, even if it has dependents")
@@ -3,10 +3,13 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import hashlib
+import os
 import sys
 
 import llnl.util.tty as tty
 
+import spack.caches
 import spack.cmd
 import spack.cmd.common.arguments as arguments
 import spack.environment as ev
@@ -45,6 +48,12 @@ def setup_parser(subparser):
     )
 
 
+def _cache_name(specs):
+    """Name of the cached environment modifications loading ``specs``."""
+    hashes = ' '.join(spec.dag_hash() for spec in specs)
+    return hashlib.sha1(hashes.encode('utf-8')).hexdigest()
+
+
 def load(parser, args):
     env = ev.get_env(args, 'load')
     specs = [spack.cmd.disambiguate_spec(spec, env)
@@ -71,10 +80,24 @@ def load(parser, args):
                      for dep in
                      spec.traverse(root=include_roots, order='post')]
 
-        env_mod = spack.util.environment.EnvironmentModifications()
-        for spec in specs:
-            env_mod.extend(uenv.environment_modifications_for_spec(spec))
-            env_mod.prepend_path(uenv.spack_loaded_hashes_var, spec.dag_hash())
+        def compute():
+            env_mod = spack.util.environment.EnvironmentModifications()
+            for spec in specs:
+                env_mod.extend(uenv.environment_modifications_for_spec(spec))
+                env_mod.prepend_path(
+                    uenv.spack_loaded_hashes_var, spec.dag_hash())
+            return env_mod
+
+        if uenv.load_cache_dir:
+            key = uenv.modifications_cache_key(
+                specs,
+                [spack.store.db._index_path, spack.store.db._journal_path])
+            path = spack.caches.misc_cache.cache_path(os.path.join(
+                uenv.load_cache_dir, _cache_name(specs) + '.pickle'))
+            env_mod = uenv.cached_environment_modifications(
+                path, key, compute)
+        else:
+            env_mod = compute()
         cmds = env_mod.shell_modifications(args.shell)
 
         sys.stdout.write(cmds)
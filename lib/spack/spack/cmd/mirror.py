@@ -53,6 +53,10 @@ def setup_parser(subparser):
         '-n', '--versions-per-spec',
         help="the number of versions to fetch for each spec, choose 'all' to"
              " retrieve all versions of each package")
+    create_parser.add_argument(
+        '-j', '--jobs', type=int, default=None, metavar='N',
+        help="fetch the archives of up to N packages at the same time"
+             " (default: %d)" % spack.mirror.default_jobs)
     arguments.add_common_arguments(create_parser, ['specs'])
 
     # used to construct scope arguments below
@@ -308,7 +312,8 @@ def mirror_create(args):
     existed = web_util.url_exists(directory)
 
     # Actually do the work to create the mirror
-    present, mirrored, error = spack.mirror.create(directory, mirror_specs)
+    present, mirrored, error = spack.mirror.create(
+        directory, mirror_specs, jobs=args.jobs)
     p, m, e = len(present), len(mirrored), len(error)
 
     verb = "updated" if existed else "created"
@@ -38,8 +38,14 @@ def setup_parser(subparser):
         help='generate modules for packages installed upstream',
         action='store_true'
     )
+    refresh_parser.add_argument(
+        '--incremental',
+        help='regenerate only the module files whose spec, configuration '
+        'or template changed since they were last generated',
+        action='store_true'
+    )
     arguments.add_common_arguments(
-        refresh_parser, ['constraint', 'yes_to_all']
+        refresh_parser, ['constraint', 'yes_to_all', 'jobs']
     )
 
     find_parser = sp.add_parser('find', help='find module files for packages')
@@ -297,14 +303,29 @@ def refresh(module_type, specs, args):
     if os.path.isdir(module_type_root) and args.delete_tree:
         shutil.rmtree(module_type_root, ignore_errors=False)
     filesystem.mkdirp(module_type_root)
-    for x in writers:
-        try:
-            x.write(overwrite=True)
-        except Exception as e:
-            tty.debug(e)
+
+    # Skip the module files whose inputs did not change, if asked to
+    inputs = spack.modules.common.read_module_inputs(module_type_root)
+    new_inputs = dict((x.spec.dag_hash(), x.inputs_hash()) for x in writers)
+    if args.incremental:
+        writers = [x for x in writers
+                   if inputs.get(x.spec.dag_hash()) !=
+                   new_inputs[x.spec.dag_hash()] or
+                   not os.path.exists(x.layout.filename)]
+        msg = '{0} of {1} module files need to be regenerated'
+        tty.msg(msg.format(len(writers), len(new_inputs)))
+
+    errors = spack.modules.common.write_module_files(writers, args.jobs)
+    for x, error in zip(writers, errors):
+        if error is not None:
             msg = 'Could not write module file [{0}]'
             tty.warn(msg.format(x.layout.filename))
-            tty.warn('\t--> {0} <--'.format(str(e)))
+            tty.warn('\t--> {0} <--'.format(error))
+            inputs.pop(x.spec.dag_hash(), None)
+            del new_inputs[x.spec.dag_hash()]
+
+    inputs.update(new_inputs)
+    spack.modules.common.write_module_inputs(module_type_root, inputs)
 
 
 #: Dictionary populated with the list of sub-commands.
@@ -13,6 +13,7 @@
 import spack
 import spack.cmd
 import spack.cmd.common.arguments as arguments
+import spack.config
 import spack.spec
 import spack.store
 import spack.hash_types as ht
@@ -46,7 +47,8 @@ def setup_parser(subparser):
     subparser.add_argument(
         '-t', '--types', action='store_true', default=False,
         help='show dependency types')
-    arguments.add_common_arguments(subparser, ['specs'])
+    arguments.add_common_arguments(
+        subparser, ['no_concretization_cache', 'specs'])
 
 
 @contextlib.contextmanager
@@ -78,6 +80,10 @@ def spec(parser, args):
     if not args.specs:
         tty.die("spack spec requires at least one spec")
 
+    if args.no_concretization_cache:
+        spack.config.set(
+            'config:concretization_cache', False, scope='command_line')
+
     for spec in spack.cmd.parse_specs(args.specs):
         # With -y, just print YAML to output.
         if args.format:
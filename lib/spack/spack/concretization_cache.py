@@ -0,0 +1,168 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Persistent cache of concretized specs.
+
+Concretizing an abstract spec always gives the same concrete spec, as long
+as the configuration, the compilers, the host and the package repositories
+do not change.  This cache stores concrete specs in the ``misc_cache``,
+keyed on the abstract spec and on a fingerprint of all of these, so that
+``Spec.concretize()`` reads them back instead of concretizing the same
+spec over and over.
+"""
+import errno
+import hashlib
+import json
+import os
+import shutil
+
+import llnl.util.tty as tty
+
+import spack
+import spack.architecture
+import spack.caches
+import spack.compilers
+import spack.concretize
+import spack.config
+import spack.hash_types as ht
+import spack.repo
+import spack.spec
+from spack.util.file_cache import CacheError
+
+#: Maximum number of concrete specs in the cache.  The specs that were
+#: used least recently are removed first.
+max_entries = 1000
+
+#: Directory of the cache within the ``misc_cache``
+cache_dir = 'concretized'
+
+#: Configuration sections that the result of concretization depends on
+_sections = ('compilers', 'packages', 'repos')
+
+
+def enabled():
+    """Whether concrete specs are read from and stored in the cache."""
+    return spack.config.get('config:concretization_cache', True)
+
+
+def _digest(data):
+    text = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def fingerprint():
+    """Hash of everything, besides the abstract spec itself, which the
+    result of concretization depends on."""
+    data = dict(
+        (section, spack.config.get(section)) for section in _sections)
+    data['compiler_specs'] = sorted(
+        str(c) for c in spack.compilers.all_compiler_specs(init_config=False))
+    check = spack.concretize.Concretizer.check_for_compiler_existence
+    if check is None:
+        check = not spack.config.get('config:install_missing_compilers', False)
+    data['check_for_compiler_existence'] = check
+    data['repos'] = [(repo.namespace, repo.root, repo.last_mtime())
+                     for repo in spack.repo.path.repos]
+    data['sys_type'] = spack.architecture.sys_type()
+    data['spack'] = spack.spack_version
+    return _digest(data)
+
+
+def key(spec, tests=False):
+    """Key of the concrete spec for the abstract ``spec`` in the cache.
+
+    Args:
+        spec (Spec): abstract spec to be concretized
+        tests (list or bool): packages that need test dependencies, as
+            passed to ``Spec.concretize()``
+
+    Returns:
+        (str or None): the key, or None if the spec cannot be cached
+    """
+    # Specs with concrete nodes depend on more than their text, like the
+    # dependencies they were built with, and the paths of externals loaded
+    # from modules depend on the environment.
+    nodes = list(spec.traverse())
+    if spec._dependents or any(s.concrete or s.external_module
+                               for s in nodes):
+        return None
+
+    if isinstance(tests, (list, tuple, set)):
+        tests = sorted(tests)
+    else:
+        tests = bool(tests)
+
+    data = [[s.format(), s.namespace, s.external_path,
+             sorted((d.spec.name, sorted(d.deptypes))
+                    for d in s._dependencies.values())]
+            for s in nodes]
+    return _digest([data, tests, fingerprint()])
+
+
+def _cache_file(key):
+    return os.path.join(cache_dir, key + '.json')
+
+
+def get(key):
+    """The concrete spec stored under ``key``, or None if there is none."""
+    cache = spack.caches.misc_cache
+    filename = _cache_file(key)
+    try:
+        if not cache.init_entry(filename):
+            return None
+
+        with cache.read_transaction(filename) as f:
+            spec = spack.spec.Spec.from_json(f)
+    except Exception as e:
+        tty.debug('Ignoring cached concrete spec {0}: {1}'.format(
+            filename, str(e)))
+        return None
+
+    # Mark the entry as recently used, unless another process removed it
+    try:
+        os.utime(cache.cache_path(filename), None)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    return spec
+
+
+def put(key, spec):
+    """Store the concrete ``spec`` under ``key``, and remove the least
+    recently used entries if there are more than ``max_entries``."""
+    cache = spack.caches.misc_cache
+    filename = _cache_file(key)
+    try:
+        cache.init_entry(filename)
+        with cache.write_transaction(filename) as (old, new):
+            spec.to_json(new, hash=ht.build_hash)
+    except (IOError, OSError, CacheError) as e:
+        tty.debug('Cannot cache concrete spec {0}: {1}'.format(
+            filename, str(e)))
+        return
+
+    root = cache.cache_path(cache_dir)
+    entries = [f for f in os.listdir(root) if f.endswith('.json')]
+    if len(entries) <= max_entries:
+        return
+
+    # Several processes may store specs and remove the same entries at once
+    def mtime(f):
+        try:
+            return os.path.getmtime(os.path.join(root, f))
+        except OSError:
+            return 0
+
+    entries.sort(key=mtime)
+    for f in entries[:len(entries) - max_entries]:
+        try:
+            cache.remove(os.path.join(cache_dir, f))
+        except OSError:
+            pass
+
+
+def clear():
+    """Remove all the concrete specs from the cache."""
+    shutil.rmtree(spack.caches.misc_cache.cache_path(cache_dir), True)
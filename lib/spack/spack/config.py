@@ -31,12 +31,16 @@
 """
 
 import copy
+import hashlib
+import json
 import os
 import re
 import sys
+import time
 import multiprocessing
 from contextlib import contextmanager
 from six import iteritems
+from six.moves import cPickle
 from ordereddict_backport import OrderedDict
 
 import ruamel.yaml as yaml
@@ -46,8 +50,8 @@
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp
 
+import spack
 import spack.paths
-import spack.architecture
 import spack.schema
 import spack.schema.compilers
 import spack.schema.mirrors
@@ -100,11 +104,23 @@
         'verify_ssl': True,
         'checksum': True,
         'dirty': False,
+        'blocking_locks': False,
+        'lock_statistics': False,
         'build_jobs': min(16, multiprocessing.cpu_count()),
+        'concurrent_builds': 1,
+        'fetch_ahead': 0,
+        'concretization_cache': True,
+        'buildcache_compression': 'bz2',
         'build_stage': '$tempdir/spack-stage',
     }
 }
 
+#: Directory where configuration files are cached after they are parsed and
+#: validated, so that unchanged files are not parsed again.  If ``None``,
+#: files are always parsed.
+parsed_cache_path = os.path.join(
+    spack.paths.user_config_path, 'cache', 'config')
+
 #: metavar to use for commands that accept scopes
 #: this is shorter and more readable than listing all choices
 scopes_metavar = '{defaults,system,site,user}[/PLATFORM]'
@@ -132,17 +148,25 @@ def __init__(self, name, path):
         self.name = name           # scope name.
         self.path = path           # path to directory containing configs.
         self.sections = syaml.syaml_dict()  # sections read from config files.
+        self._paths = {}           # paths of the files of the sections.
+        self._stamps = {}          # stamps of the files of the sections.
 
     def get_section_filename(self, section):
         _validate_section_name(section)
         return os.path.join(self.path, "%s.yaml" % section)
 
     def get_section(self, section):
-        if section not in self.sections:
-            path   = self.get_section_filename(section)
+        if section not in self._paths:
+            self._paths[section] = self.get_section_filename(section)
+        path  = self._paths[section]
+        stamp = _file_stamp(path)
+        if (section not in self.sections or
+                self._stamps.get(section, stamp) != stamp):
+            # Read the file the first time, and again when it changed
             schema = section_schemas[section]
             data   = _read_config_file(path, schema)
             self.sections[section] = data
+            self._stamps[section] = stamp
         return self.sections[section]
 
     def write_section(self, section):
@@ -155,6 +179,7 @@ def write_section(self, section):
             with open(filename, 'w') as f:
                 validate(data, section_schemas[section])
                 syaml.dump_config(data, stream=f, default_flow_style=False)
+            self._stamps[section] = _file_stamp(filename)
         except (yaml.YAMLError, IOError) as e:
             raise ConfigFileError(
                 "Error writing to config file: '%s'" % str(e))
@@ -162,6 +187,7 @@ def write_section(self, section):
     def clear(self):
         """Empty cached config information."""
         self.sections = syaml.syaml_dict()
+        self._stamps = {}
 
     def __repr__(self):
         return '<ConfigScope: %s: %s>' % (self.name, self.path)
@@ -183,6 +209,7 @@ def __init__(self, name, path, schema, yaml_path=None):
         """
         super(SingleFileScope, self).__init__(name, path)
         self._raw_data = None
+        self._stamp = None
         self.schema = schema
         self.yaml_path = yaml_path or []
 
@@ -215,7 +242,13 @@ def get_section(self, section):
         #      }
         #   }
         # }
+        stamp = _file_stamp(self.path)
+        if self._raw_data is not None and self._stamp != stamp:
+            # The file changed since it was read
+            self.clear()
+
         if self._raw_data is None:
+            self._stamp = stamp
             self._raw_data = _read_config_file(self.path, self.schema)
             if self._raw_data is None:
                 return None
@@ -235,6 +268,10 @@ def get_section(self, section):
 
         return self.sections.get(section, None)
 
+    def clear(self):
+        super(SingleFileScope, self).clear()
+        self._raw_data = None
+
     def write_section(self, section):
         validate(self.sections, self.schema)
         try:
@@ -274,14 +311,15 @@ class InternalConfigScope(ConfigScope):
     config file settings are accessed the same way, and Spack can easily
     override settings from files.
     """
-    def __init__(self, name, data=None):
+    def __init__(self, name, data=None, validate_data=True):
         super(InternalConfigScope, self).__init__(name, None)
         self.sections = syaml.syaml_dict()
 
         if data:
             for section in data:
                 dsec = data[section]
-                validate({section: dsec}, section_schemas[section])
+                if validate_data:
+                    validate({section: dsec}, section_schemas[section])
                 self.sections[section] = _mark_internal(
                     syaml.syaml_dict({section: dsec}), name)
 
@@ -321,11 +359,14 @@ def __init__(self, *scopes):
 
         """
         self.scopes = OrderedDict()
+        # section -> (data of the section in each scope, merged data)
+        self._merged = {}
         for scope in scopes:
             self.push_scope(scope)
 
     def push_scope(self, scope):
         """Add a higher precedence scope to the Configuration."""
+        self._merged.clear()
         cmd_line_scope = None
         if self.scopes:
             highest_precedence_scope = list(self.scopes.values())[-1]
@@ -340,10 +381,12 @@ def push_scope(self, scope):
 
     def pop_scope(self):
         """Remove the highest precedence scope and return it."""
+        self._merged.clear()
         name, scope = self.scopes.popitem(last=True)
         return scope
 
     def remove_scope(self, scope_name):
+        self._merged.clear()
         return self.scopes.pop(scope_name)
 
     @property
@@ -398,6 +441,7 @@ def clear_caches(self):
         """Clears the caches for configuration files,
 
         This will cause files to be re-read upon the next request."""
+        self._merged.clear()
         for scope in self.scopes.values():
             scope.clear()
 
@@ -415,6 +459,7 @@ def update_config(self, section, update_data, scope=None):
         scope = self._validate_scope(scope)  # get ConfigScope object
 
         # read only the requested section's data.
+        self._merged.clear()
         scope.sections[section] = {section: update_data}
         scope.write_section(section)
 
@@ -441,6 +486,12 @@ def get_config(self, section, scope=None):
              }
            }
 
+        The merged contents of all the scopes are cached, until a scope is
+        pushed or popped, a section is updated or a configuration file
+        changes.  Callers get a copy of the top level of the section, so
+        they may add, replace or remove its keys, but must not modify the
+        values below it, unless they write them back with
+        ``update_config``.
         """
         _validate_section_name(section)
 
@@ -449,27 +500,27 @@ def get_config(self, section, scope=None):
         else:
             scopes = [self._validate_scope(scope)]
 
-        merged_section = syaml.syaml_dict()
-        for scope in scopes:
-            # read potentially cached data from the scope.
-
-            data = scope.get_section(section)
-
-            # Skip empty configs
-            if not data or not isinstance(data, dict):
-                continue
-
-            if section not in data:
-                continue
+        # read potentially cached data from the scopes.
+        datas = [s.get_section(section) for s in scopes]
 
-            merged_section = _merge_yaml(merged_section, data)
+        if scope is None:
+            # The merged data is still valid if every scope returned the
+            # same data as when it was merged
+            cached_datas, merged_section = self._merged.get(
+                section, (None, None))
+            if cached_datas is None or len(cached_datas) != len(datas) or \
+                    any(c is not d for c, d in zip(cached_datas, datas)):
+                merged_section = _merge_sections(datas, section)
+                self._merged[section] = (datas, merged_section)
+        else:
+            merged_section = _merge_sections(datas, section)
 
         # no config files -- empty config.
         if section not in merged_section:
             return {}
 
         # take the top key off before returning.
-        return merged_section[section]
+        return copy.copy(merged_section[section])
 
     def get(self, path, default=None, scope=None):
         """Get a config section or a single value from one.
@@ -497,6 +548,9 @@ def get(self, path, default=None, scope=None):
             key = parts.pop(0)
             value = value.get(key, default)
 
+        # Values of the cached sections are copied like sections are
+        if isinstance(value, (dict, list)):
+            value = copy.copy(value)
         return value
 
     def set(self, path, value, scope=None):
@@ -582,6 +636,7 @@ def override(path_or_scope, value=None):
 
 def _add_platform_scope(cfg, scope_type, name, path):
     """Add a platform-specific subdirectory for the current platform."""
+    import spack.architecture
     platform = spack.architecture.platform().name
     plat_name = '%s/%s' % (name, platform)
     plat_path = os.path.join(path, platform)
@@ -620,8 +675,11 @@ def _config():
     """
     cfg = Configuration()
 
-    # first do the builtin, hardcoded defaults
-    defaults = InternalConfigScope('_builtin', config_defaults)
+    # first do the builtin, hardcoded defaults.  They are valid, which is
+    # checked by the unit tests, and validating them would import jsonschema
+    # on every start.
+    defaults = InternalConfigScope(
+        '_builtin', config_defaults, validate_data=False)
     cfg.push_scope(defaults)
 
     # add each scope and its platform-specific directory
@@ -702,6 +760,13 @@ def _read_config_file(filename, schema):
     elif not os.access(filename, os.R_OK):
         raise ConfigFileError("Config file is not readable: %s" % filename)
 
+    # Files that did not change are not parsed and validated again
+    stamp = _file_stamp(filename)
+    cached = _read_parsed_cache(filename)
+    if cached and cached[:2] == (stamp, _schema_digest(schema)):
+        tty.debug("Reading cached config file %s" % filename)
+        return cached[2]
+
     try:
         tty.debug("Reading config file %s" % filename)
         with open(filename) as f:
@@ -709,6 +774,7 @@ def _read_config_file(filename, schema):
 
         if data:
             validate(data, schema)
+        _write_parsed_cache(filename, stamp, schema, data)
         return data
 
     except MarkedYAMLError as e:
@@ -720,6 +786,73 @@ def _read_config_file(filename, schema):
             "Error reading configuration file %s: %s" % (filename, str(e)))
 
 
+def _file_stamp(filename):
+    """Modification time, size and inode of a file, or None if the file
+    does not exist."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+#: Digests of the schemas, by id of the schema
+_schema_digests = {}
+
+
+def _schema_digest(schema):
+    """Digest of a schema, and of the version of Spack, that tells whether
+    a cached configuration file was validated against the same schema."""
+    if id(schema) not in _schema_digests:
+        text = json.dumps([spack.spack_version, schema],
+                          sort_keys=True, default=str)
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        # keep the schema, so that its id is not reused
+        _schema_digests[id(schema)] = (schema, digest)
+    return _schema_digests[id(schema)][1]
+
+
+def _parsed_cache_file(filename):
+    key = '%s:%d.%d' % ((os.path.abspath(filename),) + sys.version_info[:2])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(parsed_cache_path, digest + '.pickle')
+
+
+def _read_parsed_cache(filename):
+    """Stamp of a configuration file, digest of its schema and data, as
+    cached the last time it was parsed, or None if it is not cached."""
+    if parsed_cache_path is None:
+        return None
+
+    try:
+        with open(_parsed_cache_file(filename), 'rb') as f:
+            return cPickle.load(f)
+    except Exception:
+        # missing, or written by an incompatible version of Spack
+        return None
+
+
+def _write_parsed_cache(filename, stamp, schema, data):
+    """Cache the parsed and validated data of a configuration file."""
+    # A file modified in the last seconds may be modified again without
+    # changing its stamp, e.g. on file systems with coarse timestamps
+    if parsed_cache_path is None or stamp is None or \
+            time.time() - stamp[0] < 2:
+        return
+
+    cache_file = _parsed_cache_file(filename)
+    tmp = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        mkdirp(parsed_cache_path)
+        with open(tmp, 'wb') as f:
+            cPickle.dump((stamp, _schema_digest(schema), data), f, 2)
+        os.rename(tmp, cache_file)
+    except Exception as e:
+        tty.debug("Cannot cache config file %s: %s" % (filename, str(e)))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
 def _override(string):
     """Test if a spack YAML string is an override.
 
@@ -816,6 +949,22 @@ def they_are(t):
         return copy.copy(source)
 
 
+def _merge_sections(datas, section):
+    """Merge the data of a section in several scopes, from the lowest to
+    the highest precedence."""
+    merged_section = syaml.syaml_dict()
+    for data in datas:
+        # Skip empty configs
+        if not data or not isinstance(data, dict):
+            continue
+
+        if section not in data:
+            continue
+
+        merged_section = _merge_yaml(merged_section, data)
+    return merged_section
+
+
 #
 # Settings for commands that modify configuration
 #
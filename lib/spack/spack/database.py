@@ -18,12 +18,26 @@
 as the authoritative database of packages in Spack.  This module
 provides a cache and a sanity checking mechanism for what is in the
 filesystem.
+
+The index is kept in ``index.json``.  Write transactions do not rewrite
+it: the records they modify are appended to ``index_journal``, one line
+per transaction, and readers replay the journal on top of the index.  The
+journal is compacted into the index once it grows too long.
+
+Along with ``index.json``, which remains the export format, the index is
+written to ``index_table``: a header with the fields of every record and
+the offset of its spec, followed by the specs.  Readers memory-map the
+table and only build the specs that they actually need.
 """
 
+import bisect
 import contextlib
 import datetime
+import json
+import mmap
 import os
 import socket
+import struct
 import sys
 import time
 try:
@@ -45,7 +59,7 @@
 from spack.error import SpackError
 from spack.filesystem_view import YamlFilesystemView
 from spack.util.crypto import bit_length
-from spack.version import Version
+from spack.version import Version, VersionList
 
 # TODO: Provide an API automatically retyring a build after detecting and
 # TODO: clearing a failure.
@@ -86,6 +100,15 @@
 # Types of dependencies tracked by the database
 _tracked_deps = ('link', 'run')
 
+# Magic number at the start of the index table, followed by the length of
+# its header.
+_table_magic = b'SPACKDB\x01'
+_table_header = struct.Struct('<Q')
+
+# Number of transactions recorded in the journal before it is compacted,
+# i.e., before the whole index is written again and the journal cleared.
+_journal_max_entries = 256
+
 
 def _now():
     """Returns the time since the epoch"""
@@ -177,6 +200,24 @@ def __init__(
         self.installation_time = installation_time or _now()
         self.deprecated_for = deprecated_for
 
+    @property
+    def spec(self):
+        if self._spec is None and self._lazy_spec is not None:
+            self._lazy_spec.materialize(self)
+        return self._spec
+
+    @spec.setter
+    def spec(self, spec):
+        self._spec = spec
+        self._lazy_spec = None
+
+    def _index_fields(self):
+        """Return the name, versions and compiler of the spec, without
+        building it if it was not read yet."""
+        if self._spec is None and self._lazy_spec is not None:
+            return self._lazy_spec.fields
+        return self.spec.name, self.spec.versions, self.spec.compiler
+
     def install_type_matches(self, installed):
         installed = InstallStatuses.canonicalize(installed)
         if self.installed:
@@ -187,8 +228,13 @@ def install_type_matches(self, installed):
             return InstallStatuses.MISSING in installed
 
     def to_dict(self):
+        if self._spec is None and self._lazy_spec is not None:
+            spec_dict = self._lazy_spec.node_dict()
+        else:
+            spec_dict = self.spec.to_node_dict()
+
         rec_dict = {
-            'spec': self.spec.to_node_dict(),
+            'spec': spec_dict,
             'path': self.path,
             'installed': self.installed,
             'ref_count': self.ref_count,
@@ -211,6 +257,213 @@ def from_dict(cls, spec, dictionary):
         return InstallRecord(spec, **d)
 
 
+class LazySpec(object):
+    """Spec of an install record that is only built when it is needed.
+
+    The node dictionary of the spec is kept serialized in the index table
+    that it was read from, along with the fields needed by ``QueryIndex``.
+
+    Args:
+        db (Database): database the install record belongs to
+        hash_key (str): DAG hash of the spec
+        table (mmap or bytes): index table the spec was read from
+        offset (int): offset of the serialized node dictionary in the table
+        length (int): length of the serialized node dictionary
+        fields (tuple): name, versions and compiler of the spec
+    """
+
+    def __init__(self, db, hash_key, table, offset, length, fields):
+        self.db = db
+        self.hash_key = hash_key
+        self.table = table
+        self.offset = offset
+        self.length = length
+        self.fields = fields
+
+    def node_dict(self):
+        """Read the node dictionary of the spec from the table."""
+        data = self.table[self.offset:self.offset + self.length]
+        return sjson.load(data.decode('utf-8'))
+
+    def materialize(self, rec):
+        """Build the spec of the install record ``rec``."""
+        self.db._materialize_spec(self.hash_key, rec, self.node_dict())
+
+
+class QueryIndex(object):
+    """Secondary indexes over the install records of a database.
+
+    The records are indexed by package name, version, compiler, explicit
+    flag and installation time so that queries only need to check the
+    records that can possibly match.  Each index maps its key to the DAG
+    hashes of the records.
+
+    Indexes are only ever used to narrow down the candidate records:
+    queries still check every candidate against the query spec.
+    """
+
+    def __init__(self, data=None):
+        self.clear()
+        for key, rec in (data or {}).items():
+            self.add(key, rec)
+
+    def clear(self):
+        """Remove all the records from the indexes."""
+        #: package name -> DAG hashes
+        self.by_name = {}
+
+        #: package name -> str(versions) -> (versions, DAG hashes)
+        self.by_version = {}
+
+        #: str(compiler) -> (compiler, DAG hashes)
+        self.by_compiler = {}
+
+        #: DAG hashes of explicitly installed specs
+        self.explicit = set()
+
+        #: sorted list of (installation_time, DAG hash)
+        self.by_date = []
+
+        #: all of the indexed DAG hashes
+        self.keys = set()
+
+    def rebuild(self, data):
+        """Index the records in ``data`` from scratch."""
+        self.clear()
+        for key, rec in data.items():
+            self.add(key, rec)
+
+    def add(self, key, rec):
+        """Add the record ``rec`` with DAG hash ``key`` to the indexes."""
+        if key in self.keys:
+            self.remove(key, rec)
+
+        name, versions, compiler = rec._index_fields()
+        self.keys.add(key)
+        self.by_name.setdefault(name, set()).add(key)
+        self.by_version.setdefault(name, {}).setdefault(
+            str(versions), (versions, set()))[1].add(key)
+        self.by_compiler.setdefault(
+            str(compiler), (compiler, set()))[1].add(key)
+        if rec.explicit:
+            self.explicit.add(key)
+        bisect.insort(self.by_date, (rec.installation_time, key))
+
+    def remove(self, key, rec):
+        """Remove the record ``rec`` with DAG hash ``key`` from the indexes."""
+        if key not in self.keys:
+            return
+
+        name, versions, compiler = rec._index_fields()
+        self.keys.discard(key)
+        _discard_from_index(self.by_name, name, key)
+        by_version = self.by_version.get(name, {})
+        _discard_from_index(by_version, str(versions), key)
+        if not by_version:
+            self.by_version.pop(name, None)
+        _discard_from_index(self.by_compiler, str(compiler), key)
+        self.explicit.discard(key)
+
+        entry = (rec.installation_time, key)
+        i = bisect.bisect_left(self.by_date, entry)
+        if i < len(self.by_date) and self.by_date[i] == entry:
+            del self.by_date[i]
+
+    def update_explicit(self, key, explicit):
+        """Update the explicit index for the record with DAG hash ``key``."""
+        if explicit:
+            self.explicit.add(key)
+        else:
+            self.explicit.discard(key)
+
+    def candidates(self, query_spec=any, explicit=any, start_date=None,
+                   end_date=None):
+        """Return the DAG hashes of the records that can match a query.
+
+        Arguments are the same as for ``Database.query()``.
+
+        Returns:
+            (set or None): DAG hashes of the candidate records or None if
+                the indexes can't narrow down the query
+        """
+        keys = None
+
+        def narrow(matching):
+            return set(matching) if keys is None else keys & matching
+
+        # Virtual specs are satisfied by their providers and by unknown
+        # packages, so only the name of non-virtual queries can be used.
+        if isinstance(query_spec, spack.spec.Spec) and \
+                not query_spec.virtual:
+            if query_spec.name:
+                keys = narrow(self.by_name.get(query_spec.name, ()))
+
+            if str(query_spec.versions) != ':':
+                if query_spec.name:
+                    by_version = [self.by_version.get(query_spec.name, {})]
+                else:
+                    by_version = self.by_version.values()
+
+                keys = narrow(set(
+                    k for index in by_version
+                    for versions, hashes in index.values()
+                    if _versions_match(versions, query_spec.versions)
+                    for k in hashes))
+
+            if query_spec.compiler:
+                keys = narrow(set(
+                    k for compiler, hashes in self.by_compiler.values()
+                    if compiler and compiler.satisfies(
+                        query_spec.compiler, strict=True)
+                    for k in hashes))
+
+        if explicit is True:
+            keys = narrow(self.explicit)
+        elif explicit is False:
+            keys = narrow(self.keys - self.explicit)
+
+        if start_date or end_date:
+            # Widen the range by a second in case of rounding errors: the
+            # exact dates are checked on the candidates anyway.
+            lo, hi = 0, len(self.by_date)
+            try:
+                if start_date:
+                    lo = bisect.bisect_left(
+                        self.by_date, (_timestamp(start_date) - 1,))
+                if end_date:
+                    hi = bisect.bisect_right(
+                        self.by_date, (_timestamp(end_date) + 1,))
+            except (OverflowError, ValueError):
+                lo, hi = 0, len(self.by_date)
+            keys = narrow(set(k for _, k in self.by_date[lo:hi]))
+
+        return keys
+
+
+def _discard_from_index(index, index_key, key):
+    """Remove ``key`` from an index entry, deleting the entry if empty."""
+    entry = index.get(index_key)
+    if entry is None:
+        return
+
+    hashes = entry[1] if isinstance(entry, tuple) else entry
+    hashes.discard(key)
+    if not hashes:
+        del index[index_key]
+
+
+def _timestamp(date):
+    """Return the time since the epoch of a (local) datetime."""
+    return time.mktime(date.timetuple()) + date.microsecond / 1e6
+
+
+def _versions_match(versions, query_versions):
+    """Strict version check from ``Spec.satisfies()`` for indexed specs."""
+    if versions and query_versions:
+        return versions.satisfies(query_versions, strict=True)
+    return not (versions or query_versions)
+
+
 class ForbiddenLockError(SpackError):
     """Raised when an upstream DB attempts to acquire a lock"""
 
@@ -301,6 +554,8 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         # Set up layout of database files within the db dir
         self._index_path = os.path.join(self._db_dir, 'index.json')
         self._verifier_path = os.path.join(self._db_dir, 'index_verifier')
+        self._journal_path = os.path.join(self._db_dir, 'index_journal')
+        self._table_path = os.path.join(self._db_dir, 'index_table')
         self._lock_path = os.path.join(self._db_dir, 'lock')
 
         # This is for other classes to use to lock prefix directories.
@@ -324,6 +579,15 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
         self.is_upstream = is_upstream
         self.last_seen_verifier = ''
 
+        # Position up to which the journal was replayed, and number of
+        # transactions recorded in it
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+        # DAG hashes of the records modified since the last write, or None
+        # if the whole index has to be written again
+        self._modified = set()
+
         # initialize rest of state.
         self.db_lock_timeout = (
             spack.config.get('config:db_lock_timeout') or _db_lock_timeout)
@@ -345,6 +609,9 @@ def __init__(self, root, db_dir=None, upstream_dbs=None,
                                 desc='database')
         self._data = {}
 
+        # Secondary indexes used to speed up queries
+        self._index = QueryIndex()
+
         self.upstream_dbs = list(upstream_dbs) if upstream_dbs else []
 
         # whether there was an error at the start of a read transaction
@@ -591,6 +858,36 @@ def _read_spec_from_dict(self, hash_key, installs):
         spec = spack.spec.Spec.from_node_dict(spec_dict)
         return spec
 
+    def _materialize_spec(self, hash_key, rec, spec_dict):
+        """Build the spec of an install record read from the index table.
+
+        Its dependencies are built first if needed, so the spec shares its
+        nodes with the other specs in the database like in
+        ``_read_from_file()``.
+
+        Does not do any locking.
+        """
+        installs = {hash_key: {'spec': spec_dict}}
+        rec.spec = self._read_spec_from_dict(hash_key, installs)
+
+        # The record may have been removed from the database already
+        data = self._data
+        if data.get(hash_key) is not rec:
+            data = dict(data)
+            data[hash_key] = rec
+
+        self._assign_dependencies(hash_key, installs, data)
+        rec.spec._mark_concrete()
+
+    def _materialize_all(self):
+        """Build the specs of all the install records.
+
+        This is needed to follow the dependents of specs, which are only
+        connected to the specs that were already built.
+        """
+        for rec in list(self._data.values()):
+            rec.spec
+
     def db_for_spec_hash(self, hash_key):
         with self.read_transaction():
             if hash_key in self._data:
@@ -740,6 +1037,119 @@ def invalid_record(hash_key, error):
             rec.spec._mark_concrete()
 
         self._data = data
+        self._index.rebuild(data)
+
+        # The journal is replayed on top of the index by the caller
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def _write_table(self, verifier):
+        """Write the in-memory database to the index table.
+
+        The table starts with a JSON header holding the fields of every
+        install record, except the spec, and the offset and length of the
+        spec in the rest of the table.  The header also records the verifier
+        of the index it was written with, since readers only use an up to
+        date table.
+
+        This function does not do any locking or transactions.
+        """
+        chunks, installs, offset = [], {}, 0
+        for key, rec in sorted(self._data.items()):
+            rec_dict = rec.to_dict()
+            spec_json = json.dumps(
+                rec_dict.pop('spec'), separators=(',', ':')).encode('utf-8')
+
+            name, versions, compiler = rec._index_fields()
+            rec_dict['index'] = [
+                name, str(versions), str(compiler) if compiler else None]
+            installs[key] = [offset, len(spec_json), rec_dict]
+
+            chunks.append(spec_json)
+            offset += len(spec_json)
+
+        header = json.dumps({
+            'version': str(_db_version),
+            'verifier': verifier,
+            'installs': installs,
+        }, separators=(',', ':')).encode('utf-8')
+
+        temp_file = self._table_path + (
+            '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(_table_magic)
+                f.write(_table_header.pack(len(header)))
+                f.write(header)
+                for chunk in chunks:
+                    f.write(chunk)
+            os.rename(temp_file, self._table_path)
+        except BaseException as e:
+            tty.debug(e)
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    def _read_from_table(self, filename):
+        """Fill database from the index table, without building the specs.
+
+        Returns:
+            (bool): ``False`` if the table is not up to date with the index,
+                in which case the database is not modified
+
+        Does not do any locking.
+        """
+        try:
+            with open(filename, 'rb') as f:
+                try:
+                    table = mmap.mmap(
+                        f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, mmap.error):
+                    table = f.read()
+        except (IOError, OSError):
+            return False
+
+        start = len(_table_magic) + _table_header.size
+        if table[:len(_table_magic)] != _table_magic:
+            return False
+
+        try:
+            length, = _table_header.unpack(table[len(_table_magic):start])
+            header = sjson.load(table[start:start + length].decode('utf-8'))
+        except Exception as e:
+            raise CorruptDatabaseError(
+                "error parsing database table:", str(e))
+
+        if (header.get('verifier') != self.last_seen_verifier or
+                header.get('version') != str(_db_version)):
+            return False
+
+        # Versions and compilers are shared by many records
+        versions_cache, compilers_cache = {}, {}
+
+        data = {}
+        start += length
+        for hash_key, (offset, length, rec) in header['installs'].items():
+            name, versions, compiler = rec.pop('index')
+            if versions not in versions_cache:
+                versions_cache[versions] = VersionList(versions)
+            if compiler not in compilers_cache:
+                compilers_cache[compiler] = (
+                    spack.spec.CompilerSpec(compiler) if compiler else None)
+            fields = (name, versions_cache[versions],
+                      compilers_cache[compiler])
+
+            data[hash_key] = InstallRecord.from_dict(None, rec)
+            data[hash_key]._lazy_spec = LazySpec(
+                self, hash_key, table, start + offset, length, fields)
+
+        self._data = data
+        self._index.rebuild(data)
+
+        # The journal is replayed on top of the index by the caller
+        self._journal_offset = 0
+        self._journal_entries = 0
+        return True
 
     def reindex(self, directory_layout):
         """Build database index from scratch based on a directory layout.
@@ -756,9 +1166,11 @@ def _read_suppress_error():
             try:
                 if os.path.isfile(self._index_path):
                     self._read_from_file(self._index_path)
+                    self._read_journal()
             except CorruptDatabaseError as e:
                 self._error = e
                 self._data = {}
+                self._index.clear()
 
         transaction = lk.WriteTransaction(
             self.lock, acquire=_read_suppress_error, release=self._write
@@ -779,6 +1191,7 @@ def _read_suppress_error():
             except BaseException:
                 # If anything explodes, restore old data, skip write.
                 self._data = old_data
+                self._index.rebuild(old_data)
                 raise
 
     def _construct_entry_from_directory_layout(self, directory_layout,
@@ -815,6 +1228,8 @@ def _construct_from_directory_layout(self, directory_layout, old_data):
         with directory_layout.disable_upstream_check():
             # Initialize data in the reconstructed DB
             self._data = {}
+            self._index.clear()
+            self._modified = None
 
             # Start inspecting the installed prefixes
             processed_specs = set()
@@ -898,8 +1313,15 @@ def _check_ref_counts(self):
                     "Invalid ref_count: %s: %d (expected %d), in DB %s" %
                     (key, found, expected, self._index_path))
 
+    def _touch(self, key):
+        """Record that the install record with DAG hash ``key`` was modified
+        (or removed) so that it is written to the journal.
+        """
+        if self._modified is not None:
+            self._modified.add(key)
+
     def _write(self, type, value, traceback):
-        """Write the in-memory database index to its file path.
+        """Write the changes to the in-memory database to its files.
 
         This is a helper function called by the WriteTransaction context
         manager. If there is an exception while the write lock is active,
@@ -907,12 +1329,64 @@ def _write(self, type, value, traceback):
         database *may* be left in an inconsistent state.  It will be consistent
         after the start of the next transaction, when it read from disk again.
 
+        The records modified by the transaction are appended to the journal,
+        which is compacted into the index once it holds too many entries.
+
         This routine does no locking.
         """
+        modified, self._modified = self._modified, set()
+
         # Do not write if exceptions were raised
         if type is not None:
+            # Make sure the next transaction reads the database from disk
+            self.last_seen_verifier = ''
             return
 
+        if (modified is None or not os.path.isfile(self._index_path) or
+                self._journal_entries >= _journal_max_entries):
+            self._write_index()
+        elif modified:
+            self._write_journal(modified)
+
+    def _write_journal(self, modified):
+        """Append the records with the given DAG hashes to the journal.
+
+        Records that are no longer in the database are recorded as removed.
+
+        This routine does no locking.
+        """
+        installs, removed = {}, []
+        for key in sorted(modified):
+            if key in self._data:
+                installs[key] = self._data[key].to_dict()
+            else:
+                removed.append(key)
+
+        # Each transaction is written on a single line tagged with the
+        # verifier of the index it applies to.
+        entry = {
+            'verifier': self.last_seen_verifier,
+            'installs': installs,
+            'removed': removed,
+        }
+        try:
+            line = json.dumps(entry, separators=(',', ':')) + '\n'
+        except (TypeError, ValueError) as e:
+            raise sjson.SpackJSONError("error writing JSON journal:", str(e))
+
+        with open(self._journal_path, 'ab') as f:
+            # Discard anything left behind by an interrupted write
+            f.truncate(self._journal_offset)
+            f.write(line.encode('utf-8'))
+            self._journal_offset = f.tell()
+        self._journal_entries += 1
+
+    def _write_index(self):
+        """Write the whole in-memory database to the index and clear the
+        journal.
+
+        This routine does no locking.
+        """
         temp_file = self._index_path + (
             '.%s.%s.temp' % (socket.getfqdn(), os.getpid()))
 
@@ -922,10 +1396,21 @@ def _write(self, type, value, traceback):
                 self._write_to_file(f)
             os.rename(temp_file, self._index_path)
             if _use_uuid:
+                new_verifier = str(uuid.uuid4())
+
+                # The table can only be checked against the verifier
+                self._write_table(new_verifier)
+
                 with open(self._verifier_path, 'w') as f:
-                    new_verifier = str(uuid.uuid4())
                     f.write(new_verifier)
                     self.last_seen_verifier = new_verifier
+
+            # The index now includes everything recorded in the journal.
+            if os.path.exists(self._journal_path):
+                with open(self._journal_path, 'w'):
+                    pass
+            self._journal_offset = 0
+            self._journal_entries = 0
         except BaseException as e:
             tty.debug(e)
             # Clean up temp file if something goes wrong.
@@ -933,6 +1418,103 @@ def _write(self, type, value, traceback):
                 os.remove(temp_file)
             raise
 
+    def _read_journal(self):
+        """Replay the transactions appended to the journal since it was last
+        read on top of the in-memory database.
+
+        Transactions recorded for another version of the index are skipped,
+        since the index already includes them.
+
+        This routine does no locking.
+        """
+        try:
+            with open(self._journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                lines = f.readlines()
+        except (IOError, OSError):
+            return
+
+        installs, removed = {}, set()
+        for line in lines:
+            # Ignore the last line if it was not completely written
+            if not line.endswith(b'\n'):
+                break
+            self._journal_offset += len(line)
+            self._journal_entries += 1
+
+            try:
+                entry = sjson.load(line.decode('utf-8'))
+            except Exception as e:
+                raise CorruptDatabaseError(
+                    "error parsing database journal:", str(e))
+            if entry.get('verifier') != self.last_seen_verifier:
+                continue
+
+            for key, rec in entry['installs'].items():
+                installs[key] = rec
+                removed.discard(key)
+            for key in entry['removed']:
+                installs.pop(key, None)
+                removed.add(key)
+
+        if installs or removed:
+            self._replay_journal(installs, removed)
+
+    def _replay_journal(self, installs, removed):
+        """Apply the records read from the journal to the in-memory database.
+
+        Args:
+            installs (dict): map from DAG hash to (the dictionary of) the
+                latest version of each added or modified record
+            removed (set): DAG hashes of the removed records
+
+        This routine does no locking.
+        """
+        def invalid_record(hash_key, error):
+            msg = ("Invalid record in Spack database journal: "
+                   "hash: %s, cause: %s: %s")
+            msg %= (hash_key, type(error).__name__, str(error))
+            raise CorruptDatabaseError(msg, self._journal_path)
+
+        # Specs are immutable, so only the other fields of existing records
+        # are updated.  New specs are built like in _read_from_file().
+        new_keys = []
+        for hash_key, rec in installs.items():
+            try:
+                old = self._data.get(hash_key)
+                if old is None:
+                    spec = self._read_spec_from_dict(hash_key, installs)
+                    new_keys.append(hash_key)
+                else:
+                    spec = old.spec
+                    self._index.remove(hash_key, old)
+                self._data[hash_key] = InstallRecord.from_dict(spec, rec)
+            except Exception as e:
+                invalid_record(hash_key, e)
+
+        for hash_key in new_keys:
+            try:
+                self._assign_dependencies(hash_key, installs, self._data)
+            except MissingDependenciesError:
+                raise
+            except Exception as e:
+                invalid_record(hash_key, e)
+
+        for hash_key in new_keys:
+            self._data[hash_key].spec._mark_concrete()
+
+        for hash_key in installs:
+            self._index.add(hash_key, self._data[hash_key])
+
+        for hash_key in removed:
+            rec = self._data.pop(hash_key, None)
+            if rec is None:
+                continue
+            self._index.remove(hash_key, rec)
+            for dep in rec.spec.dependencies(_tracked_deps):
+                if dep._dependents.get(rec.spec.name):
+                    del dep._dependents[rec.spec.name]
+
     def _read(self):
         """Re-read Database from the data in the set location.
 
@@ -951,8 +1533,14 @@ def _read(self):
             if ((current_verifier != self.last_seen_verifier) or
                     (current_verifier == '')):
                 self.last_seen_verifier = current_verifier
-                # Read from file if a database exists
-                self._read_from_file(self._index_path)
+                # Read from file if a database exists, preferring the table
+                # if it is up to date
+                if not (current_verifier and
+                        self._read_from_table(self._table_path)):
+                    self._read_from_file(self._index_path)
+
+            # Catch up with the transactions recorded in the journal
+            self._read_journal()
             return
         elif self.is_upstream:
             raise UpstreamDatabaseLockingError(
@@ -962,6 +1550,7 @@ def _read(self):
         # The file doesn't exist, try to traverse the directory.
         # reindex() takes its own write lock, so no lock here.
         with lk.WriteTransaction(self.lock):
+            self._modified = None
             self._write(None, None, None)
         self.reindex(spack.store.layout)
 
@@ -1041,6 +1630,7 @@ def _add(
             self._data[key] = InstallRecord(
                 new_spec, path, installed, ref_count=0, **extra_args
             )
+            self._touch(key)
 
             # Connect dependencies from the DB to the new copy.
             for name, dep in six.iteritems(
@@ -1051,17 +1641,21 @@ def _add(
                 new_spec._add_dependency(record.spec, dep.deptypes)
                 if not upstream:
                     record.ref_count += 1
+                    self._touch(dkey)
 
             # Mark concrete once everything is built, and preserve
             # the original hash of concrete specs.
             new_spec._mark_concrete()
             new_spec._hash = key
+            self._index.add(key, self._data[key])
 
         else:
             # If it is already there, mark it as installed.
             self._data[key].installed = True
 
         self._data[key].explicit = explicit
+        self._index.update_explicit(key, explicit)
+        self._touch(key)
 
     @_autospec
     def add(self, spec, directory_layout, explicit=False):
@@ -1102,9 +1696,11 @@ def _decrement_ref_count(self, spec):
 
         rec = self._data[key]
         rec.ref_count -= 1
+        self._touch(key)
 
         if rec.ref_count == 0 and not rec.installed:
             del self._data[key]
+            self._index.remove(key, rec)
             for dep in spec.dependencies(_tracked_deps):
                 self._decrement_ref_count(dep)
 
@@ -1116,17 +1712,20 @@ def _increment_ref_count(self, spec):
 
         rec = self._data[key]
         rec.ref_count += 1
+        self._touch(key)
 
     def _remove(self, spec):
         """Non-locking version of remove(); does real work."""
         key = self._get_matching_spec_key(spec)
         rec = self._data[key]
+        self._touch(key)
 
         if rec.ref_count > 0:
             rec.installed = False
             return rec.spec
 
         del self._data[key]
+        self._index.remove(key, rec)
         for dep in rec.spec.dependencies(_tracked_deps):
             # FIXME: the two lines below needs to be updated once #11983 is
             # FIXME: fixed. The "if" statement should be deleted and specs are
@@ -1160,6 +1759,24 @@ def remove(self, spec):
         with self.write_transaction():
             return self._remove(spec)
 
+    @_autospec
+    def update_explicit(self, spec, explicit):
+        """Update the spec's explicit state in the database.
+
+        Args:
+            spec (Spec): the spec whose install record is being updated
+            explicit (bool): ``True`` if the package was requested
+                explicitly by the user, ``False`` if it was pulled in as a
+                dependency of an explicit package.
+        """
+        with self.write_transaction():
+            key = self._get_matching_spec_key(spec)
+            rec = self._data[key]
+            if explicit != rec.explicit:
+                rec.explicit = explicit
+                self._index.update_explicit(key, explicit)
+                self._touch(key)
+
     def deprecator(self, spec):
         """Return the spec that the given spec is deprecated for, or None"""
         with self.read_transaction():
@@ -1193,6 +1810,7 @@ def _deprecate(self, spec, deprecator):
         spec_rec.deprecated_for = deprecator_key
         spec_rec.installed = False
         self._data[spec_key] = spec_rec
+        self._touch(spec_key)
 
     @_autospec
     def deprecate(self, spec, deprecator):
@@ -1207,6 +1825,10 @@ def installed_relatives(self, spec, direction='children', transitive=True,
         if direction not in ('parents', 'children'):
             raise ValueError("Invalid direction: %s" % direction)
 
+        if direction == 'parents':
+            with self.read_transaction():
+                self._materialize_all()
+
         relatives = set()
         for spec in self.query(spec):
             if transitive:
@@ -1363,6 +1985,10 @@ def _query(
         # TODO: like installed and known that can be queried?  Or are
         # TODO: these really special cases that only belong here?
 
+        # Parse query strings once, so the indexes can narrow them down.
+        if isinstance(query_spec, six.string_types):
+            query_spec = spack.spec.Spec(query_spec)
+
         # Just look up concrete specs with hashes; no fancy search.
         if isinstance(query_spec, spack.spec.Spec) and query_spec.concrete:
             # TODO: handling of hashes restriction is not particularly elegant.
@@ -1373,13 +1999,21 @@ def _query(
             else:
                 return []
 
-        # Abstract specs require more work -- currently we test
-        # against everything.
+        # Abstract specs require more work -- we use the indexes to find the
+        # records that may match and test against each of them.
         results = []
+        candidates = self._index.candidates(
+            query_spec, explicit, start_date, end_date)
         start_date = start_date or datetime.datetime.min
         end_date = end_date or datetime.datetime.max
 
-        for key, rec in self._data.items():
+        if candidates is None:
+            records = self._data.items()
+        else:
+            records = ((key, self._data[key]) for key in candidates
+                       if key in self._data)
+
+        for key, rec in records:
             if hashes is not None and rec.spec.dag_hash() not in hashes:
                 continue
 
@@ -4,6 +4,8 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import collections
+import multiprocessing
+import multiprocessing.pool
 import os
 import re
 import sys
@@ -19,6 +21,7 @@
 import llnl.util.tty as tty
 from llnl.util.tty.color import colorize
 
+import spack.compilers
 import spack.concretize
 import spack.error
 import spack.hash_types as ht
@@ -62,6 +65,11 @@
 env_subdir_name = '.spack-env'
 
 
+#: minimum number of user specs to concretize separately before they are
+#: concretized in parallel
+parallel_concretization_threshold = 2
+
+
 #: default spack.yaml file to put in new environments
 default_manifest_yaml = """\
 # This is a Spack Environment file.
@@ -159,8 +167,7 @@ def activate(
             cmds += 'export PS1="%s ${PS1}";\n' % prompt
 
     if add_view and default_view_name in env.views:
-        with spack.store.db.read_transaction():
-            cmds += env.add_default_view_to_shell(shell)
+        cmds += env.add_default_view_to_shell(shell)
 
     return cmds
 
@@ -208,8 +215,7 @@ def deactivate(shell='sh'):
         cmds += 'fi;\n'
 
     if default_view_name in _active_environment.views:
-        with spack.store.db.read_transaction():
-            cmds += _active_environment.rm_default_view_from_shell(shell)
+        cmds += _active_environment.rm_default_view_from_shell(shell)
 
     tty.debug("Deactivated environmennt '%s'" % _active_environment.name)
     _active_environment = None
@@ -918,7 +924,7 @@ def remove(self, query_spec, list_name=user_speclist_name, force=False):
                 del self.concretized_order[i]
                 del self.specs_by_hash[dag_hash]
 
-    def concretize(self, force=False):
+    def concretize(self, force=False, jobs=None):
         """Concretize user_specs in this environment.
 
         Only concretizes specs that haven't been concretized yet unless
@@ -930,6 +936,9 @@ def concretize(self, force=False):
         Arguments:
             force (bool): re-concretize ALL specs, even those that were
                already concretized
+            jobs (int): maximum number of processes concretizing user
+               specs at the same time, when they are concretized
+               separately (default: the number of cores)
 
         Returns:
             List of specs that have been concretized. Each entry is a tuple of
@@ -945,7 +954,7 @@ def concretize(self, force=False):
         if self.concretization == 'together':
             return self._concretize_together()
         if self.concretization == 'separately':
-            return self._concretize_separately()
+            return self._concretize_separately(jobs)
 
         msg = 'concretization strategy not implemented [{0}]'
         raise SpackEnvironmentError(msg.format(self.concretization))
@@ -990,9 +999,13 @@ def _concretize_together(self):
             self._add_concrete_spec(abstract, concrete)
         return concretized_specs
 
-    def _concretize_separately(self):
+    def _concretize_separately(self, jobs=None):
         """Concretization strategy that concretizes separately one
         user spec after the other.
+
+        The user specs are independent from each other, so they are
+        concretized in a pool of processes, and the results are added to
+        the environment in the order of the user specs.
         """
         # keep any concretized specs whose user specs are still in the manifest
         old_concretized_user_specs = self.concretized_user_specs
@@ -1009,13 +1022,22 @@ def _concretize_separately(self):
                 self._add_concrete_spec(s, concrete, new=False)
 
         # Concretize any new user specs that we haven't concretized yet
+        new_user_specs = [
+            (uspec, uspec_constraints) for uspec, uspec_constraints in zip(
+                self.user_specs, self.user_specs.specs_as_constraints)
+            if uspec not in old_concretized_user_specs]
+        concretized_in_parallel = _concretize_in_parallel(
+            [constraints for _, constraints in new_user_specs], jobs)
+
         concretized_specs = []
-        for uspec, uspec_constraints in zip(
-                self.user_specs, self.user_specs.specs_as_constraints):
-            if uspec not in old_concretized_user_specs:
+        for i, (uspec, uspec_constraints) in enumerate(new_user_specs):
+            # Specs that failed to concretize in a worker process are
+            # concretized again here, to report the error
+            concrete = concretized_in_parallel.get(i)
+            if concrete is None:
                 concrete = _concretize_from_constraints(uspec_constraints)
-                self._add_concrete_spec(uspec, concrete)
-                concretized_specs.append((uspec, concrete))
+            self._add_concrete_spec(uspec, concrete)
+            concretized_specs.append((uspec, concrete))
         return concretized_specs
 
     def concretize_and_add(self, user_spec, concrete_spec=None):
@@ -1091,15 +1113,30 @@ def regenerate_views(self):
         for view in self.views.values():
             view.regenerate(specs, self.roots())
 
-    def add_default_view_to_shell(self, shell):
-        env_mod = spack.util.environment.EnvironmentModifications()
-
-        if default_view_name not in self.views:
-            # No default view to add to shell
-            return env_mod.shell_modifications(shell)
-
-        env_mod.extend(uenv.unconditional_environment_modifications(
-            self.default_view))
+    @property
+    def shell_cache_path(self):
+        """Directory caching the environment modifications of the view."""
+        return os.path.join(self.env_subdir_path, 'shell')
+
+    def _view_modifications(self, action, compute):
+        """Modifications of the default view for ``action``, cached until
+        the manifest, the lockfile or the installed specs change."""
+        path = os.path.join(self.shell_cache_path, action + '.pickle')
+        key = uenv.modifications_cache_key(
+            [spec for _, spec in self.concretized_specs()],
+            [self.manifest_path, self.lock_path,
+             spack.store.db._index_path, spack.store.db._journal_path])
+
+        def compute_in_transaction():
+            with spack.store.db.read_transaction():
+                return compute()
+
+        return uenv.cached_environment_modifications(
+            path, key, compute_in_transaction)
+
+    def _add_default_view_modifications(self):
+        env_mod = uenv.unconditional_environment_modifications(
+            self.default_view)
 
         for _, spec in self.concretized_specs():
             if spec in self.default_view and spec.package.installed:
@@ -1110,23 +1147,35 @@ def add_default_view_to_shell(self, shell):
         for env_var in env_mod.group_by_name():
             env_mod.prune_duplicate_paths(env_var)
 
-        return env_mod.shell_modifications(shell)
-
-    def rm_default_view_from_shell(self, shell):
-        env_mod = spack.util.environment.EnvironmentModifications()
-
-        if default_view_name not in self.views:
-            # No default view to add to shell
-            return env_mod.shell_modifications(shell)
+        return env_mod
 
-        env_mod.extend(uenv.unconditional_environment_modifications(
-            self.default_view).reversed())
+    def _rm_default_view_modifications(self):
+        env_mod = uenv.unconditional_environment_modifications(
+            self.default_view).reversed()
 
         for _, spec in self.concretized_specs():
             if spec in self.default_view and spec.package.installed:
                 env_mod.extend(
                     uenv.environment_modifications_for_spec(
                         spec, self.default_view).reversed())
+        return env_mod
+
+    def add_default_view_to_shell(self, shell):
+        if default_view_name not in self.views:
+            # No default view to add to shell
+            env_mod = spack.util.environment.EnvironmentModifications()
+        else:
+            env_mod = self._view_modifications(
+                'activate', self._add_default_view_modifications)
+        return env_mod.shell_modifications(shell)
+
+    def rm_default_view_from_shell(self, shell):
+        if default_view_name not in self.views:
+            # No default view to remove from shell
+            env_mod = spack.util.environment.EnvironmentModifications()
+        else:
+            env_mod = self._view_modifications(
+                'deactivate', self._rm_default_view_modifications)
         return env_mod.shell_modifications(shell)
 
     def _add_concrete_spec(self, spec, concrete, new=True):
@@ -1541,7 +1590,7 @@ def _concretize_from_constraints(spec_constraints):
         m += 'concretization target. all specs must have a single name '
         m += 'constraint for concretization.'
         raise InvalidSpecConstraintError(m)
-    spec_constraints.remove(root_spec[0])
+    spec_constraints = [c for c in spec_constraints if c is not root_spec[0]]
 
     invalid_constraints = []
     while True:
@@ -1570,6 +1619,67 @@ def _concretize_from_constraints(spec_constraints):
             invalid_constraints.extend(inv_variant_constraints)
 
 
+def _concretize_task(spec_constraints):
+    """Concretize a user spec in a worker process.
+
+    Returns:
+        (str or None): the concrete spec as JSON, or None if the spec
+            could not be concretized
+    """
+    try:
+        concrete = _concretize_from_constraints(spec_constraints)
+        return concrete.to_json(hash=ht.build_hash)
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        # Errors exiting the worker, like tty.die, would hang the pool
+        tty.debug('Cannot concretize {0} in parallel: {1}'.format(
+            spec_constraints, str(e)))
+        return None
+
+
+def _concretize_in_parallel(specs_constraints, jobs=None):
+    """Concretize independent user specs in a pool of processes.
+
+    The processes are forked after loading the indexes of the
+    repositories and the compilers, so that they share them.
+
+    Arguments:
+        specs_constraints (list): constraints of each user spec
+        jobs (int): maximum number of processes (default: the number of
+            cores)
+
+    Returns:
+        (dict): the concrete specs, by index in ``specs_constraints``,
+            without the specs that failed to concretize, or an empty
+            dictionary if the specs have to be concretized sequentially
+    """
+    jobs = min(jobs or multiprocessing.cpu_count(), len(specs_constraints))
+
+    # Workers need the configuration of this process, so they are forked.
+    # Daemonic processes (e.g., in a pool) cannot have children.
+    if (jobs < 2 or len(specs_constraints) < parallel_concretization_threshold
+            or multiprocessing.current_process().daemon
+            or (sys.version_info >= (3, 4) and
+                multiprocessing.get_start_method() != 'fork')):
+        return {}
+
+    spack.repo.path.provider_index
+    spack.compilers.all_compiler_specs()
+
+    tty.debug('Concretizing {0} specs in {1} processes'.format(
+        len(specs_constraints), jobs))
+    pool = multiprocessing.pool.Pool(jobs)
+    try:
+        results = pool.map(_concretize_task, specs_constraints, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return dict((i, Spec.from_json(result))
+                for i, result in enumerate(results) if result)
+
+
 def make_repo_path(root):
     """Make a RepoPath from the repo subdirectories in an environment."""
     path = spack.repo.RepoPath()
@@ -38,7 +38,6 @@
 import spack.util.crypto as crypto
 import spack.util.pattern as pattern
 import spack.util.url as url_util
-import spack.util.web as web_util
 from llnl.util.filesystem import (
     working_dir, mkdirp, temp_rename, temp_cwd, get_single_file)
 from spack.util.compression import decompressor_for, extension
@@ -470,6 +469,7 @@ def archive(self, destination):
         if not self.archive_file:
             raise NoArchiveFileError("Cannot call archive() before fetching.")
 
+        import spack.util.web as web_util
         web_util.push_to_url(
             self.archive_file,
             destination,
@@ -1128,6 +1128,7 @@ def fetch(self):
 
         basename = os.path.basename(parsed_url.path)
 
+        import spack.util.web as web_util
         with working_dir(self.stage.path):
             _, headers, stream = web_util.read_from_url(self.url)
 
@@ -1375,7 +1376,19 @@ def store(self, fetcher, relative_dest):
 
         dst = os.path.join(self.root, relative_dest)
         mkdirp(os.path.dirname(dst))
-        fetcher.archive(dst)
+
+        # Archive to a temporary file first so that archives in the cache
+        # are always complete, even if the process storing them is killed,
+        # e.g., when fetching ahead of the builds is stopped.
+        tmp = os.path.join(os.path.dirname(dst), '.tmp-{0}-{1}'.format(
+            os.getpid(), os.path.basename(dst)))
+        try:
+            fetcher.archive(tmp)
+            os.rename(tmp, dst)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
 
     def fetcher(self, target_path, digest, **kwargs):
         path = os.path.join(self.root, target_path)
@@ -30,12 +30,16 @@
 import glob
 import heapq
 import itertools
+import multiprocessing
+import multiprocessing.pool
 import os
 import shutil
 import six
 import sys
 import time
 
+from six.moves import queue
+
 import llnl.util.filesystem as fs
 import llnl.util.lock as lk
 import llnl.util.tty as tty
@@ -43,6 +47,7 @@
 import spack.compilers
 import spack.error
 import spack.hooks
+import spack.mirror
 import spack.package
 import spack.package_prefs as prefs
 import spack.repo
@@ -190,6 +195,61 @@ def _packages_needed_to_bootstrap_compiler(pkg):
     return packages
 
 
+def _build_jobs_per_build(concurrent_builds, jobs_total):
+    """
+    Split the core budget between the concurrently running builds.
+
+    Args:
+        concurrent_builds (int): maximum number of builds running at once
+        jobs_total (int or None): total number of parallel jobs to be shared
+            by all of the builds (or None to share the configured
+            ``build_jobs`` when running builds concurrently)
+
+    Return:
+        (int or None) number of parallel jobs for each build or None if the
+            configured ``build_jobs`` value should be used
+    """
+    if concurrent_builds <= 1:
+        return jobs_total
+
+    # Builds use at most one job per core, whatever build_jobs is set to
+    jobs_total = jobs_total or min(spack.config.get('config:build_jobs'),
+                                   multiprocessing.cpu_count())
+    return max(1, jobs_total // concurrent_builds)
+
+
+#: Packages whose sources are fetched ahead of their builds, keyed on their
+#: unique id, inherited by the forked processes of the fetch pool
+_packages_to_fetch = {}
+
+
+def _fetch_ahead(pkg_id):
+    """
+    Download the sources, resources and patches of the package into the
+    fetch cache ahead of its build.
+
+    This is executed by one of the processes of the fetch pool, since
+    fetchers change the working directory, so errors are only reported in
+    debug mode: the build fetches the sources again, and reports the
+    failure, if they are not in the cache.
+
+    Args:
+        pkg_id (str): the unique id of the package in ``_packages_to_fetch``
+
+    Return:
+        (str or None) the message of the error raised while fetching, if any
+    """
+    try:
+        start_time = time.time()
+        _packages_to_fetch[pkg_id].do_fetch()
+        tty.debug('Fetched the sources of {0} ahead of its build in {1}'
+                  .format(pkg_id, _hms(time.time() - start_time)))
+    except Exception as exc:
+        tty.debug('Failed to fetch the sources of {0} ahead of its build: {1}'
+                  .format(pkg_id, str(exc)))
+        return str(exc)
+
+
 def _hms(seconds):
     """
     Convert seconds to hours, minutes, seconds
@@ -366,11 +426,9 @@ def _update_explicit_entry_in_db(pkg, rec, explicit):
             package.
     """
     if explicit and not rec.explicit:
-        with spack.store.db.write_transaction():
-            rec = spack.store.db.get_record(pkg.spec)
-            message = '{s.name}@{s.version} : marking the package explicit'
-            tty.msg(message.format(s=pkg.spec))
-            rec.explicit = True
+        message = '{s.name}@{s.version} : marking the package explicit'
+        tty.msg(message.format(s=pkg.spec))
+        spack.store.db.update_explicit(pkg.spec, True)
 
 
 def dump_packages(spec, path):
@@ -546,15 +604,22 @@ def package_id(pkg):
 
 install_args_docstring = """
             cache_only (bool): Fail if binary package unavailable.
+            concurrent_builds (int): Maximum number of packages built at
+                the same time (by default, ``config:concurrent_builds``).
             dirty (bool): Don't clean the build environment before installing.
             explicit (bool): True if package was explicitly installed, False
                 if package was implicitly installed (as a dependency).
             fake (bool): Don't really build; install fake stub files instead.
+            fetch_ahead (int): Number of packages whose sources are
+                downloaded in the background while other packages build (by
+                default, ``config:fetch_ahead``).
             force (bool): Install again, even if already installed.
             install_deps (bool): Install dependencies before installing this
                 package
             install_source (bool): By default, source is not installed, but
                 for debugging it might be useful to keep it around.
+            jobs_total (int): Total number of parallel build jobs shared by
+                the concurrent builds (by default, all available cores).
             keep_prefix (bool): Keep install prefix on failure. By default,
                 destroys it.
             keep_stage (bool): By default, stage is destroyed only if there
@@ -627,11 +692,41 @@ def __init__(self, pkg):
         # Locks on specs being built, keyed on the package's unique id
         self.locks = {}
 
+        # Build tasks whose builds are running in the background, keyed on
+        # the package's unique id
+        self.building = {}
+
+        # Child processes of the background builds, keyed on the package's
+        # unique id
+        self.build_children = {}
+
+        # Pool of threads waiting on background builds (or None if builds
+        # are performed one at a time)
+        self.build_pool = None
+
+        # Results of the finished background builds
+        self.build_results = queue.Queue()
+
+        # Maximum number of builds running at the same time
+        self.concurrent_builds = 1
+
+        # Number of parallel jobs for each build (or None to use the
+        # configured value)
+        self.build_jobs = None
+
+        # Pool of threads downloading sources ahead of the builds (or None
+        # if sources are downloaded by each build)
+        self.fetch_pool = None
+
+        # Results of the background downloads, keyed on the package's
+        # unique id
+        self.fetches = {}
+
     def __repr__(self):
         """Returns a formal representation of the package installer."""
         rep = '{0}('.format(self.__class__.__name__)
         for attr, value in self.__dict__.items():
-            rep += '{0}={1}, '.format(attr, value.__repr__())
+            rep += '{0}={1}, '.format(attr, repr(value))
         return '{0})'.format(rep.strip(', '))
 
     def __str__(self):
@@ -655,6 +750,29 @@ def _add_bootstrap_compilers(self, pkg):
             if package_id(comp_pkg) not in self.build_tasks:
                 self._push_task(comp_pkg, is_compiler, 0, 0, STATUS_ADDED)
 
+    def _build_in_background(self, task, child):
+        """
+        Wait for the build process of the task to finish.
+
+        This is executed by one of the threads of the build pool so it must
+        not update the installer state nor fork.  The outcome is processed
+        by ``_complete_task`` in the main thread instead.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+            child (tuple): the build process, as returned by
+                ``spack.build_environment.start_fork``
+
+        Return:
+            (task, result, exc) tuple where result is the result of the build
+                process and exc is the exception raised while waiting for
+                it, if any, otherwise None
+        """
+        try:
+            return task, spack.build_environment.wait_fork(child), None
+        except (Exception, KeyboardInterrupt, SystemExit) as exc:
+            return task, None, exc
+
     def _check_db(self, spec):
         """Determine if the spec is flagged as installed in the database
 
@@ -823,6 +941,63 @@ def _cleanup_failed(self, pkg_id):
             except Exception as exc:
                 tty.warn(err.format(exc.__class__.__name__, pkg_id, str(exc)))
 
+    def _complete_task(self, task, result, exc, keep_prefix):
+        """
+        Process the outcome of a build that ran in the background.
+
+        Args:
+            task (BuildTask): the installation build task for a package
+            result: the result of the build process
+            exc (Exception): the exception raised while waiting for the
+                build, if any, otherwise None
+            keep_prefix (bool): ``True`` if the prefix is to be kept on
+                failure, otherwise ``False``
+        """
+        pkg = task.pkg
+        pkg_id = task.pkg_id
+        del self.building[pkg_id]
+        del self.build_children[pkg_id]
+
+        try:
+            if exc is not None:
+                raise exc
+
+            # Preserve verbosity settings across installs.
+            spack.package.PackageBase._verbose = \
+                spack.build_environment.fork_result(pkg, result)
+            self._register_install(task)
+            self._update_installed(task)
+
+            # If we installed then we should keep the prefix
+            last_phase = getattr(pkg, 'last_phase', None)
+            keep_prefix = last_phase is None or keep_prefix
+
+        except (Exception, KeyboardInterrupt, SystemExit) as exc:
+            # Assuming best effort installs so suppress the exception and
+            # mark as a failure UNLESS this is the explicit package.
+            err = 'Failed to install {0} due to {1}: {2}'
+            tty.error(err.format(pkg.name, exc.__class__.__name__,
+                      str(exc)))
+            self._update_failed(task, True, exc)
+
+            if pkg_id == self.pkg_id:
+                raise
+
+        finally:
+            # Remove the install prefix if anything went wrong during
+            # install.
+            if not keep_prefix:
+                pkg.remove_prefix()
+
+            # The subprocess *may* have removed the build stage. Mark it
+            # not created so that the next time pkg.stage is invoked, we
+            # check the filesystem for it.
+            pkg.stage.created = False
+
+        # Perform basic task cleanup for the installed spec to
+        # include downgrading the write to a read lock
+        self._cleanup_task(pkg)
+
     def _cleanup_task(self, pkg):
         """
         Cleanup the build task for the spec
@@ -999,6 +1174,14 @@ def _install_task(self, task, **kwargs):
         Perform the installation of the requested spec and/or dependency
         represented by the build task.
 
+        When builds are performed concurrently, the build process is handed
+        to the build pool and its outcome is processed by ``_complete_task``
+        once it finishes.
+
+        Return:
+            (bool) ``True`` if the build is running in the background,
+                otherwise ``False``
+
         Args:
             task (BuildTask): the installation build task for a package"""
 
@@ -1025,7 +1208,7 @@ def _install_task(self, task, **kwargs):
         if use_cache and \
                 _install_from_cache(pkg, cache_only, explicit, unsigned):
             self._update_installed(task)
-            return
+            return False
 
         pkg.run_tests = (tests is True or tests and pkg.name in tests)
 
@@ -1135,25 +1318,31 @@ def build_process():
         # hook that allows tests to inspect the Package before installation
         # see unit_test_check() docs.
         if not pkg.unit_test_check():
-            return
+            return False
 
         try:
             self._setup_install_dir(pkg)
 
+            # Fork the build here, in the main thread, and leave the wait
+            # for it to a thread of the pool so the main loop can proceed
+            # with other ready tasks in the meantime.
+            if self.build_pool is not None:
+                child = spack.build_environment.start_fork(
+                    pkg, build_process, dirty=dirty, fake=fake,
+                    jobs=self.build_jobs)
+                self.build_children[pkg_id] = child
+                self.build_pool.apply_async(
+                    self._build_in_background, (task, child),
+                    callback=self.build_results.put)
+                return True
+
             # Fork a child to do the actual installation.
             # Preserve verbosity settings across installs.
             spack.package.PackageBase._verbose = spack.build_environment.fork(
-                pkg, build_process, dirty=dirty, fake=fake)
+                pkg, build_process, dirty=dirty, fake=fake,
+                jobs=self.build_jobs)
 
-            # Note: PARENT of the build process adds the new package to
-            # the database, so that we don't need to re-read from file.
-            spack.store.db.add(pkg.spec, spack.store.layout,
-                               explicit=explicit)
-
-            # If a compiler, ensure it is added to the configuration
-            if task.compiler:
-                spack.compilers.add_compilers_to_config(
-                    spack.compilers.find_compilers([pkg.spec.prefix]))
+            self._register_install(task)
 
         except StopIteration as e:
             # A StopIteration exception means that do_install was asked to
@@ -1162,6 +1351,8 @@ def build_process():
             tty.msg('Package stage directory : {0}'
                     .format(pkg.stage.source_path))
 
+        return False
+
     _install_task.__doc__ += install_args_docstring
 
     def _next_is_pri0(self):
@@ -1176,6 +1367,21 @@ def _next_is_pri0(self):
         task = self.build_pq[0][1]
         return task.priority == 0
 
+    def _next_is_ready(self):
+        """
+        Determine if the next build task can be started, which requires all
+        of its dependencies to be installed.
+
+        Return:
+            True if it can, False otherwise
+        """
+        # Discard removed tasks so the priority of the next active task
+        # is checked
+        while self.build_pq and self.build_pq[0][1].status == STATUS_REMOVED:
+            heapq.heappop(self.build_pq)
+
+        return bool(self.build_pq) and self._next_is_pri0()
+
     def _pop_task(self):
         """
         Remove and return the lowest priority build task.
@@ -1218,6 +1424,26 @@ def _push_task(self, pkg, compiler, start, attempts, status):
         self.build_tasks[pkg_id] = task
         heapq.heappush(self.build_pq, (task.key, task))
 
+    def _register_install(self, task):
+        """
+        Register the newly built package in the database and, if it is a
+        compiler, in the compiler configuration.
+
+        Args:
+            task (BuildTask): the build task for the installed package
+        """
+        pkg = task.pkg
+        explicit = task.pkg_id == self.pkg_id
+
+        # Note: PARENT of the build process adds the new package to
+        # the database, so that we don't need to re-read from file.
+        spack.store.db.add(pkg.spec, spack.store.layout, explicit=explicit)
+
+        # If a compiler, ensure it is added to the configuration
+        if task.compiler:
+            spack.compilers.add_compilers_to_config(
+                spack.compilers.find_compilers([pkg.spec.prefix]))
+
     def _release_lock(self, pkg_id):
         """
         Release any lock on the package
@@ -1302,6 +1528,70 @@ def _setup_install_dir(self, pkg):
             # Ensure the metadata path exists as well
             fs.mkdirp(spack.store.layout.metadata_path(pkg.spec), mode=perms)
 
+    def _start_fetches(self, fetch_ahead, use_cache):
+        """
+        Start downloading the sources of the queued packages in the
+        background, in the order their builds are expected to start.
+
+        Packages that are already installed, have no code, whose version
+        has no checksum (when checksums are required), or which may be
+        installed from a binary package in a mirror are skipped.
+
+        The downloads run in forked processes, so they need the fork start
+        method and are skipped without it.
+
+        Args:
+            fetch_ahead (int): maximum number of downloads at the same time
+            use_cache (bool): ``True`` if packages may be installed from
+                binary caches, otherwise ``False``
+        """
+        # The workers need the packages of this process, so they are forked.
+        if (multiprocessing.current_process().daemon or
+                (sys.version_info >= (3, 4) and
+                 multiprocessing.get_start_method() != 'fork')):
+            tty.debug('Not fetching sources ahead of the builds since '
+                      'processes cannot be forked')
+            return
+
+        binary_specs = set()
+        if use_cache and spack.mirror.MirrorCollection():
+            binary_specs = binary_distribution.get_specs()
+
+        checksum = spack.config.get('config:checksum')
+        pkgs = []
+        for _, task in sorted(self.build_pq, key=lambda entry: entry[0]):
+            pkg = task.pkg
+            if task.status == STATUS_REMOVED or not pkg.has_code:
+                continue
+
+            if pkg.spec.external or pkg.installed_upstream:
+                continue
+
+            if checksum and pkg.version not in pkg.versions:
+                continue
+
+            if binary_specs:
+                binary_spec = spack.spec.Spec.from_dict(pkg.spec.to_dict())
+                binary_spec._mark_concrete()
+                if binary_spec in binary_specs:
+                    continue
+
+            _, installed_in_db = self._check_db(pkg.spec)
+            if not installed_in_db:
+                pkgs.append(pkg)
+
+        if not pkgs:
+            return
+
+        tty.debug('Fetching the sources of {0} packages ahead of the builds'
+                  .format(len(pkgs)))
+        _packages_to_fetch.update((package_id(pkg), pkg) for pkg in pkgs)
+        self.fetch_pool = multiprocessing.pool.Pool(
+            min(fetch_ahead, len(pkgs)))
+        for pkg in pkgs:
+            self.fetches[package_id(pkg)] = self.fetch_pool.apply_async(
+                _fetch_ahead, (package_id(pkg),))
+
     def _update_failed(self, task, mark=False, exc=None):
         """
         Update the task and transitive dependents as failed; optionally mark
@@ -1363,16 +1653,53 @@ def _update_installed(self, task):
                 tty.debug('{0} has no build task to update for {1}\'s success'
                           .format(dep_id, pkg_id))
 
+    def _wait_for_build(self):
+        """
+        Wait for a background build to finish.
+
+        The wait times out regularly so that it can be interrupted, e.g., by
+        Ctrl-C with Python 2.
+
+        Return:
+            (task, result, exc) tuple of the finished build, as returned by
+                ``_build_in_background``
+        """
+        while True:
+            try:
+                return self.build_results.get(timeout=1)
+            except queue.Empty:
+                pass
+
+    def _wait_for_fetch(self, pkg_id):
+        """
+        Wait for the background download of the package's sources, if any,
+        so the package is not staged while its sources are being fetched.
+
+        Args:
+            pkg_id (str): the package's unique id
+        """
+        result = self.fetches.pop(pkg_id, None)
+        if result is not None and not result.ready():
+            tty.debug('Waiting for the sources of {0} to be fetched'
+                      .format(pkg_id))
+            result.wait()
+
     def install(self, **kwargs):
         """
         Install the package and/or associated dependencies.
 
         Args:"""
 
+        cache_only = kwargs.get('cache_only', False)
+        concurrent_builds = kwargs.get('concurrent_builds', None) or \
+            spack.config.get('config:concurrent_builds', 1)
+        fake = kwargs.get('fake', False)
+        fetch_ahead = kwargs.get('fetch_ahead', None)
+        if fetch_ahead is None:
+            fetch_ahead = spack.config.get('config:fetch_ahead', 0)
         install_deps = kwargs.get('install_deps', True)
-        keep_prefix = kwargs.get('keep_prefix', False)
-        keep_stage = kwargs.get('keep_stage', False)
-        restage = kwargs.get('restage', False)
+        jobs_total = kwargs.get('jobs_total', None)
+        use_cache = kwargs.get('use_cache', True)
 
         # install_package defaults True and is popped so that dependencies are
         # always installed regardless of whether the root was installed
@@ -1391,8 +1718,79 @@ def install(self, **kwargs):
         # Initialize the build task queue
         self._init_queue(install_deps, install_package)
 
-        # Proceed with the installation
-        while self.build_pq:
+        # Download the sources of the queued packages while others build.
+        # The processes downloading them are forked before any thread is
+        # started.
+        if fetch_ahead > 0 and not (cache_only or fake):
+            self._start_fetches(fetch_ahead, use_cache)
+
+        # Split the core budget between the builds and, if more than one
+        # build can run at a time, set up the threads waiting on them.
+        self.concurrent_builds = concurrent_builds
+        self.build_jobs = _build_jobs_per_build(concurrent_builds, jobs_total)
+        if concurrent_builds > 1:
+            tty.debug('Running up to {0} builds with {1} jobs each'
+                      .format(concurrent_builds, self.build_jobs))
+            self.build_pool = multiprocessing.pool.ThreadPool(
+                concurrent_builds)
+
+        try:
+            self._install_tasks(**kwargs)
+        except BaseException:
+            # Stop the builds still running rather than waiting for them
+            for process, _ in self.build_children.values():
+                process.terminate()
+            raise
+        finally:
+            # The threads of the pool return once their build is finished
+            if self.build_pool is not None:
+                self.build_pool.close()
+                self.build_pool.join()
+                self.build_pool = None
+                self.build_children = {}
+
+            # Drop the downloads of packages that were not built, e.g.,
+            # because one of their dependencies failed.
+            if self.fetch_pool is not None:
+                self.fetch_pool.terminate()
+                self.fetch_pool.join()
+                self.fetch_pool = None
+                self.fetches = {}
+                _packages_to_fetch.clear()
+
+        # Cleanup, which includes releasing all of the read locks
+        self._cleanup_all_tasks()
+
+        # Ensure we properly report if the original/explicit pkg is failed
+        if self.pkg_id in self.failed:
+            msg = ('Installation of {0} failed.  Review log for details'
+                   .format(self.pkg_id))
+            raise InstallError(msg)
+
+    install.__doc__ += install_args_docstring
+
+    def _install_tasks(self, **kwargs):
+        """
+        Process the build tasks until the queue is empty and all of the
+        background builds are finished.
+
+        Args:"""
+
+        keep_prefix = kwargs.get('keep_prefix', False)
+        keep_stage = kwargs.get('keep_stage', False)
+        restage = kwargs.get('restage', False)
+
+        while self.build_pq or self.building:
+            # Wait for a background build to finish if no other build can be
+            # started, either because all of the build slots are in use or
+            # because the remaining tasks depend on packages being built.
+            if self.building and (
+                    len(self.building) >= self.concurrent_builds or
+                    not self._next_is_ready()):
+                task, result, exc = self._wait_for_build()
+                self._complete_task(task, result, exc, keep_prefix)
+                continue
+
             task = self._pop_task()
             if task is None:
                 continue
@@ -1454,6 +1852,7 @@ def install(self, **kwargs):
                 continue
 
             # Determine state of installation artifacts and adjust accordingly.
+            self._wait_for_fetch(pkg_id)
             self._prepare_for_install(task, keep_prefix, keep_stage,
                                       restage)
 
@@ -1493,8 +1892,13 @@ def install(self, **kwargs):
 
             # Proceed with the installation since we have an exclusive write
             # lock on the package.
+            building = False
             try:
-                self._install_task(task, **kwargs)
+                building = self._install_task(task, **kwargs)
+                if building:
+                    self.building[pkg_id] = task
+                    continue
+
                 self._update_installed(task)
 
                 # If we installed then we should keep the prefix
@@ -1518,30 +1922,24 @@ def install(self, **kwargs):
                     raise
 
             finally:
-                # Remove the install prefix if anything went wrong during
-                # install.
-                if not keep_prefix:
-                    pkg.remove_prefix()
-
-                # The subprocess *may* have removed the build stage. Mark it
-                # not created so that the next time pkg.stage is invoked, we
-                # check the filesystem for it.
-                pkg.stage.created = False
+                # The outcome of a background build is handled once it is
+                # finished (see _complete_task).
+                if not building:
+                    # Remove the install prefix if anything went wrong during
+                    # install.
+                    if not keep_prefix:
+                        pkg.remove_prefix()
+
+                    # The subprocess *may* have removed the build stage. Mark
+                    # it not created so that the next time pkg.stage is
+                    # invoked, we check the filesystem for it.
+                    pkg.stage.created = False
 
             # Perform basic task cleanup for the installed spec to
             # include downgrading the write to a read lock
             self._cleanup_task(pkg)
 
-        # Cleanup, which includes releasing all of the read locks
-        self._cleanup_all_tasks()
-
-        # Ensure we properly report if the original/explicit pkg is failed
-        if self.pkg_id in self.failed:
-            msg = ('Installation of {0} failed.  Review log for details'
-                   .format(self.pkg_id))
-            raise InstallError(msg)
-
-    install.__doc__ += install_args_docstring
+    _install_tasks.__doc__ += install_args_docstring
 
     # Helper method to "smooth" the transition from the
     # spack.package.PackageBase class
@@ -21,20 +21,17 @@
 import warnings
 from six import StringIO
 
-import llnl.util.cpu
 import llnl.util.filesystem as fs
 import llnl.util.tty as tty
 import llnl.util.tty.color as color
-from llnl.util.tty.log import log_output
 
+# Most of Spack is imported only when it is needed, in the functions below,
+# so that commands like ``spack --print-shell-vars``, which runs whenever a
+# shell sources ``setup-env.sh``, start fast.  ``spack debug import-time``
+# reports what each command imports.
 import spack
-import spack.architecture
 import spack.config
-import spack.cmd
-import spack.environment as ev
 import spack.paths
-import spack.repo
-import spack.store
 import spack.util.debug
 import spack.util.path
 import spack.util.executable as exe
@@ -106,10 +103,25 @@ def set_working_dir():
 
 def add_all_commands(parser):
     """Add all spack subcommands to the parser."""
+    import spack.cmd
     for cmd in spack.cmd.all_commands():
         parser.add_command(cmd)
 
 
+def may_have_environment(args):
+    """Whether ``spack.environment.find_environment()`` may find an
+    environment to activate.
+
+    Spack environments import most of Spack, so they are imported only if
+    an environment is given on the command line, in the working directory
+    or in the shell.
+    """
+    return bool(getattr(args, 'env', None) or
+                getattr(args, 'env_dir', None) or
+                os.path.exists('spack.yaml') or
+                os.environ.get('SPACK_ENV'))
+
+
 def get_version():
     """Get a descriptive version of this instance of Spack.
 
@@ -141,6 +153,7 @@ def get_version():
 
 def index_commands():
     """create an index of commands by section for this help level"""
+    import spack.cmd
     index = {}
     for command in spack.cmd.all_commands():
         cmd_module = spack.cmd.get_module(command)
@@ -201,6 +214,7 @@ def format_help_sections(self, level):
             self.actions = self._subparsers._actions[-1]._get_subactions()
 
         # make a set of commands not yet added.
+        import spack.cmd
         remaining = set(spack.cmd.all_commands())
 
         def add_group(group):
@@ -310,6 +324,7 @@ def add_command(self, cmd_name):
 
         # each command module implements a parser() function, to which we
         # pass its subparser for setup.
+        import spack.cmd
         module = spack.cmd.get_module(cmd_name)
 
         # build a list of aliases
@@ -453,8 +468,9 @@ def setup_main_options(args):
         spack.config.set('config:locks', False, scope='command_line')
 
     if args.mock:
-        rp = spack.repo.RepoPath(spack.paths.mock_packages_path)
-        spack.repo.set_path(rp)
+        import spack.repo as repo
+        rp = repo.RepoPath(spack.paths.mock_packages_path)
+        repo.set_path(rp)
 
     # If the user asked for it, don't check ssl certs.
     if args.insecure:
@@ -537,6 +553,8 @@ def __call__(self, *argv, **kwargs):
 
         fail_on_error = kwargs.get('fail_on_error', True)
 
+        from llnl.util.tty.log import log_output
+
         out = StringIO()
         try:
             with log_output(out):
@@ -614,6 +632,7 @@ def print_setup_info(*info):
     invoke spack in login scripts, and it needs to be quick.
 
     """
+    import spack.architecture
     shell = 'csh' if 'csh' in info else 'sh'
 
     def shell_set(var, value):
@@ -662,6 +681,8 @@ def shell_set(var, value):
     # print environment module system if available. This can be expensive
     # on clusters, so skip it if not needed.
     if 'modules' in info:
+        import llnl.util.cpu
+        import spack.store
         generic_arch = llnl.util.cpu.host().family
         module_spec = 'environment-modules target={0}'.format(generic_arch)
         specs = spack.store.db.query(module_spec)
@@ -698,7 +719,8 @@ def main(argv=None):
             os.environ[var] = os.environ[stored_var_name]
 
     # activate an environment if one was specified on the command line
-    if not args.no_env:
+    if not args.no_env and may_have_environment(args):
+        import spack.environment as ev
         env = ev.find_environment(args)
         if env:
             ev.activate(env, args.use_env_repo)
@@ -782,6 +804,15 @@ def main(argv=None):
             traceback.print_exc()
         return e.code
 
+    finally:
+        # Reading the configuration fails again if the command failed
+        # because of it, and must not hide the original error.
+        import spack.util.lock as lk
+        try:
+            lk.save_statistics()
+        except Exception as e:
+            tty.debug('Cannot save the statistics of locks: {0}'.format(e))
+
 
 class SpackCommandError(Exception):
     """Raised when SpackCommand execution fails."""
@@ -16,6 +16,8 @@
 import traceback
 import os.path
 import operator
+import multiprocessing
+import multiprocessing.pool
 
 import six
 
@@ -401,7 +403,11 @@ def get_matching_versions(specs, num_versions=1):
     return matching
 
 
-def create(path, specs):
+#: Default number of packages added concurrently to a mirror
+default_jobs = 8
+
+
+def create(path, specs, jobs=None):
     """Create a directory to be used as a spack mirror, and fill it with
     package archives.
 
@@ -409,6 +415,8 @@ def create(path, specs):
         path: Path to create a mirror directory hierarchy in.
         specs: Any package versions matching these specs will be added \
             to the mirror.
+        jobs: Number of packages whose archives are downloaded at the \
+            same time (by default, ``default_jobs``).
 
     Return Value:
         Returns a tuple of lists: (present, mirrored, error)
@@ -420,6 +428,12 @@ def create(path, specs):
     This routine iterates through all known package versions, and
     it creates specs for those versions.  If the version satisfies any spec
     in the specs list, it is downloaded and added to the mirror.
+
+    Packages are added to the mirror concurrently, while the specs of the
+    same package are added one after another since they share their stage
+    and patches.  Archives shared by several packages are only downloaded
+    once, and archives already in the mirror are neither downloaded nor
+    checked again.
     """
     parsed = url_util.parse(path)
     mirror_root = url_util.local_file_path(parsed)
@@ -440,20 +454,106 @@ def create(path, specs):
             raise MirrorError(
                 "Cannot create directory '%s':" % mirror_root, str(e))
 
+    # Group the specs by package, as each group is mirrored by one process
+    specs_by_package = OrderedDict()
+    for spec in specs:
+        specs_by_package.setdefault(spec.name, []).append(spec)
+    packages_specs = list(specs_by_package.values())
+
     mirror_cache = spack.caches.MirrorCache(mirror_root)
     mirror_stats = MirrorStats()
     try:
         spack.caches.mirror_cache = mirror_cache
         # Iterate through packages and download all safe tarballs for each
-        for spec in specs:
-            mirror_stats.next_spec(spec)
-            add_single_spec(spec, mirror_root, mirror_stats)
+        all_stats = _add_in_parallel(packages_specs, mirror_root, jobs)
+        if all_stats is None:
+            all_stats = [_add_package_specs(package_specs, mirror_root)
+                         for package_specs in packages_specs]
+
+        for package_stats in all_stats:
+            mirror_stats.merge(package_stats)
     finally:
         spack.caches.mirror_cache = None
 
     return mirror_stats.stats()
 
 
+def _add_package_specs(package_specs, mirror_root):
+    """Add the specs of one package to the mirror, one after another."""
+    package_stats = MirrorStats()
+    for spec in package_specs:
+        package_stats.next_spec(spec)
+        add_single_spec(spec, mirror_root, package_stats)
+    return package_stats
+
+
+#: Specs of each package and mirror root, inherited by the forked workers
+_packages_to_add = None
+
+
+def _add_package_specs_task(index):
+    """Add the specs of a package to the mirror in a worker process.
+
+    Returns:
+        (tuple): the ``present`` and ``new`` tallies and the ``errors`` of
+            the specs of the package, by index in its list of specs
+    """
+    packages_specs, mirror_root = _packages_to_add
+    package_specs = packages_specs[index]
+    package_stats = _add_package_specs(package_specs, mirror_root)
+    package_stats._tally_current_spec()
+
+    # The parent process has the same specs, so only their index is sent
+    positions = dict((spec, i) for i, spec in enumerate(package_specs))
+    return (
+        dict((positions[s], n) for s, n in package_stats.present.items()),
+        dict((positions[s], n) for s, n in package_stats.new.items()),
+        [positions[s] for s in package_stats.errors])
+
+
+def _add_in_parallel(packages_specs, mirror_root, jobs=None):
+    """Add the specs of several packages to the mirror in a pool of
+    processes, one package per task.
+
+    Fetchers change the working directory of the process, so packages
+    cannot be fetched by several threads of the same process.
+
+    Returns:
+        (list or None): the ``MirrorStats`` of each package, or None if the
+            packages have to be added sequentially
+    """
+    global _packages_to_add
+    jobs = min(jobs or default_jobs, len(packages_specs))
+
+    # Workers need the configuration and the mirror cache of this process,
+    # so they are forked. Daemonic processes cannot have children.
+    if (jobs < 2 or multiprocessing.current_process().daemon
+            or (sys.version_info >= (3, 4) and
+                multiprocessing.get_start_method() != 'fork')):
+        return None
+
+    _packages_to_add = (packages_specs, mirror_root)
+    pool = multiprocessing.pool.Pool(jobs)
+    try:
+        results = pool.map(
+            _add_package_specs_task, range(len(packages_specs)), 1)
+    finally:
+        pool.terminate()
+        pool.join()
+        _packages_to_add = None
+
+    all_stats = []
+    for package_specs, (present, new, errors) in zip(packages_specs, results):
+        package_stats = MirrorStats()
+        package_stats.present = dict(
+            (package_specs[i], n) for i, n in present.items())
+        package_stats.new = dict(
+            (package_specs[i], n) for i, n in new.items())
+        package_stats.errors = set(package_specs[i] for i in errors)
+        all_stats.append(package_stats)
+    return all_stats
+
+
 class MirrorStats(object):
     def __init__(self):
         self.present = {}
@@ -494,6 +594,14 @@ def added(self, resource):
     def error(self):
         self.errors.add(self.current_spec)
 
+    def merge(self, other):
+        """Add the tallies of other, e.g. of the specs added by another
+        process, to these ones."""
+        other._tally_current_spec()
+        self.present.update(other.present)
+        self.new.update(other.new)
+        self.errors.update(other.errors)
+
 
 def add_single_spec(spec, mirror_root, mirror_stats):
     tty.msg("Adding package {pkg} to mirror".format(
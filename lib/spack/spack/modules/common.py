@@ -31,13 +31,17 @@
 import collections
 import copy
 import datetime
+import hashlib
 import inspect
+import json
+import multiprocessing
+import multiprocessing.pool
 import os.path
 import re
+import sys
 
 import llnl.util.filesystem
 import llnl.util.tty as tty
-import spack.build_environment as build_environment
 import spack.error
 import spack.paths
 import spack.schema.environment
@@ -48,6 +52,20 @@
 import spack.util.spack_yaml as syaml
 
 
+#: Name of the file, in the root of each type of module files, holding the
+#: hash of the inputs of each module file when it was last written
+module_inputs_filename = 'module-inputs.json'
+
+#: Minimum number of module files to write them in a pool of processes
+parallel_write_threshold = 16
+
+#: Writers of the module files that the processes of a pool write
+_pool_writers = []
+
+#: Templates referenced by each template, by path and modification time
+_referenced_templates = {}
+
+
 #: config section for this file
 def configuration():
     return spack.config.get('modules', {})
@@ -235,6 +253,142 @@ def generate_module_index(root, modules):
         syaml.dump(index, default_flow_style=False, stream=index_file)
 
 
+def read_module_inputs(root):
+    """Read the hash of the inputs of each module file under a root, as of
+    the last time it was written.
+
+    Args:
+        root: root folder of a type of module files
+
+    Returns:
+        dict: the hashes, by DAG hash of the spec of the module file
+    """
+    inputs_path = os.path.join(root, module_inputs_filename)
+    try:
+        with open(inputs_path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        tty.debug('Cannot read the inputs of module files in {0}: {1}'
+                  .format(inputs_path, str(e)))
+        return {}
+
+
+def write_module_inputs(root, inputs):
+    """Write the hash of the inputs of each module file under a root.
+
+    Args:
+        root: root folder of a type of module files
+        inputs (dict): the hashes, by DAG hash of the spec of the module file
+    """
+    inputs_path = os.path.join(root, module_inputs_filename)
+    tmp_path = inputs_path + '.tmp'
+    llnl.util.filesystem.mkdirp(root)
+    with open(tmp_path, 'w') as f:
+        json.dump(inputs, f, sort_keys=True)
+    os.rename(tmp_path, inputs_path)
+
+
+def _template_mtimes(name):
+    """Modification time of a template and of the templates it extends,
+    includes or imports, by name.  Templates that are not found are left
+    out.
+    """
+    import jinja2
+    import jinja2.meta
+
+    env = tengine.shared_environment()
+    mtimes, names = {}, [name]
+    while names:
+        name = names.pop()
+        if name in mtimes:
+            continue
+        try:
+            source, filename, _ = env.loader.get_source(env, name)
+        except jinja2.TemplateNotFound:
+            continue
+
+        mtime = os.path.getmtime(filename)
+        mtimes[name] = mtime
+        key = (filename, mtime)
+        if key not in _referenced_templates:
+            referenced = jinja2.meta.find_referenced_templates(
+                env.parse(source))
+            _referenced_templates[key] = [x for x in referenced if x]
+        names.extend(_referenced_templates[key])
+    return mtimes
+
+
+def _write(writer):
+    """Write a module file, overwriting it.  Return the error, if any."""
+    try:
+        writer.write(overwrite=True)
+    except Exception as e:
+        tty.debug(e)
+        return str(e)
+    return None
+
+
+def _write_task(index):
+    """Write a module file in a worker process."""
+    try:
+        return _write(_pool_writers[index])
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        # Errors exiting the worker, like tty.die, would hang the pool
+        tty.debug(e)
+        return '{0}: {1}'.format(type(e).__name__, e)
+
+
+def write_module_files(writers, jobs=None):
+    """Write the module files of several writers, overwriting existing
+    files.
+
+    When there are many module files, they are written by a pool of
+    processes.  The processes are forked after the templates are compiled,
+    so that they share them.
+
+    Args:
+        writers (list): writers of the module files
+        jobs (int): maximum number of processes (default: the number of
+            cores)
+
+    Returns:
+        list: the error of each writer, or None if its module file was
+            written
+    """
+    global _pool_writers
+    jobs = min(jobs or multiprocessing.cpu_count(), len(writers))
+
+    # Workers use the writers of this process, so they are forked.
+    # Daemonic processes (e.g., in a pool) cannot have children.
+    if (jobs < 2 or len(writers) < parallel_write_threshold
+            or multiprocessing.current_process().daemon
+            or (sys.version_info >= (3, 4) and
+                multiprocessing.get_start_method() != 'fork')):
+        return [_write(x) for x in writers]
+
+    import jinja2
+    env = tengine.shared_environment()
+    for template_name in set(x._get_template() for x in writers):
+        try:
+            env.get_template(template_name)
+        except jinja2.TemplateNotFound:
+            # Reported by the writers
+            pass
+
+    tty.debug('Writing {0} module files in {1} processes'.format(
+        len(writers), jobs))
+    _pool_writers = writers
+    pool = multiprocessing.pool.Pool(jobs)
+    try:
+        return pool.map(_write_task, range(len(writers)))
+    finally:
+        pool.terminate()
+        pool.join()
+        _pool_writers = []
+
+
 def _generate_upstream_module_index():
     module_indices = read_module_indices()
 
@@ -639,6 +793,8 @@ def configure_options(self):
     @tengine.context_property
     def environment_modifications(self):
         """List of environment modifications to be processed."""
+        import spack.build_environment as build_environment
+
         # Modifications guessed inspecting the spec prefix
         env = spack.util.environment.inspect_path(
             self.spec.prefix,
@@ -749,6 +905,39 @@ def _get_template(self):
         # ... and return the first match
         return choices.pop(0)
 
+    def inputs_hash(self):
+        """Hash of the inputs of the module file.
+
+        These are the spec, its configuration of module files, the settings
+        shared by all the module files of its type, the names of the module
+        files it loads or requires, and the templates the module file is
+        rendered from.  The module file needs to be written again when the
+        hash changes.
+        """
+        template_name = self._get_template()
+        # The names of the module files of the dependencies depend on
+        # their own configuration, not on the one of this spec
+        dependencies = [self.module.make_layout(x).use_name
+                        for x in self.conf.specs_to_load +
+                        self.conf.specs_to_prereq]
+        settings = dict((key, value) for key, value
+                        in self.module.configuration().items()
+                        if not isinstance(value, dict))
+        inputs = {
+            'spec': self.spec.dag_hash(),
+            'configuration': self.conf.conf,
+            'settings': settings,
+            'dependencies': dependencies,
+            'prefix_inspections': spack.config.get(
+                'modules:prefix_inspections', {}),
+            'filename': self.layout.filename,
+            'template': template_name,
+            'templates': _template_mtimes(template_name),
+            'spack': spack.spack_version,
+        }
+        text = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
     def write(self, overwrite=False):
         """Writes the module file.
 
@@ -786,7 +975,7 @@ def write(self, overwrite=False):
         template_name = self._get_template()
         import jinja2
         try:
-            env = tengine.make_environment()
+            env = tengine.shared_environment()
             template = env.get_template(template_name)
         except jinja2.TemplateNotFound:
             # If the template was not found raise an exception with a little
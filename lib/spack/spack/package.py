@@ -45,7 +45,6 @@
 import spack.repo
 import spack.url
 import spack.util.environment
-import spack.util.web
 import spack.multimethod
 
 from llnl.util.filesystem import mkdirp, touch, working_dir
@@ -2012,6 +2011,7 @@ def fetch_remote_versions(self):
         if not self.all_urls:
             return {}
 
+        import spack.util.web
         try:
             return spack.util.web.find_versions_of_archive(
                 self.all_urls, self.list_url, self.list_depth)
@@ -12,9 +12,7 @@
 import llnl.util.lang
 
 import spack.error
-import spack.fetch_strategy as fs
 import spack.repo
-import spack.stage
 import spack.util.spack_json as sjson
 import spack
 
@@ -188,6 +186,8 @@ def fetch(self):
         Args:
             stage: stage for the package that needs to be patched
         """
+        import spack.fetch_strategy as fs
+
         self.stage.create()
         self.stage.fetch()
         self.stage.check()
@@ -223,6 +223,9 @@ def fetch(self):
 
     @property
     def stage(self):
+        import spack.fetch_strategy as fs
+        import spack.stage
+
         if self._stage:
             return self._stage
 
@@ -264,6 +267,8 @@ def to_dict(self):
 
 def from_dict(dictionary):
     """Create a patch from json dictionary."""
+    import spack.fetch_strategy as fs
+
     owner = dictionary.get('owner')
     if 'owner' not in dictionary:
         raise ValueError('Invalid patch dictionary: %s' % dictionary)
@@ -364,6 +369,17 @@ def patch_for_package(self, sha256, pkg):
 
     def update_package(self, pkg_fullname):
         # remove this package from any patch entries that reference it.
+        self.remove_package(pkg_fullname)
+
+        # update the index with per-package patch indexes
+        pkg = spack.repo.get(pkg_fullname)
+        partial_index = self._index_patches(pkg)
+        for sha256, package_to_patch in partial_index.items():
+            p2p = self.index.setdefault(sha256, {})
+            p2p.update(package_to_patch)
+
+    def remove_package(self, pkg_fullname):
+        """Remove the patches owned by a package from the index."""
         empty = []
         for sha256, package_to_patch in self.index.items():
             remove = []
@@ -381,13 +397,6 @@ def update_package(self, pkg_fullname):
         for sha256 in empty:
             del self.index[sha256]
 
-        # update the index with per-package patch indexes
-        pkg = spack.repo.get(pkg_fullname)
-        partial_index = self._index_patches(pkg)
-        for sha256, package_to_patch in partial_index.items():
-            p2p = self.index.setdefault(sha256, {})
-            p2p.update(package_to_patch)
-
     def update(self, other):
         """Update this cache with the contents of another."""
         for sha256, package_to_patch in other.index.items():
@@ -4,12 +4,18 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 
+import json
+import mmap
+import multiprocessing.pool
 import os
+import platform
 import re
 import shutil
-import platform
+import struct
+import threading
 import spack.repo
 import spack.cmd
+import spack.util.elf as elf
 import llnl.util.lang
 from spack.util.executable import Executable, ProcessError
 import llnl.util.tty as tty
@@ -41,6 +47,16 @@ def __init__(self, file_path, old_len, new_len):
             (file_path, old_len, new_len))
 
 
+class RPathReplacementException(spack.error.SpackError):
+    """
+    Raised when patchelf fails to replace the RPATH of an ELF binary.
+    """
+
+    def __init__(self, file_path, error):
+        super(RPathReplacementException, self).__init__(
+            "patchelf --set-rpath %s failed:\n%s" % (file_path, error))
+
+
 class MissingMacholibException(spack.error.SpackError):
     """
     Raised when the size of the file changes after binary path substitution.
@@ -59,6 +75,10 @@ def __init__(self, error):
             % error)
 
 
+#: Keeps binaries relocated concurrently from installing patchelf together
+_patchelf_lock = threading.Lock()
+
+
 def get_patchelf():
     """
     Builds and installs spack patchelf package on linux platforms
@@ -74,19 +94,32 @@ def get_patchelf():
             return None
         if str(spack.architecture.platform()) == 'darwin':
             return None
-        patchelf_spec = spack.cmd.parse_specs("patchelf", concretize=True)[0]
-        patchelf = spack.repo.get(patchelf_spec)
-        if not patchelf.installed:
-            patchelf.do_install(use_cache=False)
+        with _patchelf_lock:
+            patchelf_spec = spack.cmd.parse_specs(
+                "patchelf", concretize=True)[0]
+            patchelf = spack.repo.get(patchelf_spec)
+            if not patchelf.installed:
+                patchelf.do_install(use_cache=False)
         patchelf_executable = os.path.join(patchelf.prefix.bin, "patchelf")
         return patchelf_executable
 
 
-def get_existing_elf_rpaths(path_name):
+def get_existing_elf_rpaths(path_name, entries=None):
     """
     Return the RPATHS returned by patchelf --print-rpath path_name
     as a list of strings.
+
+    The RPATHS are read by Spack, and patchelf is only run on the files
+    that Spack cannot parse.  The search path entries of the file recorded
+    when it was packaged, if given, spare parsing it.
     """
+    try:
+        rpath = elf.get_rpath(path_name, entries)
+    except (elf.ElfParsingError, IOError, OSError) as e:
+        tty.debug('Cannot read the RPATHS of %s: %s' % (path_name, str(e)))
+    else:
+        # patchelf fails on files that are not dynamically linked
+        return rpath.split(':') if rpath is not None else []
 
     # if we're relocating patchelf itself, use it
 
@@ -330,13 +363,28 @@ def strings_contains_installroot(path_name, root_dir):
     return (root_dir in output or spack.paths.prefix in output)
 
 
-def modify_elf_object(path_name, new_rpaths):
+def modify_elf_object(path_name, new_rpaths, entries=None):
     """
     Replace orig_rpath with new_rpath in RPATH of elf object path_name
+
+    The RPATH is overwritten in place when the new one is not longer than
+    the old one, and patchelf is only run to make room for longer RPATHS.
+    The search path entries of the file recorded when it was packaged, if
+    given, spare parsing it.
+
+    Returns whether the RPATH was overwritten in place, which leaves
+    everything else in the file where it was.
     """
 
     new_joined = ':'.join(new_rpaths)
 
+    try:
+        if elf.set_rpath_in_place(path_name, new_joined, entries=entries):
+            return True
+    except (elf.ElfParsingError, IOError, OSError) as e:
+        tty.debug('Cannot replace the RPATH of %s in place: %s' %
+                  (path_name, str(e)))
+
     # if we're relocating patchelf itself, use it
 
     if path_name[-13:] == "/bin/patchelf":
@@ -350,9 +398,8 @@ def modify_elf_object(path_name, new_rpaths):
         patchelf('--force-rpath', '--set-rpath', '%s' % new_joined,
                  '%s' % path_name, output=str, error=str)
     except ProcessError as e:
-        tty.die('patchelf --set-rpath %s failed' %
-                path_name, e)
-        pass
+        raise RPathReplacementException(path_name, str(e))
+    return False
 
 
 def needs_binary_relocation(m_type, m_subtype):
@@ -361,6 +408,7 @@ def needs_binary_relocation(m_type, m_subtype):
     """
     if m_type == 'application':
         if (m_subtype == 'x-executable' or m_subtype == 'x-sharedlib' or
+                m_subtype == 'x-pie-executable' or
                 m_subtype == 'x-mach-binary'):
             return True
     return False
@@ -373,60 +421,350 @@ def needs_text_relocation(m_type, m_subtype):
     return (m_type == "text")
 
 
-def replace_prefix_text(path_name, old_dir, new_dir):
+def _open_mmap(f, access):
+    """Memory map the whole file f, or return None if it is empty."""
+    try:
+        return mmap.mmap(f.fileno(), 0, access=access)
+    except ValueError:
+        # empty files cannot be mapped
+        return None
+
+
+def _prefix_text_pattern(old_dirs):
     """
-    Replace old install prefix with new install prefix
-    in text files using utf-8 encoded strings.
+    Regex matching any of old_dirs where it appears at the beginning of a
+    path.  The longest of old_dirs that matches is preferred.
+    """
+    # Negative lookbehind for a character legal in a path
+    # Then a match group for any characters legal in a compiler flag
+    # Then one of old_dirs
+    # Then characters legal in a path
+    # Ensures we only match an old_dir if it's precedeed by a flag or by
+    # characters not legal in a path, but not if it's preceeded by other
+    # components of a path.
+    alternatives = b'|'.join(
+        re.escape(d) for d in sorted(old_dirs, key=len, reverse=True))
+    return re.compile(
+        b'(?<![\\w\\-_/])([\\w\\-_]*?)(%s)([\\w\\-_/]*)' % alternatives)
+
+
+def _text_old_dirs(oldpath, oldprefix):
+    """
+    The old prefixes that relocate_text replaces, encoded, longest first.
+    """
+    sbangre = '#!/bin/bash %s/bin/sbang' % oldprefix
+    old_dirs = set(d.encode('utf-8') for d in (oldpath, sbangre, oldprefix))
+    return sorted(old_dirs, key=len, reverse=True)
+
+
+def text_prefix_offsets(path_name, oldpath, oldprefix):
+    """
+    Offsets of the old prefixes that relocate_text replaces in the text
+    file path_name.  They are recorded when the file is packaged, so that
+    it is not scanned again when it is relocated.
+    """
+    old_dirs = _text_old_dirs(oldpath, oldprefix)
+    with open(path_name, 'rb') as f:
+        data = _open_mmap(f, mmap.ACCESS_READ)
+        if data is None:
+            return []
+
+        try:
+            if not any(data.find(old) >= 0 for old in old_dirs):
+                return []
+            pattern = _prefix_text_pattern(old_dirs)
+            return [m.start(2) for m in pattern.finditer(data)]
+        finally:
+            data.close()
+
+
+def _replace_prefixes_text(path_name, prefixes, pattern):
+    """
+    Replace the old prefixes in the keys of prefixes with the new ones in
+    their values, in the text file path_name, in a single scan of the file.
+    The file is only written if an old prefix is found.
+
+    Returns the number of bytes scanned and rewritten.
     """
     with open(path_name, 'rb+') as f:
-        data = f.read()
+        data = _open_mmap(f, mmap.ACCESS_READ)
+        if data is None:
+            return 0, 0
+
+        try:
+            scanned = len(data)
+            if not any(data.find(old) >= 0 for old in prefixes):
+                return scanned, 0
+
+            ndata, count = pattern.subn(
+                lambda m: m.group(1) + prefixes[m.group(2)] + m.group(3),
+                data)
+        finally:
+            data.close()
+
+        if not count:
+            return scanned, 0
         f.seek(0)
-        # Replace old_dir with new_dir if it appears at the beginning of a path
-        # Negative lookbehind for a character legal in a path
-        # Then a match group for any characters legal in a compiler flag
-        # Then old_dir
-        # Then characters legal in a path
-        # Ensures we only match the old_dir if it's precedeed by a flag or by
-        # characters not legal in a path, but not if it's preceeded by other
-        # components of a path.
-        old_bytes = old_dir.encode('utf-8')
-        pat = b'(?<![\\w\\-_/])([\\w\\-_]*?)%s([\\w\\-_/]*)' % old_bytes
-        repl = b'\\1%s\\2' % new_dir.encode('utf-8')
-        ndata = re.sub(pat, repl, data)
         f.write(ndata)
         f.truncate()
+    return scanned, len(ndata)
 
 
-def replace_prefix_bin(path_name, old_dir, new_dir):
-    """
-    Attempt to replace old install prefix with new install prefix
-    in binary files by prefixing new install prefix with os.sep
-    until the lengths of the prefixes are the same.
+def _replace_prefixes_text_at(path_name, prefixes, old_dirs, offsets):
     """
+    Replace the old prefixes like _replace_prefixes_text, at the offsets
+    of old_dirs recorded by text_prefix_offsets instead of scanning the
+    file.  The file is only written if all the offsets are valid.
 
-    def replace(match):
-        occurances = match.group().count(old_dir.encode('utf-8'))
-        olen = len(old_dir.encode('utf-8'))
-        nlen = len(new_dir.encode('utf-8'))
-        padding = (olen - nlen) * occurances
-        if padding < 0:
-            return data
-        return match.group().replace(old_dir.encode('utf-8'),
-                                     new_dir.encode('utf-8')) + b'\0' * padding
+    Returns the number of bytes scanned and rewritten, or None if one of
+    old_dirs is not found at each offset.
+    """
+    if not offsets:
+        return 0, 0
 
     with open(path_name, 'rb+') as f:
-        data = f.read()
+        data = _open_mmap(f, mmap.ACCESS_READ)
+        if data is None:
+            return None
+
+        try:
+            chunks, start = [], 0
+            for offset in offsets:
+                if offset < start:
+                    return None
+                found = [old for old in old_dirs
+                         if data[offset:offset + len(old)] == old]
+                if not found:
+                    return None
+                # The longest old prefix that changes is replaced, as the
+                # ones that do not change are left out of the pattern
+                replaced = [old for old in found if old in prefixes]
+                if replaced:
+                    chunks.extend((data[start:offset], prefixes[replaced[0]]))
+                    start = offset + len(replaced[0])
+            if not chunks:
+                return 0, 0
+            chunks.append(data[start:])
+        finally:
+            data.close()
+
+        ndata = b''.join(chunks)
         f.seek(0)
-        original_data_len = len(data)
-        pat = re.compile(old_dir.encode('utf-8') + b'([^\0]*?)\0')
-        if not pat.search(data):
-            return
-        ndata = pat.sub(replace, data)
-        if not len(ndata) == original_data_len:
-            raise BinaryStringReplacementException(
-                path_name, original_data_len, len(ndata))
         f.write(ndata)
         f.truncate()
+    return 0, len(ndata)
+
+
+def _text_prefixes(pairs):
+    """
+    Encoded pairs of old and new prefixes to be replaced, without the
+    prefixes that do not change.  The first new prefix of an old one wins.
+    """
+    prefixes = {}
+    for old_dir, new_dir in pairs:
+        old_bytes = old_dir.encode('utf-8')
+        if old_dir != new_dir and old_bytes not in prefixes:
+            prefixes[old_bytes] = new_dir.encode('utf-8')
+    return prefixes
+
+
+def replace_prefix_text(path_name, old_dir, new_dir):
+    """
+    Replace old install prefix with new install prefix
+    in text files using utf-8 encoded strings.
+
+    Returns the number of bytes scanned and rewritten.
+    """
+    prefixes = _text_prefixes([(old_dir, new_dir)])
+    if not prefixes:
+        return 0, 0
+    return _replace_prefixes_text(
+        path_name, prefixes, _prefix_text_pattern(prefixes))
+
+
+def _nullterm_pattern(old_bytes):
+    """Regex matching the null terminated strings starting with old_bytes"""
+    return re.compile(re.escape(old_bytes) + b'([^\0]*?)\0')
+
+
+def _replace_nullterm_strings(path_name, data, strings, old_bytes, new_bytes):
+    """
+    Replace old_bytes with new_bytes in the null terminated strings of the
+    memory mapped file data, given as pairs of their offset and value,
+    padded with nulls to keep their length.
+
+    Returns the number of bytes rewritten.
+    """
+    occurances = sum(s.count(old_bytes) for _, s in strings)
+    padding = len(old_bytes) - len(new_bytes)
+    if padding < 0:
+        raise BinaryStringReplacementException(
+            path_name, len(data), len(data) - padding * occurances)
+
+    rewritten = 0
+    for start, string in strings:
+        new_string = string.replace(old_bytes, new_bytes)
+        new_string += b'\0' * (len(string) - len(new_string))
+        data[start:start + len(string)] = new_string
+        rewritten += len(string)
+    data.flush()
+    return rewritten
+
+
+def _replace_prefix_nullterm(path_name, old_dir, new_dir):
+    """
+    Replace old_dir with new_dir in the null terminated strings of
+    path_name, padded with nulls to keep their length.  Only the strings
+    containing old_dir are written, through a memory map of the file.
+
+    Returns the number of bytes scanned and rewritten.
+    """
+    old_bytes = old_dir.encode('utf-8')
+    new_bytes = new_dir.encode('utf-8')
+    with open(path_name, 'rb+') as f:
+        data = _open_mmap(f, mmap.ACCESS_WRITE)
+        if data is None:
+            return 0, 0
+
+        try:
+            scanned = len(data)
+            if data.find(old_bytes) < 0:
+                return scanned, 0
+
+            strings = [(m.start(), m.group())
+                       for m in _nullterm_pattern(old_bytes).finditer(data)]
+            if not strings:
+                return scanned, 0
+
+            rewritten = _replace_nullterm_strings(
+                path_name, data, strings, old_bytes, new_bytes)
+        finally:
+            data.close()
+    return scanned, rewritten
+
+
+def _replace_prefix_nullterm_at(path_name, old_dir, new_dir, offsets):
+    """
+    Replace old_dir with new_dir like _replace_prefix_nullterm, in the
+    strings at the offsets recorded by binary_relocation_offsets instead of
+    scanning the file.  The file is only written if all the offsets are
+    valid.
+
+    Returns the number of bytes scanned and rewritten, or None if a null
+    terminated string starting with old_dir is not found at each offset.
+    """
+    if not offsets:
+        return 0, 0
+
+    old_bytes = old_dir.encode('utf-8')
+    new_bytes = new_dir.encode('utf-8')
+    with open(path_name, 'rb+') as f:
+        data = _open_mmap(f, mmap.ACCESS_WRITE)
+        if data is None:
+            return None
+
+        try:
+            strings, start = [], 0
+            for offset in offsets:
+                end = data.find(b'\0', offset) if offset >= start else -1
+                if (end < 0 or
+                        data[offset:offset + len(old_bytes)] != old_bytes):
+                    return None
+                strings.append((offset, data[offset:end + 1]))
+                start = end + 1
+
+            rewritten = _replace_nullterm_strings(
+                path_name, data, strings, old_bytes, new_bytes)
+        finally:
+            data.close()
+    return 0, rewritten
+
+
+def binary_relocation_offsets(path_name, old_dir):
+    """
+    The search path entries of the ELF binary path_name, and the offsets
+    of its other null terminated strings that replace_prefix_bin replaces.
+    They are recorded when the binary is packaged, so that it is neither
+    parsed nor scanned again when it is relocated.
+
+    Returns the list of the search path entries, as lists, or None if the
+    file is not a dynamically linked ELF file, and the list of offsets.
+    """
+    try:
+        with open(path_name, 'rb') as f:
+            entries = elf.search_path_entries(f)
+    except (elf.ElfParsingError, IOError, OSError):
+        entries = None
+
+    # The search paths are relocated on their own
+    ranges = [(e.string_offset, e.string_offset + len(e.value.encode('utf-8')))
+              for e in entries or ()]
+    old_bytes = old_dir.encode('utf-8')
+    offsets = []
+    with open(path_name, 'rb') as f:
+        data = _open_mmap(f, mmap.ACCESS_READ)
+        if data is not None:
+            try:
+                if data.find(old_bytes) >= 0:
+                    offsets = [
+                        m.start()
+                        for m in _nullterm_pattern(old_bytes).finditer(data)
+                        if not any(b <= m.start() < e for b, e in ranges)]
+            finally:
+                data.close()
+
+    if entries is not None:
+        entries = [list(e) for e in entries]
+    return entries, offsets
+
+
+def _search_path_entries(entries):
+    """The SearchPathEntry of the entries recorded as lists."""
+    if entries is None:
+        return None
+    return [elf.SearchPathEntry(tag, value, offset, string_offset,
+                                str(tag_format))
+            for tag, value, offset, string_offset, tag_format in entries]
+
+
+def replace_prefix_bin(path_name, old_dir, new_dir, offsets=None):
+    """
+    Attempt to replace old install prefix with new install prefix
+    in binary files by prefixing new install prefix with os.sep
+    until the lengths of the prefixes are the same.
+
+    The offsets of the strings to replace recorded when the file was
+    packaged, if given, spare scanning it.
+
+    Returns the number of bytes scanned and rewritten.
+    """
+    if offsets is not None:
+        stats = _replace_prefix_nullterm_at(
+            path_name, old_dir, new_dir, offsets)
+        if stats is not None:
+            return stats
+        tty.debug('The strings to relocate in %s are not at their '
+                  'recorded offsets' % path_name)
+    return _replace_prefix_nullterm(path_name, old_dir, new_dir)
+
+
+def replace_prefix_bins(path_names, old_dir, new_dir, offsets=None):
+    """
+    Replace old install prefix with new install prefix in binary files,
+    like replace_prefix_bin, in a pool of threads.
+
+    offsets maps files to the offsets of the strings to replace in them,
+    recorded when they were packaged.
+
+    Returns a dictionary mapping each file to the number of bytes scanned
+    and rewritten in it.
+    """
+    path_names = list(path_names)
+    offsets = offsets or {}
+    return dict(zip(path_names, _map_files(
+        lambda path_name: replace_prefix_bin(
+            path_name, old_dir, new_dir, offsets.get(path_name)),
+        path_names)))
 
 
 def replace_prefix_nullterm(path_name, old_dir, new_dir):
@@ -435,30 +773,10 @@ def replace_prefix_nullterm(path_name, old_dir, new_dir):
     in binary files by replacing with null terminated string
     that is the same length unless the old path is shorter
     Used on linux to replace mach-o rpaths
-    """
 
-    def replace(match):
-        occurances = match.group().count(old_dir.encode('utf-8'))
-        olen = len(old_dir.encode('utf-8'))
-        nlen = len(new_dir.encode('utf-8'))
-        padding = (olen - nlen) * occurances
-        if padding < 0:
-            return data
-        return match.group().replace(old_dir.encode('utf-8'),
-                                     new_dir.encode('utf-8')) + b'\0' * padding
-    with open(path_name, 'rb+') as f:
-        data = f.read()
-        f.seek(0)
-        original_data_len = len(data)
-        pat = re.compile(old_dir.encode('utf-8') + b'([^\0]*?)\0')
-        if not pat.search(data):
-            return
-        ndata = pat.sub(replace, data)
-        if not len(ndata) == original_data_len:
-            raise BinaryStringReplacementException(
-                path_name, original_data_len, len(ndata))
-        f.write(ndata)
-        f.truncate()
+    Returns the number of bytes scanned and rewritten.
+    """
+    return _replace_prefix_nullterm(path_name, old_dir, new_dir)
 
 
 def relocate_macho_binaries(path_names, old_dir, new_dir, allow_root):
@@ -506,30 +824,64 @@ def relocate_macho_binaries(path_names, old_dir, new_dir, allow_root):
                      (path_name, new_dir, old_dir))
 
 
-def relocate_elf_binaries(path_names, old_dir, new_dir, allow_root):
+def _relocate_elf_binary(path_name, old_dir, new_dir, placeholder,
+                         entries=None, offsets=None):
+    """
+    Change old_dir or its placeholder to new_dir in the RPATHs of
+    path_name, and old_dir to new_dir in its strings
+
+    The search path entries and the offsets of the other strings to
+    replace recorded when the file was packaged, if given, spare parsing
+    and scanning it.
+    """
+    entries = _search_path_entries(entries)
+    orig_rpaths = get_existing_elf_rpaths(path_name, entries)
+    if orig_rpaths:
+        # one pass to replace placeholder
+        n_rpaths = substitute_rpath(orig_rpaths,
+                                    placeholder, new_dir)
+        # one pass to replace old_dir
+        new_rpaths = substitute_rpath(n_rpaths,
+                                      old_dir, new_dir)
+        if not modify_elf_object(path_name, new_rpaths, entries):
+            # patchelf may have moved the strings
+            offsets = None
+        if not new_dir == old_dir:
+            if len(new_dir) <= len(old_dir):
+                replace_prefix_bin(path_name, old_dir, new_dir, offsets)
+            else:
+                tty.warn('Cannot do a binary string replacement'
+                         ' with padding for %s'
+                         ' because %s is longer than %s.' %
+                         (path_name, new_dir, old_dir))
+
+
+def relocate_elf_binaries(path_names, old_dir, new_dir, allow_root,
+                          rpath_entries=None, offsets=None):
     """
     Change old_dir to new_dir in RPATHs of elf binaries
     Account for the case where old_dir is now a placeholder
+
+    rpath_entries and offsets map binaries to their search path entries
+    and to the offsets of their other strings to replace, as recorded by
+    binary_relocation_offsets when they were packaged.
+
+    The binaries are relocated concurrently, in a pool of threads.
     """
     placeholder = set_placeholder(old_dir)
-    for path_name in path_names:
-        orig_rpaths = get_existing_elf_rpaths(path_name)
-        if orig_rpaths:
-            # one pass to replace placeholder
-            n_rpaths = substitute_rpath(orig_rpaths,
-                                        placeholder, new_dir)
-            # one pass to replace old_dir
-            new_rpaths = substitute_rpath(n_rpaths,
-                                          old_dir, new_dir)
-            modify_elf_object(path_name, new_rpaths)
-            if not new_dir == old_dir:
-                if len(new_dir) <= len(old_dir):
-                    replace_prefix_bin(path_name, old_dir, new_dir)
-                else:
-                    tty.warn('Cannot do a binary string replacement'
-                             ' with padding for %s'
-                             ' because %s is longer than %s.' %
-                             (path_name, new_dir, old_dir))
+    rpath_entries = rpath_entries or {}
+    offsets = offsets or {}
+    _map_files(lambda path_name: _relocate_elf_binary(
+        path_name, old_dir, new_dir, placeholder,
+        rpath_entries.get(path_name), offsets.get(path_name)), path_names)
+
+
+def get_relative_link(target, orig_path):
+    """
+    Return the target of the absolute link orig_path relative to the
+    directory of the link.
+    """
+    return os.path.relpath(target, os.path.dirname(orig_path))
 
 
 def make_link_relative(cur_path_names, orig_path_names):
@@ -538,7 +890,7 @@ def make_link_relative(cur_path_names, orig_path_names):
     """
     for cur_path, orig_path in zip(cur_path_names, orig_path_names):
         target = os.readlink(orig_path)
-        relative_target = os.path.relpath(target, os.path.dirname(orig_path))
+        relative_target = get_relative_link(target, orig_path)
 
         os.unlink(cur_path)
         os.symlink(relative_target, cur_path)
@@ -594,6 +946,18 @@ def check_files_relocatable(cur_path_names, allow_root):
                 cur_path, spack.store.layout.root)
 
 
+def get_placeholder_link(target, cur_dir, old_dir):
+    """
+    Return the absolute link target with the old install path replaced
+    by a placeholder.
+    """
+    placeholder = set_placeholder(spack.store.layout.root)
+    placeholder_prefix = old_dir.replace(spack.store.layout.root,
+                                         placeholder)
+    rel_src = os.path.relpath(target, cur_dir)
+    return os.path.join(placeholder_prefix, rel_src)
+
+
 def make_link_placeholder(cur_path_names, cur_dir, old_dir):
     """
     Replace old install path with placeholder in absolute links.
@@ -601,12 +965,8 @@ def make_link_placeholder(cur_path_names, cur_dir, old_dir):
     Links in ``cur_path_names`` must link to absolute paths.
     """
     for cur_path in cur_path_names:
-        placeholder = set_placeholder(spack.store.layout.root)
-        placeholder_prefix = old_dir.replace(spack.store.layout.root,
-                                             placeholder)
         cur_src = os.readlink(cur_path)
-        rel_src = os.path.relpath(cur_src, cur_dir)
-        new_src = os.path.join(placeholder_prefix, rel_src)
+        new_src = get_placeholder_link(cur_src, cur_dir, old_dir)
 
         os.unlink(cur_path)
         os.symlink(new_src, cur_path)
@@ -629,17 +989,56 @@ def relocate_links(path_names, old_dir, new_dir):
         os.symlink(new_src, path_name)
 
 
-def relocate_text(path_names, oldpath, newpath, oldprefix, newprefix):
+def relocate_text(path_names, oldpath, newpath, oldprefix, newprefix,
+                  offsets=None):
     """
     Replace old path with new path in text files
     including the path the the spack sbang script.
+
+    All the paths are replaced in a single scan of each file, and the
+    files are relocated concurrently, in a pool of threads.  offsets maps
+    files to the offsets of the old paths in them, recorded by
+    text_prefix_offsets when they were packaged: these files are not
+    scanned, unless the old paths are not found at their offsets.
+
+    Returns a dictionary mapping each file to the number of bytes scanned
+    and rewritten in it.
     """
     sbangre = '#!/bin/bash %s/bin/sbang' % oldprefix
     sbangnew = '#!/bin/bash %s/bin/sbang' % newprefix
-    for path_name in path_names:
-        replace_prefix_text(path_name, oldpath, newpath)
-        replace_prefix_text(path_name, sbangre, sbangnew)
-        replace_prefix_text(path_name, oldprefix, newprefix)
+    prefixes = _text_prefixes([(oldpath, newpath),
+                               (sbangre, sbangnew),
+                               (oldprefix, newprefix)])
+    path_names = list(path_names)
+    if not prefixes:
+        return dict((path_name, (0, 0)) for path_name in path_names)
+
+    pattern = _prefix_text_pattern(prefixes)
+    old_dirs = _text_old_dirs(oldpath, oldprefix)
+    offsets = offsets or {}
+
+    def relocate(path_name):
+        if path_name in offsets:
+            stats = _replace_prefixes_text_at(
+                path_name, prefixes, old_dirs, offsets[path_name])
+            if stats is not None:
+                return stats
+            tty.debug('The paths to relocate in %s are not at their '
+                      'recorded offsets' % path_name)
+        return _replace_prefixes_text(path_name, prefixes, pattern)
+
+    stats = dict(zip(path_names, _map_files(relocate, path_names)))
+
+    for path_name, (scanned, rewritten) in stats.items():
+        if rewritten:
+            tty.debug('Relocated %s: scanned %d bytes, rewrote %d bytes' %
+                      (path_name, scanned, rewritten))
+    tty.debug('Relocated %d of %d text files: scanned %d bytes, '
+              'rewrote %d bytes' % (
+                  sum(1 for _, r in stats.values() if r), len(stats),
+                  sum(s for s, _ in stats.values()),
+                  sum(r for _, r in stats.values())))
+    return stats
 
 
 def substitute_rpath(orig_rpath, topdir, new_root_path):
@@ -678,6 +1077,8 @@ def is_relocatable(spec):
     for root, dirs, files in os.walk(spec.prefix, topdown=True):
         dirs[:] = [d for d in dirs if d not in ('.spack', 'man')]
         abs_files = [os.path.join(root, f) for f in files]
+        # detect the types of the files concurrently, they are memoized
+        mime_types(abs_files)
         if not all(file_is_relocatable(f) for f in abs_files if is_binary(f)):
             # If any of the file is not relocatable, the entire
             # package is not relocatable
@@ -723,7 +1124,7 @@ def file_is_relocatable(file, paths_to_relocate=None):
         tty.debug('{0},{1}'.format(m_type, m_subtype))
 
     if platform.system().lower() == 'linux':
-        if m_subtype == 'x-executable' or m_subtype == 'x-sharedlib':
+        if m_subtype in ('x-executable', 'x-sharedlib', 'x-pie-executable'):
             rpaths = ':'.join(get_existing_elf_rpaths(file))
             set_of_strings.discard(rpaths)
     if platform.system().lower() == 'darwin':
@@ -765,10 +1166,220 @@ def is_binary(file):
     return False
 
 
+#: Bytes of text files, as in the ``file`` program: printable ASCII,
+#: the usual control characters and any 8-bit character
+_text_bytes = bytes(bytearray(
+    [7, 8, 9, 10, 11, 12, 13, 27] + list(range(0x20, 0x7f)) +
+    list(range(0x80, 0x100))))
+
+#: Number of bytes of a file that are read to tell whether it is text
+_text_probe_size = 1024 * 1024
+
+#: Maximum number of threads detecting the types of files, or relocating
+#: binaries
+_file_workers = 16
+
+#: MIME subtypes of scripts, by the name of their interpreter, for the
+#: interpreters that the ``file`` program recognizes
+_script_subtypes = {
+    'sh': 'x-shellscript', 'bash': 'x-shellscript', 'csh': 'x-shellscript',
+    'tcsh': 'x-shellscript', 'zsh': 'x-shellscript', 'ksh': 'x-shellscript',
+    'ash': 'x-shellscript', 'dash': 'x-shellscript',
+    'python': 'x-script.python', 'perl': 'x-perl', 'ruby': 'x-ruby',
+    'tclsh': 'x-tcl', 'wish': 'x-tcl', 'awk': 'x-awk', 'gawk': 'x-awk',
+    'nawk': 'x-awk', 'lua': 'x-lua', 'php': 'x-php',
+}
+
+#: MIME types of other common binary formats, by their magic bytes and
+#: the offset of these bytes
+_magic_types = [
+    (0, b'!<arch>\n', ('application', 'x-archive')),
+    (0, b'!<thin>\n', ('application', 'x-archive')),
+    (0, b'\x1f\x8b', ('application', 'gzip')),
+    (0, b'BZh', ('application', 'x-bzip2')),
+    (0, b'\xfd7zXZ\x00', ('application', 'x-xz')),
+    (0, b'\x89PNG', ('image', 'png')),
+    (257, b'ustar', ('application', 'x-tar')),
+]
+
+#: Shebang lines of the scripts recognized by the ``file`` program
+_shebang_re = re.compile(
+    br'#!\s?(?:/usr(?:/local)?)?/bin/(?:env\s+)?([a-z]+)(?:[0-9.]*)(?:\s|$)')
+
+
+def _elf_subtype(f, header):
+    """Return the MIME subtype of an ELF file, given its first bytes."""
+    endian = '<' if header[5:6] == b'\x01' else '>'
+    is_64bit = header[4:5] == b'\x02'
+    e_type, = struct.unpack(endian + 'H', header[16:18])
+    if e_type == 1:
+        return 'x-object'
+    if e_type == 2:
+        return 'x-executable'
+    if e_type == 4:
+        return 'x-coredump'
+    if e_type != 3:
+        return 'octet-stream'
+
+    # Shared objects flagged as position independent executables
+    if is_64bit:
+        phoff, = struct.unpack(endian + 'Q', header[32:40])
+        phentsize, phnum = struct.unpack(endian + 'HH', header[54:58])
+        phdr, dyn = struct.Struct(endian + 'IIQQQQ'), endian + 'qQ'
+    else:
+        phoff, = struct.unpack(endian + 'I', header[28:32])
+        phentsize, phnum = struct.unpack(endian + 'HH', header[42:46])
+        phdr, dyn = struct.Struct(endian + 'IIIII'), endian + 'iI'
+    dyn = struct.Struct(dyn)
+
+    for i in range(phnum):
+        f.seek(phoff + i * phentsize)
+        data = f.read(phdr.size)
+        if len(data) < phdr.size:
+            break
+        fields = phdr.unpack(data)
+        p_type = fields[0]
+        if is_64bit:
+            p_offset, p_filesz = fields[2], fields[5]
+        else:
+            p_offset, p_filesz = fields[1], fields[4]
+        if p_type != 2:  # PT_DYNAMIC
+            continue
+
+        f.seek(p_offset)
+        data = f.read(p_filesz)
+        for j in range(0, len(data) - dyn.size + 1, dyn.size):
+            tag, value = dyn.unpack(data[j:j + dyn.size])
+            if tag == 0:  # DT_NULL
+                break
+            if tag == 0x6ffffffb:  # DT_FLAGS_1
+                if value & 0x08000000:  # DF_1_PIE
+                    return 'x-pie-executable'
+        break
+
+    return 'x-sharedlib'
+
+
+def _file_type(path):
+    """Returns the MIME type and subtype of a file, like the ``file``
+    program but without running it.
+
+    Binaries are told apart by their magic bytes, and text files by the
+    bytes they contain. The types are those of the ``file`` program for
+    binaries, scripts and common formats, but source files, for instance,
+    are all ``text/plain``.
+    """
+    if os.path.islink(path):
+        return ('inode', 'symlink')
+    if os.path.isdir(path):
+        return ('inode', 'directory')
+    if not os.path.isfile(path):
+        return ('inode', 'x-special')
+
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(64)
+            if not header:
+                return ('inode', 'x-empty')
+
+            if header[:4] == b'\x7fELF' and len(header) >= 52:
+                return ('application', _elf_subtype(f, header))
+            if header[:4] in (b'\xfe\xed\xfa\xce', b'\xfe\xed\xfa\xcf',
+                              b'\xce\xfa\xed\xfe', b'\xcf\xfa\xed\xfe'):
+                return ('application', 'x-mach-binary')
+            if header[:4] == b'\xca\xfe\xba\xbe' and len(header) >= 8:
+                # Universal binaries share their magic with Java classes,
+                # which have larger numbers in place of the number of archs
+                nfat_arch, = struct.unpack('>I', header[4:8])
+                if nfat_arch < 20:
+                    return ('application', 'x-mach-binary')
+                return ('application', 'x-java-applet')
+
+            data = header + f.read(_text_probe_size - len(header))
+            complete = len(data) < _text_probe_size
+    except (IOError, OSError):
+        return ('application', 'octet-stream')
+
+    for offset, magic, m_type in _magic_types:
+        if data[offset:offset + len(magic)] == magic:
+            return m_type
+
+    if data.translate(None, _text_bytes):
+        return ('application', 'octet-stream')
+
+    match = _shebang_re.match(data)
+    if match:
+        interpreter = match.group(1).decode('ascii')
+        if interpreter == 'node':
+            return ('application', 'javascript')
+        return ('text', _script_subtypes.get(interpreter, 'plain'))
+
+    # Text formats that the file program doesn't count as text
+    start = data[:1024].lstrip()
+    if start[:1] in (b'{', b'[') and complete:
+        try:
+            json.loads(data.decode('utf-8'))
+            return ('application', 'json')
+        except ValueError:
+            pass
+    if b'<svg' in start and (start.startswith(b'<svg') or
+                             start.startswith(b'<?xml')):
+        return ('image', 'svg+xml')
+
+    return ('text', 'plain')
+
+
 @llnl.util.lang.memoized
 def mime_type(file):
     """Returns the mime type and subtype of a file.
 
+    Args:
+        file: file to be analyzed
+
+    Returns:
+        Tuple containing the MIME type and subtype
+    """
+    m_type = _file_type(file)
+    tty.debug('[MIME_TYPE] {0} -> {1}/{2}'.format(file, *m_type))
+    return m_type
+
+
+def mime_types(files):
+    """Returns the mime types and subtypes of many files, detected in a
+    pool of threads.
+
+    Args:
+        files: files to be analyzed
+
+    Returns:
+        Dictionary mapping files to tuples containing their MIME type
+        and subtype
+    """
+    files = list(files)
+    return dict(zip(files, _map_files(mime_type, files)))
+
+
+def _map_files(function, files):
+    """Returns the results of function for each of the files, computed in
+    a pool of threads."""
+    files = list(files)
+    if len(files) < 2:
+        return [function(f) for f in files]
+
+    pool = multiprocessing.pool.ThreadPool(min(len(files), _file_workers))
+    try:
+        return pool.map(function, files)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def file_command_mime_type(file):
+    """Returns the mime type and subtype of a file, from the ``file``
+    program.
+
+    This is slower than ``mime_type``, but tells more types of text apart.
+
     Args:
         file: file to be analyzed
 
@@ -777,7 +1388,6 @@ def mime_type(file):
     """
     file_cmd = Executable('file')
     output = file_cmd('-b', '-h', '--mime-type', file, output=str, error=str)
-    tty.debug('[MIME_TYPE] {0} -> {1}'.format(file, output.strip()))
     if '/' not in output:
         output += '/'
     split_by_slash = output.strip().split('/')
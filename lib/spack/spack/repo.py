@@ -10,6 +10,8 @@
 import functools
 import inspect
 import itertools
+import multiprocessing
+import multiprocessing.pool
 import os
 import re
 import shutil
@@ -17,7 +19,7 @@
 import sys
 import traceback
 
-from six import string_types, add_metaclass
+from six import StringIO, string_types, add_metaclass
 
 try:
     from collections.abc import Mapping  # novm
@@ -49,6 +51,10 @@
 #: Package modules are imported as spack.pkg.<namespace>.<pkg-name>.
 repo_namespace = 'spack.pkg'
 
+#: Minimum number of outdated packages for indexes to be updated by a
+#: pool of processes instead of sequentially.
+parallel_index_threshold = 32
+
 
 def get_full_namespace(namespace):
     """Returns the full namespace of a repository, given its relative one."""
@@ -238,14 +244,118 @@ def update_package(self, pkg_name):
         package = path.get(pkg_name)
 
         # Remove the package from the list of packages, if present
-        for pkg_list in self._tag_dict.values():
-            if pkg_name in pkg_list:
-                pkg_list.remove(pkg_name)
+        self.remove_package(package.name)
 
         # Add it again under the appropriate tags
         for tag in getattr(package, 'tags', []):
             self._tag_dict[tag].append(package.name)
 
+    def remove_package(self, pkg_name):
+        """Removes a package from the tag index.
+
+        Args:
+            pkg_name (str): name of the package to be removed from the index
+
+        """
+        for pkg_list in self._tag_dict.values():
+            if pkg_name in pkg_list:
+                pkg_list.remove(pkg_name)
+
+    def merge(self, other):
+        """Merges another tag index into this one."""
+        for tag, pkg_list in other.items():
+            self._tag_dict[tag].extend(
+                p for p in pkg_list if p not in self._tag_dict[tag])
+
+
+class MetadataIndex(Mapping):
+    """Maps package names to the metadata set by their directives.
+
+    The metadata of each package is a dictionary that can be stored as
+    JSON, with the following keys:
+
+    * ``versions``: list of the versions of the package
+    * ``variants``: variant name -> dictionary with its ``default`` value
+      and ``description``
+    * ``dependencies``: dependency name -> list of ``[when, spec, types]``
+    * ``conflicts``: conflicting spec -> list of ``when`` specs
+    * ``provides``: virtual spec -> list of ``when`` specs
+    * ``extends``: extendee name -> extendee spec
+
+    Specs are stored as strings.  This lets code that only needs the
+    metadata of packages avoid importing their ``package.py`` files.
+    """
+
+    def __init__(self):
+        self._metadata = {}
+
+    def to_json(self, stream):
+        sjson.dump({'metadata': self._metadata}, stream)
+
+    @staticmethod
+    def from_json(stream):
+        d = sjson.load(stream)
+
+        r = MetadataIndex()
+        r._metadata.update(d['metadata'])
+
+        return r
+
+    def __getitem__(self, item):
+        return self._metadata[item]
+
+    def __iter__(self):
+        return iter(self._metadata)
+
+    def __len__(self):
+        return len(self._metadata)
+
+    def remove_package(self, pkg_name):
+        """Removes the metadata of a package from the index.
+
+        Args:
+            pkg_name (str): name of the package to be removed
+
+        """
+        self._metadata.pop(pkg_name.rpartition('.')[2], None)
+
+    def merge(self, other):
+        """Merges another metadata index into this one."""
+        self._metadata.update(other._metadata)
+
+    def update_package(self, pkg_name):
+        """Updates the metadata of a package in the index.
+
+        Args:
+            pkg_name (str): name of the package to be updated
+
+        """
+        pkg_cls = path.get_pkg_class(pkg_name)
+
+        dependencies = {}
+        for dep_name, conditions in pkg_cls.dependencies.items():
+            dependencies[dep_name] = sorted(
+                [str(when), str(dep.spec), sorted(dep.type)]
+                for when, dep in conditions.items())
+
+        self._metadata[pkg_name.rpartition('.')[2]] = {
+            'versions': [str(v) for v in sorted(pkg_cls.versions)],
+            'variants': dict(
+                (name, {'default': variant.default,
+                        'description': variant.description})
+                for name, variant in pkg_cls.variants.items()),
+            'dependencies': dependencies,
+            'conflicts': dict(
+                (str(spec), sorted(str(when) for when, _ in whens))
+                for spec, whens in pkg_cls.conflicts.items()),
+            'provides': dict(
+                (str(spec), sorted(str(when) for when in whens))
+                for spec, whens in pkg_cls.provided.items()),
+            'extends': dict(
+                (name, str(spec))
+                for name, (spec, _) in pkg_cls.extendees.items()),
+        }
+
 
 @add_metaclass(abc.ABCMeta)
 class Indexer(object):
@@ -282,6 +392,19 @@ def read(self, stream):
     def update(self, pkg_fullname):
         """Update the index in memory with information about a package."""
 
+    @abc.abstractmethod
+    def remove(self, pkg_fullname):
+        """Remove the information about a package from the index in memory.
+        """
+
+    @abc.abstractmethod
+    def merge(self, stream):
+        """Merge an index written by another indexer into this one.
+
+        This is used to combine the indexes built by several processes,
+        each updating a subset of the packages.
+        """
+
     @abc.abstractmethod
     def write(self, stream):
         """Write the index to a file object."""
@@ -298,6 +421,12 @@ def read(self, stream):
     def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname.rpartition('.')[2])
+
+    def merge(self, stream):
+        self.index.merge(TagIndex.from_json(stream))
+
     def write(self, stream):
         self.index.to_json(stream)
 
@@ -314,6 +443,12 @@ def update(self, pkg_fullname):
         self.index.remove_provider(pkg_fullname)
         self.index.update(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_provider(pkg_fullname)
+
+    def merge(self, stream):
+        self.index.merge(ProviderIndex.from_json(stream))
+
     def write(self, stream):
         self.index.to_json(stream)
 
@@ -339,6 +474,63 @@ def write(self, stream):
     def update(self, pkg_fullname):
         self.index.update_package(pkg_fullname)
 
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname)
+
+    def merge(self, stream):
+        self.index.update(spack.patch.PatchCache.from_json(stream))
+
+
+class MetadataIndexer(Indexer):
+    """Lifecycle methods for a MetadataIndex on a Repo."""
+    def _create(self):
+        return MetadataIndex()
+
+    def read(self, stream):
+        self.index = MetadataIndex.from_json(stream)
+
+    def update(self, pkg_fullname):
+        self.index.update_package(pkg_fullname)
+
+    def remove(self, pkg_fullname):
+        self.index.remove_package(pkg_fullname)
+
+    def merge(self, stream):
+        self.index.merge(MetadataIndex.from_json(stream))
+
+    def write(self, stream):
+        self.index.to_json(stream)
+
+
+def _update_indexes(args):
+    """Update fresh indexes for a chunk of packages in a worker process.
+
+    Arguments:
+        args (list): ``(name, indexer class, package names)`` for each index
+
+    Returns:
+        (dict or None): JSON written by each updated indexer, by index name,
+            or None if the packages could not be indexed
+    """
+    fragments = {}
+    try:
+        for name, indexer_cls, pkg_fullnames in args:
+            indexer = indexer_cls()
+            indexer.create()
+            for pkg_fullname in pkg_fullnames:
+                indexer.update(pkg_fullname)
+
+            stream = StringIO()
+            indexer.write(stream)
+            fragments[name] = stream.getvalue()
+    except KeyboardInterrupt:
+        raise
+    except BaseException as e:
+        # Errors exiting the worker, like tty.die, would hang the pool
+        tty.debug('Cannot update indexes in parallel: {0}'.format(str(e)))
+        return None
+    return fragments
+
 
 class RepoIndex(object):
     """Container class that manages a set of Indexers for a Repo.
@@ -396,24 +588,95 @@ def _build_all_indexes(self):
         invocations.
 
         """
-        for name, indexer in self.indexers.items():
-            self.indexes[name] = self._build_index(name, indexer)
+        needs_update = dict(
+            (name, self._needs_update(name)) for name in self.indexers)
+        fragments = self._update_in_parallel(needs_update)
 
-    def _build_index(self, name, indexer):
-        """Determine which packages need an update, and update indexes."""
-
-        # Filename of the provider index cache (we assume they're all json)
-        cache_filename = '{0}/{1}-index.json'.format(name, self.namespace)
+        for name, indexer in self.indexers.items():
+            self.indexes[name] = self._build_index(
+                name, indexer, needs_update[name], fragments.get(name))
 
-        # Compute which packages needs to be updated in the cache
-        misc_cache = spack.caches.misc_cache
-        index_mtime = misc_cache.mtime(cache_filename)
+    def _cache_filename(self, name):
+        """Filename of the cache of an index (we assume they're all json)"""
+        return '{0}/{1}-index.json'.format(name, self.namespace)
 
-        needs_update = [
+    def _needs_update(self, name):
+        """Names of the packages that changed since an index was cached."""
+        index_mtime = spack.caches.misc_cache.mtime(self._cache_filename(name))
+        return [
             x for x, sinfo in self.checker.items()
             if sinfo.st_mtime > index_mtime
         ]
 
+    def _update_in_parallel(self, needs_update):
+        """Update the indexes for the outdated packages in worker processes.
+
+        Importing packages is the main bottleneck when updating indexes, so
+        when many packages are outdated they are split among a pool of
+        processes.  Each process updates fresh indexes for its packages.
+
+        Arguments:
+            needs_update (dict): names of the outdated packages, by index
+
+        Returns:
+            (dict): lists of the JSON written by the indexers of each
+                process, by index name, or an empty dictionary if the
+                indexes have to be updated sequentially
+        """
+        pkg_names = sorted(set(itertools.chain(*needs_update.values())))
+        jobs = min(multiprocessing.cpu_count(), len(pkg_names))
+
+        # Workers need the repositories of this process, so they are forked.
+        # Daemonic processes (e.g., in a pool) cannot have children.
+        if (jobs < 2 or len(pkg_names) < parallel_index_threshold
+                or multiprocessing.current_process().daemon
+                or (sys.version_info >= (3, 4) and
+                    multiprocessing.get_start_method() != 'fork')):
+            return {}
+
+        chunks = []
+        for i in range(jobs):
+            chunk = set(pkg_names[i::jobs])
+            chunks.append([
+                (name, type(indexer), [
+                    '%s.%s' % (self.namespace, pkg_name)
+                    for pkg_name in needs_update[name] if pkg_name in chunk])
+                for name, indexer in self.indexers.items()
+                if needs_update[name]])
+
+        tty.debug('Updating indexes of {0} packages in {1} processes'
+                  .format(len(pkg_names), jobs))
+        pool = multiprocessing.pool.Pool(jobs)
+        try:
+            results = pool.map(_update_indexes, chunks)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        # Packages that could not be indexed are indexed again here, to
+        # report the error
+        if any(result is None for result in results):
+            return {}
+
+        fragments = {}
+        for result in results:
+            for name, fragment in result.items():
+                fragments.setdefault(name, []).append(fragment)
+        return fragments
+
+    def _build_index(self, name, indexer, needs_update, fragments=None):
+        """Update an index for the outdated packages and cache it.
+
+        Arguments:
+            name (str): name of the index
+            indexer (Indexer): indexer of the index
+            needs_update (list): names of the outdated packages
+            fragments (list): JSON of indexes already updated for the
+                outdated packages by other processes, if any
+        """
+        cache_filename = self._cache_filename(name)
+        misc_cache = spack.caches.misc_cache
+
         index_existed = misc_cache.init_entry(cache_filename)
         if index_existed and not needs_update:
             # If the index exists and doesn't need an update, read it
@@ -427,7 +690,13 @@ def _build_index(self, name, indexer):
 
                 for pkg_name in needs_update:
                     namespaced_name = '%s.%s' % (self.namespace, pkg_name)
-                    indexer.update(namespaced_name)
+                    if fragments is None:
+                        indexer.update(namespaced_name)
+                    else:
+                        indexer.remove(namespaced_name)
+
+                for fragment in fragments or []:
+                    indexer.merge(StringIO(fragment))
 
                 indexer.write(new)
 
@@ -569,7 +838,19 @@ def providers_for(self, vpkg_spec):
 
     @autospec
     def extensions_for(self, extendee_spec):
-        return [p for p in self.all_packages() if p.extends(extendee_spec)]
+        # Only import the packages that can extend the spec
+        candidates = [
+            name for name in self.all_package_names()
+            if extendee_spec.name in self.package_metadata(name)['extends']]
+        return [p for p in map(self.get, candidates)
+                if p.extends(extendee_spec)]
+
+    def package_metadata(self, pkg_name):
+        """Metadata of a package, without importing it.
+
+        See ``MetadataIndex`` for its contents.
+        """
+        return self.repo_for_pkg(pkg_name).package_metadata(pkg_name)
 
     def find_module(self, fullname, path=None):
         """Implements precedence for overlaid namespaces.
@@ -946,6 +1227,7 @@ def index(self):
             self._repo_index.add_indexer('providers', ProviderIndexer())
             self._repo_index.add_indexer('tags', TagIndexer())
             self._repo_index.add_indexer('patches', PatchIndexer())
+            self._repo_index.add_indexer('metadata', MetadataIndexer())
         return self._repo_index
 
     @property
@@ -963,6 +1245,25 @@ def patch_index(self):
         """Index of patches and packages they're defined on."""
         return self.index['patches']
 
+    @property
+    def metadata_index(self):
+        """Index of the metadata set by the directives of packages."""
+        return self.index['metadata']
+
+    def package_metadata(self, pkg_name):
+        """Metadata of a package, without importing it.
+
+        See ``MetadataIndex`` for its contents.
+        """
+        namespace, _, pkg_name = pkg_name.rpartition('.')
+        if namespace and (namespace != self.namespace):
+            raise InvalidNamespaceError('Invalid namespace for %s repo: %s'
+                                        % (self.namespace, namespace))
+
+        if pkg_name not in self.metadata_index:
+            raise UnknownPackageError(pkg_name, self)
+        return self.metadata_index[pkg_name]
+
     @autospec
     def providers_for(self, vpkg_spec):
         providers = self.provider_index.providers_for(vpkg_spec)
@@ -972,7 +1273,12 @@ def providers_for(self, vpkg_spec):
 
     @autospec
     def extensions_for(self, extendee_spec):
-        return [p for p in self.all_packages() if p.extends(extendee_spec)]
+        # Only import the packages that can extend the spec
+        candidates = [
+            name for name, metadata in sorted(self.metadata_index.items())
+            if extendee_spec.name in metadata['extends']]
+        return [p for p in map(self.get, candidates)
+                if p.extends(extendee_spec)]
 
     def dirname_for_package_name(self, pkg_name):
         """Get the directory name for a particular package.  This is the
@@ -55,17 +55,26 @@
             },
             'source_cache': {'type': 'string'},
             'misc_cache': {'type': 'string'},
+            'concretization_cache': {'type': 'boolean'},
             'verify_ssl': {'type': 'boolean'},
             'suppress_gpg_warnings': {'type': 'boolean'},
             'install_missing_compilers': {'type': 'boolean'},
             'debug': {'type': 'boolean'},
             'checksum': {'type': 'boolean'},
             'locks': {'type': 'boolean'},
+            'blocking_locks': {'type': 'boolean'},
+            'lock_statistics': {'type': 'boolean'},
             'dirty': {'type': 'boolean'},
             'build_language': {'type': 'string'},
             'build_jobs': {'type': 'integer', 'minimum': 1},
+            'concurrent_builds': {'type': 'integer', 'minimum': 1},
+            'fetch_ahead': {'type': 'integer', 'minimum': 0},
             'ccache': {'type': 'boolean'},
             'db_lock_timeout': {'type': 'integer', 'minimum': 1},
+            'buildcache_compression': {
+                'type': 'string',
+                'enum': ['bz2', 'gz', 'xz'],
+            },
             'package_lock_timeout': {
                 'anyOf': [
                     {'type': 'integer', 'minimum': 1},
@@ -84,6 +84,7 @@
 import operator
 import os
 import re
+import threading
 
 import six
 import ruamel.yaml as yaml
@@ -169,6 +170,18 @@
 #: every time we call str()
 _any_version = vn.VersionList([':'])
 
+#: Hashes of the abstract specs computed while hashing an abstract spec, in
+#: each thread, so that dependencies shared by several nodes are hashed
+#: only once.  Abstract specs may change, so the hashes are dropped once
+#: the hash of the outermost spec is computed.
+_abstract_hashes = threading.local()
+
+#: Whether copies of concrete specs share the versions, architecture,
+#: compiler and variants of each node with the spec they are copied from,
+#: instead of copying them.  Concrete nodes are not modified, so these are
+#: copied only if a node stops being concrete.
+share_concrete_nodes = True
+
 default_format = '{name}{@version}'
 default_format += '{%compiler.name}{@compiler.version}{compiler_flags}'
 default_format += '{variants}{arch=architecture}'
@@ -948,6 +961,10 @@ class Spec(object):
     #: Cache for spec's prefix, computed lazily in the corresponding property
     _prefix = None
 
+    #: Whether this node shares its attributes with a concrete spec it was
+    #: copied from, see ``share_concrete_nodes``
+    _shared = False
+
     def __init__(self, spec_like=None,
                  normal=False, concrete=False, external_path=None,
                  external_module=None, full_hash=None):
@@ -1365,8 +1382,7 @@ def _spec_hash(self, hash):
         """
         # TODO: curently we strip build dependencies by default.  Rethink
         # this when we move to using package hashing on all specs.
-        yaml_text = syaml.dump(
-            self.to_node_dict(hash=hash), default_flow_style=True)
+        yaml_text = syaml.dump_flow(self.to_node_dict(hash=hash))
         sha = hashlib.sha1(yaml_text.encode('utf-8'))
         b32_hash = base64.b32encode(sha.digest()).lower()
 
@@ -1380,7 +1396,8 @@ def _cached_hash(self, hash, length=None):
 
         This will run _spec_hash() with the deptype and package_hash
         parameters, and if this spec is concrete, it will store the value
-        in the supplied attribute on this spec.
+        in the supplied attribute on this spec.  Otherwise, the value is
+        only kept until the hash of the outermost abstract spec is computed.
 
         Arguments:
             hash (SpecHashDescriptor): type of hash to generate.
@@ -1391,13 +1408,28 @@ def _cached_hash(self, hash, length=None):
         hash_string = getattr(self, hash.attr, None)
         if hash_string:
             return hash_string[:length]
-        else:
+        elif self.concrete:
             hash_string = self._spec_hash(hash)
-            if self.concrete:
-                setattr(self, hash.attr, hash_string)
-
+            setattr(self, hash.attr, hash_string)
             return hash_string[:length]
 
+        hashes = getattr(_abstract_hashes, 'hashes', None)
+        outermost = hashes is None
+        if outermost:
+            hashes = _abstract_hashes.hashes = {}
+        try:
+            # The spec is kept along with its hash so that its id is not
+            # reused by another spec in the meantime
+            key = (id(self), hash.attr)
+            if key not in hashes:
+                hashes[key] = (self, self._spec_hash(hash))
+            hash_string = hashes[key][1]
+        finally:
+            if outermost:
+                _abstract_hashes.hashes = None
+
+        return hash_string[:length]
+
     def dag_hash(self, length=None):
         """This is Spack's default hash, used to identify installations.
 
@@ -2141,6 +2173,58 @@ def concretize(self, tests=False):
         if self._concrete:
             return
 
+        import spack.concretization_cache as cache
+        key = cache.key(self, tests) if cache.enabled() else None
+        cached = key and cache.get(key)
+        if cached:
+            self._dup(cached)
+        else:
+            self._concretize(tests)
+
+        # If any spec in the DAG is deprecated, throw an error
+        deprecated = []
+        with spack.store.db.read_transaction():
+            for x in self.traverse():
+                _, rec = spack.store.db.query_by_spec_hash(x.dag_hash())
+                if rec and rec.deprecated_for:
+                    deprecated.append(rec)
+
+        if deprecated:
+            msg = "\n    The following specs have been deprecated"
+            msg += " in favor of specs with the hashes shown:\n"
+            for rec in deprecated:
+                msg += '        %s  --> %s\n' % (rec.spec, rec.deprecated_for)
+            msg += '\n'
+            msg += "    For each package listed, choose another spec\n"
+            raise SpecDeprecatedError(msg)
+
+        # Now that the spec is concrete we should check if
+        # there are declared conflicts
+        #
+        # TODO: this needs rethinking, as currently we can only express
+        # TODO: internal configuration conflicts within one package.
+        matches = []
+        for x in self.traverse():
+            for conflict_spec, when_list in x.package_class.conflicts.items():
+                if x.satisfies(conflict_spec, strict=True):
+                    for when_spec, msg in when_list:
+                        if x.satisfies(when_spec, strict=True):
+                            when = when_spec.copy()
+                            when.name = x.name
+                            matches.append((x, conflict_spec, when, msg))
+        if matches:
+            raise ConflictsInSpecError(self, matches)
+
+        # Check if we can produce an optimized binary (will throw if
+        # there are declared inconsistencies)
+        self.architecture.target.optimization_flags(self.compiler)
+
+        if key and not cached:
+            cache.put(key, self)
+
+    def _concretize(self, tests):
+        """Concretize this spec in place, without reading it from or storing
+        it in the concretization cache."""
         changed = True
         force = False
 
@@ -2244,44 +2328,6 @@ def concretize(self, tests=False):
         # Mark everything in the spec as concrete, as well.
         self._mark_concrete()
 
-        # If any spec in the DAG is deprecated, throw an error
-        deprecated = []
-        with spack.store.db.read_transaction():
-            for x in self.traverse():
-                _, rec = spack.store.db.query_by_spec_hash(x.dag_hash())
-                if rec and rec.deprecated_for:
-                    deprecated.append(rec)
-
-        if deprecated:
-            msg = "\n    The following specs have been deprecated"
-            msg += " in favor of specs with the hashes shown:\n"
-            for rec in deprecated:
-                msg += '        %s  --> %s\n' % (rec.spec, rec.deprecated_for)
-            msg += '\n'
-            msg += "    For each package listed, choose another spec\n"
-            raise SpecDeprecatedError(msg)
-
-        # Now that the spec is concrete we should check if
-        # there are declared conflicts
-        #
-        # TODO: this needs rethinking, as currently we can only express
-        # TODO: internal configuration conflicts within one package.
-        matches = []
-        for x in self.traverse():
-            for conflict_spec, when_list in x.package_class.conflicts.items():
-                if x.satisfies(conflict_spec, strict=True):
-                    for when_spec, msg in when_list:
-                        if x.satisfies(when_spec, strict=True):
-                            when = when_spec.copy()
-                            when.name = x.name
-                            matches.append((x, conflict_spec, when, msg))
-        if matches:
-            raise ConflictsInSpecError(self, matches)
-
-        # Check if we can produce an optimized binary (will throw if
-        # there are declared inconsistencies)
-        self.architecture.target.optimization_flags(self.compiler)
-
     def _mark_concrete(self, value=True):
         """Mark this spec and its dependencies as concrete.
 
@@ -2291,6 +2337,8 @@ def _mark_concrete(self, value=True):
         for s in self.traverse():
             if (not value) and s.concrete and s.package.installed:
                 continue
+            if not value and s._shared:
+                s._unshare()
             s._normal = value
             s._concrete = value
 
@@ -3030,38 +3078,42 @@ def _dup(self, other, deps=True, cleardeps=True, caches=None):
 
         self._package = None
 
+        # Cached fields are results of expensive operations.
+        # If we preserved the original structure, we can copy them
+        # safely. If not, they need to be recomputed.
+        if caches is None:
+            caches = (deps is True or deps == dp.all_deptypes)
+
+        # Exact copies of concrete nodes share the objects that describe
+        # them with the original, see _unshare()
+        self._shared = bool(
+            share_concrete_nodes and caches and other._concrete)
+
         # Local node attributes get copied first.
         self.name = other.name
-        self.versions = other.versions.copy()
-        self.architecture = other.architecture.copy() if other.architecture \
-            else None
-        self.compiler = other.compiler.copy() if other.compiler else None
         if cleardeps:
             self._dependents = DependencyMap()
             self._dependencies = DependencyMap()
         self.compiler_flags = other.compiler_flags.copy()
         self.compiler_flags.spec = self
-        self.variants = other.variants.copy()
 
-        # FIXME: we manage _patches_in_order_of_appearance specially here
-        # to keep it from leaking out of spec.py, but we should figure
-        # out how to handle it more elegantly in the Variant classes.
-        for k, v in other.variants.items():
-            patches = getattr(v, '_patches_in_order_of_appearance', None)
-            if patches:
-                self.variants[k]._patches_in_order_of_appearance = patches
+        if self._shared:
+            self.versions = other.versions
+            self.architecture = other.architecture
+            self.compiler = other.compiler
+            self.variants = vt.VariantMap(self)
+            self.variants.dict.update(other.variants.dict)
+        else:
+            self.versions = other.versions.copy()
+            self.architecture = other.architecture.copy() \
+                if other.architecture else None
+            self.compiler = other.compiler.copy() if other.compiler else None
+            self._copy_variants(other.variants)
 
-        self.variants.spec = self
         self.external_path = other.external_path
         self.external_module = other.external_module
         self.namespace = other.namespace
 
-        # Cached fields are results of expensive operations.
-        # If we preserved the original structure, we can copy them
-        # safely. If not, they need to be recomputed.
-        if caches is None:
-            caches = (deps is True or deps == dp.all_deptypes)
-
         # If we copy dependencies, preserve DAG structure in the new spec
         if deps:
             # If caller restricted deptypes to be copied, adjust that here.
@@ -3088,23 +3140,60 @@ def _dup(self, other, deps=True, cleardeps=True, caches=None):
 
         return changed
 
+    def _copy_variants(self, variants):
+        """Set the variants of self to a copy of ``variants``."""
+        self.variants = variants.copy()
+
+        # FIXME: we manage _patches_in_order_of_appearance specially here
+        # to keep it from leaking out of spec.py, but we should figure
+        # out how to handle it more elegantly in the Variant classes.
+        for k, v in variants.items():
+            patches = getattr(v, '_patches_in_order_of_appearance', None)
+            if patches:
+                self.variants[k]._patches_in_order_of_appearance = patches
+
+        self.variants.spec = self
+
+    def _unshare(self):
+        """Copy the versions, architecture, compiler and variants that
+        this node shares with the concrete spec it was copied from, so
+        that they can be modified."""
+        self.versions = self.versions.copy()
+        if self.architecture:
+            self.architecture = self.architecture.copy()
+        if self.compiler:
+            self.compiler = self.compiler.copy()
+        self._copy_variants(self.variants)
+        self._shared = False
+
     def _dup_deps(self, other, deptypes, caches):
+        # Visit each edge of other once, like traverse_edges(cover='edges')
+        # but without the overhead of a recursive generator.
         new_specs = {self.name: self}
-        for dspec in other.traverse_edges(cover='edges',
-                                          root=False):
-            if (dspec.deptypes and
-                not any(d in deptypes for d in dspec.deptypes)):
-                continue
+        visited = set([id(other)])
+        stack = [other]
+        while stack:
+            parent = stack.pop()
+            for name in sorted(parent._dependencies, reverse=True):
+                dspec = parent._dependencies[name]
+                if id(dspec.spec) not in visited:
+                    visited.add(id(dspec.spec))
+                    stack.append(dspec.spec)
+
+                if (dspec.deptypes and
+                    not any(d in deptypes for d in dspec.deptypes)):
+                    continue
 
-            if dspec.parent.name not in new_specs:
-                new_specs[dspec.parent.name] = dspec.parent.copy(
-                    deps=False, caches=caches)
-            if dspec.spec.name not in new_specs:
-                new_specs[dspec.spec.name] = dspec.spec.copy(
-                    deps=False, caches=caches)
+                if parent.name not in new_specs:
+                    new_specs[parent.name] = parent.copy(
+                        deps=False, caches=caches)
+                child = dspec.spec
+                if child.name not in new_specs:
+                    new_specs[child.name] = child.copy(
+                        deps=False, caches=caches)
 
-            new_specs[dspec.parent.name]._add_dependency(
-                new_specs[dspec.spec.name], dspec.deptypes)
+                new_specs[parent.name]._add_dependency(
+                    new_specs[child.name], dspec.deptypes)
 
     def copy(self, deps=True, **kwargs):
         """Make a copy of this spec.
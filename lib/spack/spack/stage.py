@@ -10,18 +10,19 @@
 import sys
 import errno
 import hashlib
+import multiprocessing.pool
 import tempfile
 import getpass
 from six import string_types
 from six import iteritems
 
+import llnl.util.lang
 import llnl.util.tty as tty
 from llnl.util.filesystem import mkdirp, can_access, install, install_tree
 from llnl.util.filesystem import partition_path, remove_linked_tree
 
 import spack.paths
 import spack.caches
-import spack.cmd
 import spack.config
 import spack.error
 import spack.mirror
@@ -30,6 +31,7 @@
 import spack.util.pattern as pattern
 import spack.util.path as sup
 import spack.util.url as url_util
+import spack.util.web as web_util
 
 from spack.util.crypto import prefix_bits, bit_length
 
@@ -509,14 +511,17 @@ def cache_mirror(self, stats):
         absolute_storage_path = os.path.join(
             dst_root, self.mirror_paths.storage_path)
 
-        if os.path.exists(absolute_storage_path):
-            stats.already_existed(absolute_storage_path)
-        else:
-            self.fetch()
-            self.check()
-            spack.caches.mirror_cache.store(
-                self.fetcher, self.mirror_paths.storage_path)
-            stats.added(absolute_storage_path)
+        # Archives are only stored once they are verified, so those already
+        # in the mirror are not fetched nor checked again.
+        with spack.caches.mirror_cache.lock(self.mirror_paths.storage_path):
+            if os.path.exists(absolute_storage_path):
+                stats.already_existed(absolute_storage_path)
+            else:
+                self.fetch()
+                self.check()
+                spack.caches.mirror_cache.store(
+                    self.fetcher, self.mirror_paths.storage_path)
+                stats.added(absolute_storage_path)
 
         spack.caches.mirror_cache.symlink(self.mirror_paths)
 
@@ -742,6 +747,51 @@ def purge():
                 remove_linked_tree(stage_path)
 
 
+#: Maximum number of archives downloaded concurrently to be checksummed
+_max_checksum_workers = 8
+
+#: Size of the chunks of archives read while they are checksummed
+_checksum_chunk_size = 1024 * 1024
+
+
+def _fetch_and_checksum(url, keep_stage, stage_function=None):
+    """Downloads the archive at the URL into a new stage and computes its
+    sha256 digest as it is written, so the archive is not read again.
+
+    Args:
+        url (str): URL of the archive
+        keep_stage (bool): whether to keep the stage once done
+        stage_function (callable): function that takes the Stage and the
+            URL, run once the archive is downloaded
+
+    Returns:
+        (str): the sha256 digest of the archive
+    """
+    with Stage(url, keep=keep_stage) as stage:
+        tty.msg("Fetching {0}".format(url))
+        _, headers, response = web_util.read_from_url(url)
+        content_type = headers.get('Content-type') if headers else None
+        if content_type and 'text/html' in content_type:
+            fs.warn_content_type_mismatch(url)
+
+        hasher = hashlib.sha256()
+        partial_file = stage.save_filename + '.part'
+        try:
+            with open(partial_file, 'wb') as f:
+                for chunk in iter(
+                        lambda: response.read(_checksum_chunk_size), b''):
+                    hasher.update(chunk)
+                    f.write(chunk)
+        finally:
+            response.close()
+        os.rename(partial_file, stage.save_filename)
+
+        if stage_function:
+            stage_function(stage, url)
+
+        return hasher.hexdigest()
+
+
 def get_checksums_for_versions(
         url_dict, name, first_stage_function=None, keep_stage=False):
     """Fetches and checksums archives from URLs.
@@ -751,17 +801,23 @@ def get_checksums_for_versions(
     inspect the first downloaded archive, e.g., to determine the build
     system.
 
+    Archives are downloaded concurrently, up to ``_max_checksum_workers`` at
+    a time, and each of them is checksummed as it is downloaded.  Versions
+    whose archive cannot be downloaded are reported and skipped.
+
     Args:
         url_dict (dict): A dictionary of the form: version -> URL
         name (str): The name of the package
         first_stage_function (callable): function that takes a Stage and a URL;
-            this is run on the stage of the first URL downloaded
+            this is run on the stage of the first URL, if it is downloaded
         keep_stage (bool): whether to keep staging area when command completes
 
     Returns:
         (str): A multi-line string containing versions and corresponding hashes
 
     """
+    import spack.cmd
+
     sorted_versions = sorted(url_dict.keys(), reverse=True)
 
     # Find length of longest string in the list for padding
@@ -783,31 +839,41 @@ def get_checksums_for_versions(
         tty.die("Aborted.")
 
     versions = sorted_versions[:archives_to_fetch]
-    urls = [url_dict[v] for v in versions]
 
-    tty.msg("Downloading...")
-    version_hashes = []
-    i = 0
-    for url, version in zip(urls, versions):
+    # Versions sharing a URL would share a stage, so each URL is fetched once
+    urls = list(llnl.util.lang.dedupe(url_dict[v] for v in versions))
+
+    def fetch_and_checksum(index):
+        url = urls[index]
         try:
-            with Stage(url, keep=keep_stage) as stage:
-                # Fetch the archive
-                stage.fetch()
-                if i == 0 and first_stage_function:
-                    # Only run first_stage_function the first time,
-                    # no need to run it every time
-                    first_stage_function(stage, url)
-
-                # Checksum the archive and add it to the list
-                version_hashes.append((version, spack.util.crypto.checksum(
-                    hashlib.sha256, stage.archive_file)))
-                i += 1
-        except FailedDownloadError:
+            # Only run first_stage_function on the first URL, no need to
+            # run it every time
+            return _fetch_and_checksum(
+                url, keep_stage, first_stage_function if index == 0 else None)
+        except (FailedDownloadError, web_util.SpackWebError):
             tty.msg("Failed to fetch {0}".format(url))
         except Exception as e:
             tty.msg("Something failed on {0}, skipping.".format(url),
                     "  ({0})".format(e))
 
+    tty.msg("Downloading...")
+    indices = list(range(len(urls)))
+    if len(urls) > 1:
+        pool = multiprocessing.pool.ThreadPool(
+            min(len(urls), _max_checksum_workers))
+        try:
+            hashes = pool.map(fetch_and_checksum, indices, 1)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        hashes = [fetch_and_checksum(i) for i in indices]
+    hash_by_url = dict(zip(urls, hashes))
+
+    # Keep the versions in order, without the failed ones
+    version_hashes = [(v, hash_by_url[url_dict[v]]) for v in versions
+                      if hash_by_url[url_dict[v]]]
+
     if not version_hashes:
         tty.die("Could not fetch any versions for {0}".format(name))
 
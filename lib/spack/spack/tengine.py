@@ -64,14 +64,23 @@ def to_dict(self):
         return dict(d)
 
 
+#: Environments for template rendering, by directories of templates
+_environments = {}
+
+
+def template_dirs():
+    """Returns the default directories where to search for templates."""
+    builtins = spack.config.get('config:template_dirs')
+    extensions = spack.extensions.get_template_dirs()
+    return [canonicalize_path(d)
+            for d in itertools.chain(builtins, extensions)]
+
+
 def make_environment(dirs=None):
     """Returns an configured environment for template rendering."""
     if dirs is None:
         # Default directories where to search for templates
-        builtins = spack.config.get('config:template_dirs')
-        extensions = spack.extensions.get_template_dirs()
-        dirs = [canonicalize_path(d)
-                for d in itertools.chain(builtins, extensions)]
+        dirs = template_dirs()
 
     # avoid importing this at the top level as it's used infrequently and
     # slows down startup a bit.
@@ -86,6 +95,19 @@ def make_environment(dirs=None):
     return env
 
 
+def shared_environment():
+    """Returns an environment for template rendering in the default
+    directories, which is shared by the callers.
+
+    Templates are compiled once and cached by the environment, and compiled
+    again only when their files change.
+    """
+    dirs = tuple(template_dirs())
+    if dirs not in _environments:
+        _environments[dirs] = make_environment(list(dirs))
+    return _environments[dirs]
+
+
 # Extra filters for template engine environment
 
 def prepend_to_line(text, token):
@@ -5,8 +5,13 @@
 
 import pytest
 
+import bz2
+import io
 import os
 import os.path
+import sys
+import tarfile
+from contextlib import closing
 
 import spack.spec
 import spack.binary_distribution
@@ -39,3 +44,142 @@ def test_build_tarball_overwrite(
 
         with pytest.raises(spack.binary_distribution.NoOverwriteException):
             spack.binary_distribution.build_tarball(spec, '.', unsigned=True)
+
+
+def test_build_cache_index(
+        install_mockery, mock_fetch, monkeypatch, tmpdir):
+
+    with tmpdir.as_cwd():
+        spec = spack.spec.Spec('trivial-install-test-package').concretized()
+        install(str(spec))
+        spack.binary_distribution.build_tarball(
+            spec, '.', unsigned=True, regenerate_index=True)
+
+        cache_prefix = spack.binary_distribution.build_cache_prefix(
+            'file://' + str(tmpdir))
+        spec_file = spack.binary_distribution.tarball_name(spec, '.spec.yaml')
+
+        # The index contains the spec.yaml file and its full hash
+        index = spack.binary_distribution.read_package_index(cache_prefix)
+        assert list(index) == [spec_file]
+        assert index[spec_file]['full_hash'] == spec.full_hash()
+
+        # Specs read from the index and downloaded separately are the same
+        monkeypatch.setattr(spack.binary_distribution, '_cached_specs', set())
+        from_index = spack.binary_distribution._read_specs(
+            entry['spec'] for entry in index.values())
+        assert [s.dag_hash() for s in from_index] == [spec.dag_hash()]
+
+        monkeypatch.setattr(spack.binary_distribution, '_cached_specs', set())
+        downloaded = spack.binary_distribution.try_download_specs(
+            urls=[cache_prefix + '/' + spec_file], force=True)
+        assert [s.dag_hash() for s in downloaded] == [spec.dag_hash()]
+
+        # A build cache without a valid index is ignored
+        with open(os.path.join(
+                str(tmpdir), 'build_cache', 'index.json.gz'), 'w') as f:
+            f.write('not gzipped')
+        assert spack.binary_distribution.read_package_index(
+            cache_prefix) is None
+
+
+@pytest.mark.parametrize('compression', ['bz2', 'gz', 'xz'])
+@pytest.mark.parametrize('parallel', [True, False])
+def test_build_tarball_round_trip(
+        compression, parallel, install_mockery, mock_fetch, monkeypatch,
+        tmpdir):
+    if not parallel:
+        # (De)compress with Python instead of a parallel program
+        if compression == 'xz' and sys.version_info < (3,):
+            pytest.skip('Python 2 has no xz module')
+        monkeypatch.setattr(
+            spack.binary_distribution, 'compression_program', lambda x: None)
+    elif not spack.binary_distribution.compression_program(compression):
+        pytest.skip('No parallel program for %s' % compression)
+
+    with tmpdir.as_cwd():
+        spec = spack.spec.Spec('trivial-install-test-package').concretized()
+        install(str(spec))
+
+        # Hard links are preserved in the install prefix
+        readme = os.path.join(spec.prefix, 'readme.txt')
+        with open(readme, 'w') as f:
+            f.write('readme')
+        os.link(readme, os.path.join(spec.prefix, 'hardlink.txt'))
+
+        spack.binary_distribution.build_tarball(
+            spec, '.', unsigned=True, compression=compression)
+        spackfile_path = os.path.join(
+            spack.binary_distribution.build_cache_prefix('.'),
+            spack.binary_distribution.tarball_path_name(spec, '.spack'))
+
+        # The .spack archive contains the tarball and the spec file
+        with closing(tarfile.open(spackfile_path)) as spackfile:
+            assert spackfile.getnames() == [
+                spack.binary_distribution.tarball_name(
+                    spec, '.tar.' + compression),
+                spack.binary_distribution.tarball_name(spec, '.spec.yaml')]
+
+        spec.package.do_uninstall(force=True)
+        spack.binary_distribution.extract_tarball(
+            spec, spackfile_path, unsigned=True)
+
+        assert os.path.samefile(
+            readme, os.path.join(spec.prefix, 'hardlink.txt'))
+        buildinfo = spack.binary_distribution.read_buildinfo_file(
+            spec.prefix)
+        assert 'readme.txt' in buildinfo['relocate_textfiles']
+
+
+#: Files added to the tarballs (de)compressed by the tests below
+_tarball_contents = dict((name, name * 10000) for name in 'abc')
+
+
+def _add_contents(tar):
+    for name, content in sorted(_tarball_contents.items()):
+        data = content.encode()
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def _read_tarball(fileobj, compression, parallel):
+    contents = {}
+    with spack.binary_distribution._open_tarball_reader(
+            fileobj, compression, parallel) as tar:
+        for member in tar:
+            contents[member.name] = tar.extractfile(member).read().decode()
+    return contents
+
+
+def test_read_multistream_bz2_tarball():
+    # pbzip2 and other parallel programs write several bzip2 streams
+    fileobj = io.BytesIO()
+    with closing(tarfile.open(fileobj=fileobj, mode='w')) as tar:
+        _add_contents(tar)
+    data = fileobj.getvalue()
+    half = len(data) // 2
+    compressed = bz2.compress(data[:half]) + bz2.compress(data[half:])
+
+    contents = _read_tarball(io.BytesIO(compressed), 'bz2', parallel=False)
+    assert contents == _tarball_contents
+
+
+@pytest.mark.parametrize('compression', ['bz2', 'gz', 'xz'])
+def test_tarball_from_program_read_by_python(compression, tmpdir):
+    # Tarballs compressed by the parallel programs are read by clients
+    # decompressing them with Python
+    if not spack.binary_distribution.compression_program(compression):
+        pytest.skip('No parallel program for %s' % compression)
+    if compression == 'xz' and sys.version_info < (3,):
+        pytest.skip('Python 2 has no xz module')
+
+    tarball_path = str(tmpdir.join('prefix.tar.' + compression))
+    with open(tarball_path, 'wb') as f:
+        with spack.binary_distribution._open_tarball_writer(
+                f, compression) as tar:
+            _add_contents(tar)
+
+    with open(tarball_path, 'rb') as f:
+        contents = _read_tarball(f, compression, parallel=False)
+    assert contents == _tarball_contents
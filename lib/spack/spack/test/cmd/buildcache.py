@@ -41,3 +41,23 @@ def test_buildcache_list_duplicates(mock_get_specs, capsys):
         output = buildcache('list', 'mpileaks', '@2.3')
 
     assert output.count('mpileaks') == 3
+
+
+@pytest.mark.db
+def test_buildcache_benchmark(database, monkeypatch):
+    monkeypatch.setattr(
+        spack.binary_distribution, 'compression_program', lambda x: None)
+    output = buildcache('benchmark', '-c', 'gz', 'mpileaks ^mpich')
+
+    assert 'mpileaks@2.3' in output
+    assert 'decompress MB/s' in output
+    assert 'gz     python' in output
+
+
+@pytest.mark.db
+@pytest.mark.requires_executables('file')
+def test_buildcache_benchmark_file_types(database):
+    output = buildcache('benchmark', '--file-types', 'mpileaks ^mpich')
+
+    assert 'mpileaks@2.3' in output
+    assert 'mismatches' in output
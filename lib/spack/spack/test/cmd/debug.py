@@ -8,6 +8,12 @@
 import os
 import os.path
 
+import llnl.util.lock
+
+import spack.caches
+import spack.config
+import spack.util.file_cache
+import spack.util.lock as lk
 from spack.main import SpackCommand
 from spack.util.executable import which
 
@@ -41,3 +47,50 @@ def test_create_db_tarball(tmpdir, database):
 
             spec_suffix = '%s/.spack/spec.yaml' % spec.dag_hash()
             assert spec_suffix in contents
+
+
+def test_hash_benchmark(mock_packages):
+    out = debug('hash-benchmark', '-n', '5')
+
+    assert 'Hashed 5 specs' in out
+    assert 'mismatches: 0' in out
+
+
+@pytest.mark.usefixtures('config', 'mock_packages')
+def test_copy_benchmark():
+    out = debug('copy-benchmark', '-c', '2', 'mpileaks ^mpich')
+
+    assert 'Copied 1 specs with 6 nodes 2 times' in out
+    assert 'peak RSS (MB)' in out
+    assert 'memory saved' in out
+
+
+def test_import_time():
+    out = debug('import-time', '-n', '1', 'arch')
+
+    assert 'slowest imports' in out
+    assert '(startup)' in out
+    assert 'arch' in out
+
+
+def test_lock_report(tmpdir, monkeypatch, mutable_config):
+    monkeypatch.setattr(llnl.util.lock, '_statistics', {})
+    monkeypatch.setattr(
+        spack.caches, 'misc_cache',
+        spack.util.file_cache.FileCache(str(tmpdir.join('cache'))))
+    lock_path = str(tmpdir.join('lockfile'))
+    lock = lk.Lock(lock_path, desc='test')
+    lock.acquire_write()
+    lock.release_write()
+
+    # Statistics are only saved when enabled
+    lk.save_statistics()
+    assert 'config:lock_statistics' in debug('lock-report')
+
+    spack.config.set('config:lock_statistics', True)
+    lk.save_statistics()
+    out = debug('lock-report')
+    assert 'test: {0}[0:0]'.format(lock_path) in out
+
+    debug('lock-report', '--clear')
+    assert 'config:lock_statistics' in debug('lock-report')
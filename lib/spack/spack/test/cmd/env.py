@@ -9,10 +9,13 @@
 import pytest
 
 import llnl.util.filesystem as fs
+import llnl.util.tty as tty
 
 import spack.hash_types as ht
 import spack.modules
 import spack.environment as ev
+import spack.spec
+import spack.user_environment as uenv
 
 from spack.cmd.env import _env_create
 from spack.spec import Spec
@@ -139,6 +142,54 @@ def test_concretize():
     assert any(x.name == 'mpileaks' for x in env_specs)
 
 
+def test_concretize_in_parallel(monkeypatch):
+    e = ev.create('test')
+    for spec in ('mpileaks', 'libdwarf', 'zmpi', 'dyninst ^libelf@0.8.12'):
+        e.add(spec)
+    e.concretize(jobs=1)
+
+    # Specs must be concretized by the worker processes only
+    pid = os.getpid()
+    concretize_from_constraints = ev._concretize_from_constraints
+
+    def in_worker(spec_constraints):
+        assert os.getpid() != pid
+        return concretize_from_constraints(spec_constraints)
+    monkeypatch.setattr(ev, '_concretize_from_constraints', in_worker)
+
+    concretized_order = e.concretized_order
+    specs_by_hash = e.specs_by_hash
+    e.concretize(force=True, jobs=2)
+
+    assert e.concretized_order == concretized_order
+    assert e.specs_by_hash == specs_by_hash
+    assert e.specs_by_hash[e.concretized_order[3]].satisfies(
+        'dyninst ^libelf@0.8.12')
+
+
+def test_concretize_in_parallel_reports_errors():
+    e = ev.create('test')
+    e.add('mpileaks')
+    e.add('conflict%clang+foo')
+
+    with pytest.raises(spack.spec.ConflictsInSpecError):
+        e.concretize(jobs=2)
+
+
+def test_concretize_in_parallel_reports_exits(monkeypatch):
+    e = ev.create('test')
+    e.add('mpileaks')
+    e.add('libdwarf')
+
+    # Workers exiting do not hang the concretization, which exits too
+    def die(spec_constraints):
+        tty.die('cannot concretize {0}'.format(spec_constraints[0]))
+    monkeypatch.setattr(ev, '_concretize_from_constraints', die)
+
+    with pytest.raises(SystemExit):
+        e.concretize(jobs=2)
+
+
 def test_env_install_all(install_mockery, mock_fetch):
     e = ev.create('test')
     e.add('cmake-client')
@@ -888,6 +939,42 @@ def test_env_updates_view_install(
     check_mpileaks_and_deps_in_view(view_dir)
 
 
+def test_env_view_modifications_are_cached(
+        tmpdir, mock_stage, mock_fetch, install_mockery, monkeypatch):
+    view_dir = tmpdir.mkdir('view')
+    env('create', '--with-view=%s' % view_dir, 'test')
+    with ev.read('test'):
+        install('--fake', 'mpileaks')
+
+    computed = []
+    modifications_for_spec = uenv.environment_modifications_for_spec
+
+    def counting_modifications_for_spec(spec, view=None):
+        computed.append(spec.name)
+        return modifications_for_spec(spec, view)
+    monkeypatch.setattr(uenv, 'environment_modifications_for_spec',
+                        counting_modifications_for_spec)
+
+    shell = ev.read('test').add_default_view_to_shell('sh')
+    assert os.path.join(str(view_dir), 'bin') in shell
+    assert computed == ['mpileaks']
+
+    # The cached modifications are used by the next activation
+    assert ev.read('test').add_default_view_to_shell('sh') == shell
+    assert ev.read('test').add_default_view_to_shell('csh')
+    assert computed == ['mpileaks']
+    assert os.path.exists(os.path.join(
+        ev.read('test').shell_cache_path, 'activate.pickle'))
+
+    # Installing another spec writes the lockfile, and invalidates them
+    with ev.read('test'):
+        install('--fake', 'libelf')
+
+    del computed[:]
+    ev.read('test').add_default_view_to_shell('sh')
+    assert sorted(computed) == ['libelf', 'mpileaks']
+
+
 def test_env_without_view_install(
         tmpdir, mock_stage, mock_fetch, install_mockery):
     # Test enabling a view after installing specs
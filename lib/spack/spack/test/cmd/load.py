@@ -4,8 +4,10 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 import os
 from spack.main import SpackCommand
+import spack.caches
 import spack.spec
 import spack.user_environment as uenv
+import spack.util.file_cache
 
 load = SpackCommand('load')
 unload = SpackCommand('unload')
@@ -83,6 +85,38 @@ def test_load_includes_run_env(install_mockery, mock_fetch, mock_archive,
     assert 'setenv FOOBAR mpileaks' in csh_out
 
 
+def test_load_caches_modifications(install_mockery, mock_fetch, mock_archive,
+                                   mock_packages, tmpdir, monkeypatch):
+    """Tests that load reuses the environment modifications it computed
+    for the same specs, until the database changes."""
+    cache = spack.util.file_cache.FileCache(str(tmpdir))
+    monkeypatch.setattr(spack.caches, 'misc_cache', cache)
+    monkeypatch.setattr(uenv, 'load_cache_dir', 'load')
+    install('mpileaks')
+
+    computed = []
+    modifications_for_spec = uenv.environment_modifications_for_spec
+
+    def counting_modifications_for_spec(spec, view=None):
+        computed.append(spec.name)
+        return modifications_for_spec(spec, view)
+    monkeypatch.setattr(uenv, 'environment_modifications_for_spec',
+                        counting_modifications_for_spec)
+
+    sh_out = load('--sh', '--only', 'package', 'mpileaks')
+    assert computed == ['mpileaks']
+    assert tmpdir.join('load').listdir()
+
+    assert load('--sh', '--only', 'package', 'mpileaks') == sh_out
+    assert 'setenv FOOBAR mpileaks' in load(
+        '--csh', '--only', 'package', 'mpileaks')
+    assert computed == ['mpileaks']
+
+    install('libelf')
+    assert load('--sh', '--only', 'package', 'mpileaks') == sh_out
+    assert computed == ['mpileaks', 'mpileaks']
+
+
 def test_load_fails_no_shell(install_mockery, mock_fetch, mock_archive,
                              mock_packages):
     """Test that spack load prints an error message without a shell."""
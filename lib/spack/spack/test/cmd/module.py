@@ -3,13 +3,19 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os.path
 import re
 
 import pytest
 
+import llnl.util.tty as tty
+
+import spack.config
 import spack.main
 import spack.modules
+import spack.modules.common
+import spack.modules.tcl
 from spack.test.conftest import use_store, use_configuration, use_repo
 
 module = spack.main.SpackCommand('module')
@@ -230,3 +236,112 @@ def test_setdefault_command(
         assert os.path.exists(writers[k].layout.filename)
     assert os.path.exists(link_name) and os.path.islink(link_name)
     assert os.path.realpath(link_name) == writers[preferred].layout.filename
+
+
+@pytest.fixture()
+def written_module_files(monkeypatch):
+    """Records the names of the specs whose module files are written."""
+    written = []
+    write = spack.modules.common.BaseModuleFileWriter.write
+
+    def _write(writer, overwrite=False):
+        written.append(writer.spec.name)
+        write(writer, overwrite=overwrite)
+
+    monkeypatch.setattr(
+        spack.modules.common.BaseModuleFileWriter, 'write', _write)
+    return written
+
+
+@pytest.fixture()
+def tmp_module_root(tmpdir):
+    """Writes tcl module files under a temporary root."""
+    root = str(tmpdir.join('modules'))
+    with spack.config.override('config:module_roots', {'tcl': root}):
+        yield root
+
+
+@pytest.mark.db
+def test_refresh_incremental(
+        database, tmp_module_root, written_module_files, monkeypatch):
+    module('tcl', 'refresh', '-y')
+    total = len(written_module_files)
+    assert total > 1
+
+    # Nothing changed since the last refresh
+    del written_module_files[:]
+    module('tcl', 'refresh', '-y', '--incremental')
+    assert written_module_files == []
+
+    # A module file that was removed is written again
+    module('tcl', 'rm', '-y', 'libelf')
+    module('tcl', 'refresh', '-y', '--incremental')
+    assert written_module_files == ['libelf']
+
+    # All the module files are written again when the configuration
+    # of module files changes
+    del written_module_files[:]
+    configuration = {'all': {'environment': {'set': {'FOO': 'bar'}}}}
+    monkeypatch.setattr(
+        spack.modules.tcl, 'configuration', lambda: configuration)
+    monkeypatch.setattr(spack.modules.tcl, 'configuration_registry', {})
+    module('tcl', 'refresh', '-y', '--incremental')
+    assert len(written_module_files) == total
+
+
+@pytest.mark.db
+def test_refresh_incremental_renamed_dependency(
+        database, tmp_module_root, written_module_files, monkeypatch):
+    configuration = {'all': {'autoload': 'direct'}}
+    monkeypatch.setattr(
+        spack.modules.tcl, 'configuration', lambda: configuration)
+    monkeypatch.setattr(spack.modules.tcl, 'configuration_registry', {})
+    module('tcl', 'refresh', '-y')
+
+    # Renaming a dependency changes the module files that load it
+    del written_module_files[:]
+    configuration['libelf'] = {'suffixes': {'libelf': 'renamed'}}
+    monkeypatch.setattr(spack.modules.tcl, 'configuration_registry', {})
+    module('tcl', 'refresh', '-y', '--incremental')
+    assert 'libelf' in written_module_files
+    assert 'libdwarf' in written_module_files
+
+    libelf, libdwarf = [spack.modules.tcl.TclModulefileWriter(
+        database.query_one(x)) for x in ('libelf', 'libdwarf')]
+    assert 'renamed' in libelf.layout.use_name
+    with open(libdwarf.layout.filename) as f:
+        assert 'module load {0}'.format(libelf.layout.use_name) in f.read()
+
+
+@pytest.mark.db
+def test_refresh_in_parallel(database, tmp_module_root, monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(spack.modules.common, 'parallel_write_threshold', 1)
+    writers = [spack.modules.tcl.TclModulefileWriter(spec)
+               for spec in database.query()]
+
+    module('tcl', 'refresh', '-y', '--delete-tree', '-j', '2')
+    for writer in writers:
+        assert os.path.exists(writer.layout.filename)
+
+    # The hash of the inputs of each module file is saved
+    root = writers[0].layout.dirname()
+    inputs = spack.modules.common.read_module_inputs(root)
+    assert sorted(inputs) == sorted(x.spec.dag_hash() for x in writers)
+    assert all(inputs[x.spec.dag_hash()] == x.inputs_hash() for x in writers)
+
+
+@pytest.mark.db
+def test_refresh_in_parallel_reports_exits(
+        database, tmp_module_root, monkeypatch):
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 2)
+    monkeypatch.setattr(spack.modules.common, 'parallel_write_threshold', 1)
+
+    # Workers exiting do not hang the refresh
+    def die(writer, overwrite=False):
+        tty.die('cannot write {0}'.format(writer.spec.name))
+    monkeypatch.setattr(spack.modules.tcl.TclModulefileWriter, 'write', die)
+
+    output = module('tcl', 'refresh', '-y', '-j', '2')
+    assert output.count('Could not write module file') == len(
+        database.query())
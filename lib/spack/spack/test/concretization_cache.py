@@ -0,0 +1,121 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import os
+
+import pytest
+
+import spack.caches
+import spack.concretization_cache
+import spack.config
+import spack.main
+import spack.repo
+import spack.spec
+import spack.util.file_cache
+from spack.spec import Spec
+
+spec_cmd = spack.main.SpackCommand('spec')
+
+
+@pytest.fixture()
+def concretization_cache(tmpdir, monkeypatch, config, mock_packages):
+    """Enable the concretization cache, in a temporary misc_cache."""
+    cache = spack.util.file_cache.FileCache(str(tmpdir))
+    monkeypatch.setattr(spack.caches, 'misc_cache', cache)
+    monkeypatch.setattr(spack.concretization_cache, 'enabled', lambda: True)
+    return tmpdir.join(spack.concretization_cache.cache_dir)
+
+
+def cached_files(cache_dir):
+    return [f for f in cache_dir.listdir() if f.ext == '.json']
+
+
+def test_concretize_reads_cached_spec(concretization_cache, monkeypatch):
+    fresh = Spec('patch-several-dependencies').concretized()
+    assert len(cached_files(concretization_cache)) == 1
+
+    def fail(spec, tests):
+        raise AssertionError('spec was concretized again')
+    monkeypatch.setattr(Spec, '_concretize', fail)
+
+    cached = Spec('patch-several-dependencies').concretized()
+    assert cached.concrete
+    assert cached.eq_dag(fresh, deptypes=True)
+    assert cached.build_hash() == fresh.build_hash()
+    assert cached['libelf'].patches == fresh['libelf'].patches
+
+
+def test_concretize_without_cache(concretization_cache, monkeypatch):
+    monkeypatch.setattr(
+        spack.concretization_cache, 'enabled',
+        lambda: spack.config.get('config:concretization_cache'))
+
+    spec_cmd('mpileaks')
+    assert len(cached_files(concretization_cache)) == 1
+
+    spack.concretization_cache.clear()
+    spec_cmd('--no-cache', 'mpileaks')
+    assert not concretization_cache.check()
+
+
+def test_key_depends_on_configuration(concretization_cache, mutable_config):
+    spec = Spec('mpileaks')
+    key = spack.concretization_cache.key(spec)
+    assert key == spack.concretization_cache.key(Spec('mpileaks'))
+    assert key != spack.concretization_cache.key(spec, tests=True)
+    assert key != spack.concretization_cache.key(Spec('mpileaks ^mpich'))
+
+    spack.config.set('packages', {'mpileaks': {'version': ['2.2']}})
+    assert key != spack.concretization_cache.key(spec)
+
+
+def test_key_depends_on_packages(concretization_cache, monkeypatch):
+    spec = Spec('mpileaks')
+    key = spack.concretization_cache.key(spec)
+
+    # A package file of the repository changed
+    last_mtime = spack.repo.Repo.last_mtime
+    monkeypatch.setattr(
+        spack.repo.Repo, 'last_mtime', lambda repo: last_mtime(repo) + 10)
+    assert key != spack.concretization_cache.key(spec)
+
+
+def test_specs_with_concrete_nodes_are_not_cached(concretization_cache):
+    zmpi = Spec('zmpi').concretized()
+    spec = Spec('mpileaks')
+    spec._add_dependency(zmpi, ('build', 'link'))
+
+    assert spack.concretization_cache.key(spec) is None
+
+
+def test_cached_spec_removed_while_read(concretization_cache, monkeypatch):
+    spec = Spec('libelf').concretized()
+    key = spack.concretization_cache.key(Spec('libelf'))
+    utime = os.utime
+
+    def remove_and_utime(path, times):
+        # Another process evicts the entry after it was read
+        os.remove(path)
+        utime(path, times)
+    monkeypatch.setattr(os, 'utime', remove_and_utime)
+
+    assert spack.concretization_cache.get(key) == spec
+    assert not cached_files(concretization_cache)
+
+
+def test_least_recently_used_specs_are_removed(
+        concretization_cache, monkeypatch):
+    monkeypatch.setattr(spack.concretization_cache, 'max_entries', 2)
+
+    for name in ('libelf', 'libdwarf', 'zmpi'):
+        Spec(name).concretized()
+
+    keys = set(f.purebasename for f in cached_files(concretization_cache))
+    assert keys == set(
+        [spack.concretization_cache.key(Spec(name))
+         for name in ('libdwarf', 'zmpi')])
+
+    spack.concretization_cache.clear()
+    assert not concretization_cache.check()
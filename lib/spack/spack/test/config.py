@@ -5,6 +5,7 @@
 
 import os
 import collections
+import copy
 import getpass
 import tempfile
 from six import StringIO
@@ -239,6 +240,86 @@ def test_write_to_same_priority_file(mock_low_high_config, compiler_specs):
     check_compiler_config(b_comps['compilers'], *compiler_specs.b)
 
 
+def test_merged_config_is_cached(
+        mock_low_high_config, write_config_file, monkeypatch):
+    merged = []
+    merge_sections = spack.config._merge_sections
+
+    def counting_merge_sections(datas, section):
+        merged.append(section)
+        return merge_sections(datas, section)
+    monkeypatch.setattr(
+        spack.config, '_merge_sections', counting_merge_sections)
+
+    write_config_file('config', config_low, 'low')
+    data = spack.config.get('config')
+    assert spack.config.get('config') == data
+    assert merged == ['config']
+
+    # Callers changing their copy do not change the cached section
+    data['install_tree'] = 'changed_tree'
+    del data['build_stage']
+    assert spack.config.get('config:install_tree') == 'install_tree_path'
+    assert spack.config.get('config:build_stage') == config_low[
+        'config']['build_stage']
+    assert merged == ['config']
+
+    spack.config.set('config:install_tree', 'set_tree', scope='high')
+    assert spack.config.get('config:install_tree') == 'set_tree'
+
+    scope = mock_low_high_config.pop_scope()
+    assert spack.config.get('config:install_tree') == 'install_tree_path'
+
+    mock_low_high_config.push_scope(scope)
+    assert spack.config.get('config:install_tree') == 'set_tree'
+
+
+def test_changed_config_file_is_read_again(
+        mock_low_high_config, write_config_file):
+    write_config_file('config', config_low, 'low')
+    assert spack.config.get('config:install_tree') == 'install_tree_path'
+
+    write_config_file('config', config_override_key, 'high')
+    assert spack.config.get('config:install_tree') == 'override_key'
+
+    write_config_file('config', config_merge_list, 'high')
+    assert spack.config.get('config:install_tree') == 'install_tree_path'
+
+
+def test_parsed_config_file_is_cached(tmpdir, monkeypatch, write_config_file):
+    monkeypatch.setattr(
+        spack.config, 'parsed_cache_path', str(tmpdir.join('cache')))
+    validated = []
+    validate = spack.config.validate
+
+    def counting_validate(data, schema, set_defaults=True):
+        validated.append(data)
+        return validate(data, schema, set_defaults)
+    monkeypatch.setattr(spack.config, 'validate', counting_validate)
+
+    def read_config():
+        scope = spack.config.ConfigScope('low', str(tmpdir.join('low')))
+        return scope.get_section('config')['config']
+
+    # Files modified in the last seconds are not cached
+    config_yaml = tmpdir.join('low', 'config.yaml')
+    write_config_file('config', config_low, 'low')
+    read_config()
+    config_yaml.setmtime(config_yaml.mtime() - 10)
+    assert read_config() == read_config() == config_low['config']
+    assert len(validated) == 2
+
+    # The cached data keeps the marks for error messages and blame
+    data = read_config()
+    assert data['install_tree']._start_mark.name == str(config_yaml)
+    assert len(validated) == 2
+
+    write_config_file('config', config_merge_list, 'low')
+    config_yaml.setmtime(config_yaml.mtime() - 10)
+    assert read_config()['build_stage'] == ['patha', 'pathb']
+    assert len(validated) == 3
+
+
 #
 # Sample repo data and tests
 #
@@ -762,6 +843,13 @@ def check_schema(name, file_contents):
     spack.config.validate(data, name)
 
 
+def test_config_defaults_are_valid():
+    # The builtin scope is not validated when Spack starts
+    data = copy.deepcopy(spack.config.config_defaults)
+    spack.config.validate(data, spack.config.section_schemas['config'])
+    assert data == spack.config.config_defaults
+
+
 def test_good_env_yaml(tmpdir):
     check_schema(spack.schema.env.schema, """\
 spack:
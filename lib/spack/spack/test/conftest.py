@@ -23,6 +23,7 @@
 
 import spack.architecture
 import spack.compilers
+import spack.concretization_cache
 import spack.config
 import spack.caches
 import spack.database
@@ -34,6 +35,7 @@
 import spack.platforms.test
 import spack.repo
 import spack.stage
+import spack.user_environment
 import spack.util.executable
 import spack.util.gpg
 
@@ -134,6 +136,29 @@ def reset_compiler_cache():
     spack.compilers._compiler_cache = {}
 
 
+@pytest.fixture(scope='function', autouse=True)
+def disable_concretization_cache(monkeypatch):
+    """Concretize specs from scratch in every test.
+
+    Tests change packages and configuration in memory, which the
+    concretization cache cannot detect."""
+    monkeypatch.setattr(spack.concretization_cache, 'enabled', lambda: False)
+
+
+@pytest.fixture(scope='function', autouse=True)
+def disable_parsed_config_cache(monkeypatch):
+    """Parse and validate configuration files in every test, instead of
+    reading them from the user's cache."""
+    monkeypatch.setattr(spack.config, 'parsed_cache_path', None)
+
+
+@pytest.fixture(scope='function', autouse=True)
+def disable_load_cache(monkeypatch):
+    """Compute the modifications of ``spack load`` in every test, instead
+    of reading them from the user's cache."""
+    monkeypatch.setattr(spack.user_environment, 'load_cache_dir', None)
+
+
 @pytest.fixture(scope='function', autouse=True)
 def mock_stage(tmpdir_factory, monkeypatch, request):
     """Establish the temporary build_stage for the mock archive."""
@@ -889,3 +889,184 @@ def _raise(db, spec):
     with pytest.raises(Exception):
         with spack.store.db.prefix_write_lock(s):
             assert False
+
+
+def _check_query_index(database):
+    """Check that the query indexes are consistent with the records."""
+    expected = spack.database.QueryIndex(database._data)
+    index = database._index
+
+    assert index.keys == set(database._data)
+    assert index.by_name == expected.by_name
+    assert index.explicit == expected.explicit
+    assert index.by_date == expected.by_date
+
+
+@pytest.mark.parametrize('query_str', [
+    'mpileaks', 'mpileaks@2.3', 'mpileaks@2.1:2.2', 'mpi', '%gcc',
+    '%gcc@4.5.0', 'callpath ^mpich', '@1.0:', 'externaltool', 'mpileaks%clang'
+])
+@pytest.mark.parametrize('explicit', [any, True, False])
+def test_query_index_matches_full_scan(database, query_str, explicit):
+    query_spec = spack.spec.Spec(query_str)
+
+    expected = sorted(
+        rec.spec for rec in database._data.values()
+        if (explicit is any or rec.explicit == explicit) and
+        rec.spec.satisfies(query_spec, strict=True))
+
+    results = database.query(query_spec, installed=any, explicit=explicit)
+    assert results == expected
+
+
+def test_query_index_dates(database):
+    all_specs = database.query(installed=any)
+    start = datetime.datetime.now() - datetime.timedelta(days=1)
+    end = datetime.datetime.now() + datetime.timedelta(days=1)
+
+    assert database.query(installed=any, start_date=start) == all_specs
+    assert database.query(installed=any, end_date=end) == all_specs
+    assert not database.query(installed=any, start_date=end)
+    assert not database.query(installed=any, end_date=start)
+
+
+def test_query_index_updates(mutable_database):
+    _check_query_index(mutable_database)
+
+    # Removing records updates the indexes
+    mpileaks = mutable_database.query_one('mpileaks ^mpich')
+    _mock_remove('mpileaks ^mpich')
+    _check_query_index(mutable_database)
+    assert not mutable_database.query('mpileaks ^mpich', installed=any)
+
+    # Adding them back updates the indexes as well
+    _mock_install(mpileaks)
+    _check_query_index(mutable_database)
+    assert mutable_database.query('mpileaks ^mpich') == [mpileaks]
+
+    # So does marking a dependency explicit
+    mpich = mutable_database.query_one('mpich')
+    assert mpich not in mutable_database.query(explicit=True)
+    mutable_database.update_explicit(mpich, True)
+    _check_query_index(mutable_database)
+    assert mpich in mutable_database.query(explicit=True)
+
+    # And reading the database back from file
+    with mutable_database.write_transaction():
+        mutable_database._read_from_file(mutable_database._index_path)
+    _check_query_index(mutable_database)
+
+
+def _check_journal_replay(db):
+    """Check that a fresh database reading the index and the journal from
+    disk has the same records as ``db``."""
+    other = spack.database.Database(db.root)
+    with other.read_transaction():
+        assert sorted(other._data) == sorted(db._data)
+        for key, rec in db._data.items():
+            assert other._data[key].to_dict() == rec.to_dict()
+    _check_query_index(other)
+
+
+def test_database_journal(mutable_database):
+    with open(mutable_database._index_path) as f:
+        index = f.read()
+
+    # Changes are appended to the journal instead of rewriting the index
+    _mock_remove('mpileaks ^mpich')
+    mpich = mutable_database.query_one('mpich')
+    mutable_database.update_explicit(mpich, True)
+
+    with open(mutable_database._index_path) as f:
+        assert f.read() == index
+    with open(mutable_database._journal_path) as f:
+        assert len(f.readlines()) == 2
+
+    _check_journal_replay(mutable_database)
+    assert not spack.database.Database(mutable_database.root).query(
+        'mpileaks ^mpich', installed=any)
+
+
+def test_database_journal_partial_write(mutable_database):
+    _mock_remove('mpileaks ^mpich')
+
+    # An interrupted write leaves an incomplete line behind, which is
+    # ignored by readers and overwritten by the next write.
+    with open(mutable_database._journal_path, 'a') as f:
+        f.write('{"verifier": "')
+    _check_journal_replay(mutable_database)
+
+    mpich = mutable_database.query_one('mpich')
+    mutable_database.update_explicit(mpich, True)
+    with open(mutable_database._journal_path) as f:
+        assert all(json.loads(line) for line in f)
+    _check_journal_replay(mutable_database)
+
+
+def test_database_journal_compaction(mutable_database, monkeypatch):
+    monkeypatch.setattr(spack.database, '_journal_max_entries', 1)
+
+    _mock_remove('mpileaks ^mpich')
+    assert os.path.getsize(mutable_database._journal_path) > 0
+
+    # The next write folds the journal back into the index
+    mpich = mutable_database.query_one('mpich')
+    mutable_database.update_explicit(mpich, True)
+    assert os.path.getsize(mutable_database._journal_path) == 0
+
+    with open(mutable_database._index_path) as f:
+        installs = json.load(f)['database']['installs']
+    assert sorted(installs) == sorted(mutable_database._data)
+    assert installs[mpich.dag_hash()]['explicit']
+    _check_journal_replay(mutable_database)
+
+
+def test_database_table(mutable_database):
+    # Force the whole index to be written again
+    with mutable_database.write_transaction():
+        mutable_database._modified = None
+    assert os.path.isfile(mutable_database._table_path)
+
+    db = spack.database.Database(mutable_database.root)
+    with db.read_transaction():
+        assert all(rec._spec is None for rec in db._data.values())
+
+    # Only the specs matching the query and their dependencies are built
+    libelf = db.query_one('libelf')
+    assert libelf == mutable_database.query_one('libelf')
+    built = [key for key, rec in db._data.items() if rec._spec is not None]
+    assert built == [libelf.dag_hash()]
+
+    # Specs built on demand share their nodes
+    mpileaks = db.query_one('mpileaks ^mpich')
+    callpath = db.query_one('callpath ^mpich')
+    assert mpileaks.concrete
+    assert any(dep is callpath for dep in mpileaks.dependencies())
+    _check_journal_replay(mutable_database)
+
+    # Records are written back without building their specs
+    with db.write_transaction():
+        db._modified = None
+    with open(db._index_path) as f:
+        installs = json.load(f)['database']['installs']
+    for key, rec in mutable_database._data.items():
+        assert installs[key]['spec'] == rec.to_dict()['spec']
+    _check_journal_replay(db)
+
+
+def test_database_table_out_of_date(mutable_database):
+    with mutable_database.write_transaction():
+        mutable_database._modified = None
+    with open(mutable_database._table_path, 'rb') as f:
+        table = f.read()
+
+    # A table left behind by another version of the index is not used
+    with mutable_database.write_transaction():
+        mutable_database._modified = None
+    with open(mutable_database._table_path, 'wb') as f:
+        f.write(table)
+
+    db = spack.database.Database(mutable_database.root)
+    with db.read_transaction():
+        assert all(rec._spec is not None for rec in db._data.values())
+    _check_journal_replay(mutable_database)
@@ -5,7 +5,7 @@
 
 import pytest
 
-from spack.fetch_strategy import from_url_scheme
+from spack.fetch_strategy import FsCache, from_url_scheme
 
 
 def test_fetchstrategy_bad_url_scheme():
@@ -15,3 +15,32 @@ def test_fetchstrategy_bad_url_scheme():
     with pytest.raises(ValueError):
         fetcher = from_url_scheme(  # noqa: F841
             'bogus-scheme://example.com/a/b/c')
+
+
+class MockFetcher(object):
+    """Fetcher writing part of an archive, then failing if asked to."""
+    cachable = True
+
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def archive(self, destination):
+        with open(destination, 'w') as f:
+            f.write('part')
+            if self.fail:
+                raise KeyboardInterrupt
+            f.write(' of an archive')
+
+
+def test_fs_cache_stores_complete_archives(tmpdir):
+    cache = FsCache(str(tmpdir))
+    archive = tmpdir.join('pkg', 'pkg-1.0.tar.gz')
+
+    # Archives interrupted while being stored are not in the cache
+    with pytest.raises(KeyboardInterrupt):
+        cache.store(MockFetcher(fail=True), 'pkg/pkg-1.0.tar.gz')
+    assert not tmpdir.join('pkg').listdir()
+
+    cache.store(MockFetcher(), 'pkg/pkg-1.0.tar.gz')
+    assert archive.read() == 'part of an archive'
+    assert tmpdir.join('pkg').listdir() == [archive]
@@ -3,18 +3,26 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os
 import py
 import pytest
+import signal
+import threading
+import time
 
 import llnl.util.filesystem as fs
 import llnl.util.tty as tty
 import llnl.util.lock as ulk
 
 import spack.binary_distribution
+import spack.build_environment
 import spack.compilers
+import spack.config
 import spack.directory_layout as dl
+import spack.fetch_strategy
 import spack.installer as inst
+import spack.mirror
 import spack.package_prefs as prefs
 import spack.repo
 import spack.spec
@@ -843,3 +851,165 @@ def test_install_skip_patch(install_mockery, mock_fetch):
     installer.install(fake=False, skip_patch=True)
 
     assert 'b' in installer.installed
+
+
+@pytest.mark.parametrize('concurrent,total,jobs', [
+    (1, None, None),
+    (1, 8, 8),
+    (4, 16, 4),
+    (3, 16, 5),
+    (8, 4, 1)])
+def test_build_jobs_per_build(concurrent, total, jobs):
+    """Test splitting the core budget between concurrent builds."""
+    assert inst._build_jobs_per_build(concurrent, total) == jobs
+
+
+@pytest.mark.parametrize('build_jobs,concurrent,jobs', [
+    (1, 1, None),
+    (8, 2, 4),
+    (2, 4, 1),
+    (64, 2, 4)])  # No more jobs than cores
+def test_build_jobs_per_build_from_config(
+        build_jobs, concurrent, jobs, mutable_config, monkeypatch):
+    """Test splitting the configured build_jobs between concurrent builds."""
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 8)
+    spack.config.set('config:build_jobs', build_jobs)
+    assert inst._build_jobs_per_build(concurrent, None) == jobs
+
+
+def test_install_concurrent_builds(install_mockery, mock_fetch):
+    """Test installing a package whose dependencies are built concurrently."""
+    spec, installer = create_installer('mpileaks')
+
+    installer.install(fake=True, concurrent_builds=4, jobs_total=4)
+
+    for dep in spec.traverse():
+        assert dep.package.installed
+        assert dep.name in installer.installed
+    assert not installer.building
+    assert installer.build_pool is None
+
+
+def test_install_concurrent_build_failure(install_mockery, monkeypatch,
+                                          capsys):
+    """Test handling of a failed background build of a dependency."""
+    start_fork = spack.build_environment.start_fork
+
+    def _start_fork(pkg, function, dirty, fake, jobs=None):
+        def _function():
+            if pkg.name == 'b':
+                raise inst.InstallError('Mock build failure')
+        return start_fork(pkg, _function, dirty, True, jobs)
+
+    monkeypatch.setattr(spack.build_environment, 'start_fork', _start_fork)
+    monkeypatch.setattr(spack.package.PackageBase, 'unit_test_check', _true)
+
+    spec, installer = create_installer('a')
+
+    with pytest.raises(inst.InstallError, match='Installation of a failed'):
+        installer.install(concurrent_builds=2, use_cache=False)
+
+    out = str(capsys.readouterr())
+    assert 'Mock build failure' in out
+    assert 'b' in installer.failed
+
+
+def test_install_concurrent_builds_forked_by_main_thread(
+        install_mockery, monkeypatch):
+    """Test that background builds are forked by the main thread only."""
+    main_thread = threading.current_thread()
+    start_fork = spack.build_environment.start_fork
+
+    def _start_fork(*args, **kwargs):
+        assert threading.current_thread() is main_thread
+        return start_fork(*args, **kwargs)
+
+    monkeypatch.setattr(spack.build_environment, 'start_fork', _start_fork)
+
+    spec, installer = create_installer('mpileaks')
+    installer.install(fake=True, concurrent_builds=2)
+
+    assert all(dep.package.installed for dep in spec.traverse())
+
+
+def test_install_concurrent_builds_terminated(install_mockery, monkeypatch):
+    """Test that the background builds are terminated rather than waited
+    for when the installation fails."""
+    children = []
+    start_fork = spack.build_environment.start_fork
+
+    def _start_fork(pkg, function, dirty, fake, jobs=None):
+        children.append(start_fork(
+            pkg, lambda: time.sleep(600), dirty, fake, jobs))
+        return children[-1]
+
+    def _interrupt(installer):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(spack.build_environment, 'start_fork', _start_fork)
+    monkeypatch.setattr(inst.PackageInstaller, '_wait_for_build', _interrupt)
+
+    spec, installer = create_installer('mpileaks')
+    with pytest.raises(KeyboardInterrupt):
+        installer.install(fake=True, concurrent_builds=2)
+
+    assert children
+    assert all(p.exitcode == -signal.SIGTERM for p, _ in children)
+    assert installer.build_pool is None
+
+
+def test_install_fetch_ahead(install_mockery, monkeypatch, tmpdir):
+    """Test fetching the sources of the queued packages ahead of the builds,
+    ignoring download failures."""
+    built = []
+
+    def _do_fetch(pkg, mirror_only=False):
+        # Fetches run in other processes, so they are recorded in files
+        tmpdir.ensure(pkg.name)
+        if pkg.name == 'b':
+            raise spack.fetch_strategy.FetchError('Mock fetch failure')
+
+    def _fork(pkg, function, dirty, fake, jobs=None):
+        # The sources of the package are fetched before it is built
+        assert tmpdir.join(pkg.name).check()
+        built.append(pkg.name)
+
+    monkeypatch.setattr(spack.package.PackageBase, 'do_fetch', _do_fetch)
+    monkeypatch.setattr(spack.build_environment, 'fork', _fork)
+    monkeypatch.setattr(spack.package.PackageBase, 'unit_test_check', _true)
+
+    spec, installer = create_installer('a')
+
+    installer.install(fetch_ahead=2, use_cache=False)
+
+    assert sorted(x.basename for x in tmpdir.listdir()
+                  if x.basename in ('a', 'b')) == ['a', 'b']
+    assert sorted(built) == ['a', 'b']
+    assert installer.fetch_pool is None
+    assert not installer.fetches
+    assert not inst._packages_to_fetch
+
+
+def test_install_fetch_ahead_binaries(install_mockery, monkeypatch, tmpdir):
+    """Test fetching ahead only the sources of the packages without a
+    binary package in a mirror."""
+    def _do_fetch(pkg, mirror_only=False):
+        tmpdir.ensure(pkg.name)
+
+    spec, installer = create_installer('a')
+    binary_specs = set([spack.spec.Spec.from_dict(spec['b'].to_dict())])
+    for binary_spec in binary_specs:
+        binary_spec._mark_concrete()
+
+    monkeypatch.setattr(spack.package.PackageBase, 'do_fetch', _do_fetch)
+    monkeypatch.setattr(spack.build_environment, 'fork', _noop)
+    monkeypatch.setattr(spack.package.PackageBase, 'unit_test_check', _true)
+    monkeypatch.setattr(inst, '_install_from_cache', _none)
+    monkeypatch.setattr(spack.mirror, 'MirrorCollection', lambda: {'m': 1})
+    monkeypatch.setattr(
+        spack.binary_distribution, 'get_specs', lambda: binary_specs)
+
+    installer.install(fetch_ahead=2, use_cache=True)
+
+    assert tmpdir.join('a').check()
+    assert not tmpdir.join('b').check()
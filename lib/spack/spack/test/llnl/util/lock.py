@@ -43,10 +43,12 @@
 
 """
 import collections
+import fcntl
 import os
 import socket
 import shutil
 import tempfile
+import time
 import traceback
 import glob
 import getpass
@@ -293,9 +295,9 @@ def fn(barrier):
     return fn
 
 
-def timeout_write(lock_path, start=0, length=0):
+def timeout_write(lock_path, start=0, length=0, blocking=False):
     def fn(barrier):
-        lock = lk.Lock(lock_path, start, length)
+        lock = lk.Lock(lock_path, start, length, blocking=blocking)
         barrier.wait()  # wait for lock acquire in first process
         with pytest.raises(lk.LockTimeoutError):
             lock.acquire_write(lock_fail_timeout)
@@ -303,9 +305,9 @@ def fn(barrier):
     return fn
 
 
-def timeout_read(lock_path, start=0, length=0):
+def timeout_read(lock_path, start=0, length=0, blocking=False):
     def fn(barrier):
-        lock = lk.Lock(lock_path, start, length)
+        lock = lk.Lock(lock_path, start, length, blocking=blocking)
         barrier.wait()  # wait for lock acquire in first process
         with pytest.raises(lk.LockTimeoutError):
             lock.acquire_read(lock_fail_timeout)
@@ -1294,3 +1296,120 @@ def test_upgrade_read_fails(tmpdir):
         msg = 'Cannot upgrade lock from read to write on file: lockfile'
         with pytest.raises(lk.LockUpgradeError, match=msg):
             lock.upgrade_read_to_write()
+
+
+#
+# Tests of locks waiting in lockf() instead of polling
+#
+def test_blocking_lock_timeout(lock_path):
+    multiproc_test(
+        acquire_write(lock_path),
+        timeout_write(lock_path, blocking=True),
+        timeout_read(lock_path, blocking=True))
+    multiproc_test(
+        acquire_read(lock_path, 0, 1),
+        timeout_write(lock_path, 0, 1, blocking=True),
+        timeout_write(lock_path, 0, 0, blocking=True))
+
+
+def test_blocking_lock_waits_for_release(lock_path):
+    def release_later(barrier):
+        lock = lk.Lock(lock_path)
+        lock.acquire_write()
+        barrier.wait()
+        time.sleep(0.5)
+        lock.release_write()
+
+    def wait(barrier):
+        lock = lk.Lock(lock_path, blocking=True)
+        barrier.wait()
+        wait_time, nattempts = lock._lock(fcntl.LOCK_EX)
+        # Taken as soon as released, in a second call to lockf()
+        assert 0.2 < wait_time < 2
+        assert nattempts == 2
+
+    multiproc_test(release_later, wait)
+
+
+def test_blocking_lock_adopts_timed_out_attempt(lock_path):
+    def read(barrier):
+        lock = lk.Lock(lock_path)
+        lock.acquire_read()
+        barrier.wait()  # the other process takes a read lock
+        barrier.wait()  # and times out upgrading it
+        lock.release_read()
+
+    def upgrade(barrier):
+        lock = lk.Lock(lock_path, blocking=True)
+        lock.acquire_read()
+        barrier.wait()
+        with pytest.raises(lk.LockTimeoutError):
+            lock.upgrade_read_to_write(lock_fail_timeout)
+        attempt = lock._attempt
+        assert attempt.abandoned and not attempt.done.is_set()
+        barrier.wait()
+
+        # The attempt still waiting for the write lock gets it, instead of
+        # a new call to lockf()
+        lock._poll_lock = lambda op: False
+        lock.upgrade_read_to_write()
+        assert lock._attempt is None and attempt.done.is_set()
+        assert lock._held == fcntl.LOCK_EX
+        lock.release_write()
+        assert lock._file is None
+
+    multiproc_test(read, upgrade)
+
+
+def test_abandoned_attempt_releases_lock(lock_path):
+    def write(barrier):
+        lock = lk.Lock(lock_path)
+        lock.acquire_write()
+        barrier.wait()  # the other processes try to take the lock
+        barrier.wait()  # and one of them times out
+        lock.release_write()
+        barrier.wait()
+
+    def time_out(barrier):
+        lock = lk.Lock(lock_path, blocking=True)
+        barrier.wait()
+        with pytest.raises(lk.LockTimeoutError):
+            lock.acquire_write(lock_fail_timeout)
+        barrier.wait()
+
+        # The thread waiting for the lock takes it, and releases it
+        assert lock._attempt.done.wait(barrier_timeout)
+        assert lock._attempt.error is None
+        barrier.wait()
+
+    def write_later(barrier):
+        lock = lk.Lock(lock_path)
+        barrier.wait()
+        barrier.wait()
+        barrier.wait()
+        lock.acquire_write(lock_fail_timeout)
+
+    multiproc_test(write, time_out, write_later)
+
+
+def test_lock_statistics(private_lock_path, monkeypatch):
+    monkeypatch.setattr(lk, '_statistics', {})
+    lock = lk.Lock(private_lock_path, desc='test')
+    for i in range(2):
+        lock.acquire_read()
+        lock.release_read()
+    lock.acquire_write()
+
+    read, write = sorted(lk.lock_statistics(), key=lambda s: s['type'])
+    assert read['path'] == private_lock_path
+    assert read['desc'] == 'test'
+    assert (read['type'], read['acquired'], read['timeouts']) == ('read', 2, 0)
+    assert read['attempt_histogram'] == [2, 0, 0, 0, 0, 0, 0]
+    assert sum(read['wait_histogram']) == 2
+    assert (write['type'], write['acquired']) == ('write', 1)
+
+    merged = lk.merge_lock_statistics([read, write, read])
+    assert len(merged) == 2
+    read = next(s for s in merged if s['type'] == 'read')
+    assert read['acquired'] == 4
+    assert read['attempt_histogram'] == [4, 0, 0, 0, 0, 0, 0]
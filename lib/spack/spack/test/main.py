@@ -4,10 +4,14 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 import os
+import sys
 
 import llnl.util.filesystem as fs
 
+import spack.config
 import spack.paths
+import spack.util.executable
+import spack.util.lock
 from spack.main import get_version, main
 
 
@@ -61,3 +65,30 @@ def test_get_version_bad_git(tmpdir, working_env):
 
     os.environ["PATH"] = str(tmpdir)
     assert spack.spack_version == get_version()
+
+
+def test_startup_imports_little():
+    """Only the commands that need them import specs, repositories and
+    environments."""
+    python = spack.util.executable.Executable(sys.executable)
+    out = python('-c', 'import sys; import spack.main; '
+                 'print(" ".join(sys.modules))', output=str,
+                 env={'PYTHONPATH': os.pathsep.join(sys.path)})
+    modules = out.split()
+    assert 'spack.main' in modules
+    for name in ('spack.spec', 'spack.repo', 'spack.environment'):
+        assert name not in modules
+
+
+def test_lock_statistics_do_not_hide_errors(monkeypatch, capfd):
+    def _save_statistics():
+        raise spack.config.ConfigError('Mock failure to read config.yaml')
+    monkeypatch.setattr(spack.util.lock, 'save_statistics', _save_statistics)
+
+    argv = ['config', 'get', 'no_such_section']
+    monkeypatch.setattr(sys, 'argv', ['spack'] + argv)
+    assert main(argv) != 0
+
+    err = capfd.readouterr()[1]
+    assert 'no_such_section' in err
+    assert 'Mock failure' not in err
@@ -3,12 +3,17 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import collections
 import filecmp
+import hashlib
 import os
+import shutil
+
 import pytest
 
 import spack.repo
 import spack.mirror
+import spack.util.crypto
 import spack.util.executable
 from spack.spec import Spec
 from spack.stage import Stage
@@ -24,6 +29,8 @@
 
 repos = {}
 
+Archive = collections.namedtuple('Archive', ['url', 'path'])
+
 
 def set_up_package(name, repository, url_attr):
     """Set up a mock package to be mirrored.
@@ -55,7 +62,8 @@ def check_mirror():
         spack.config.set('mirrors', mirrors)
         with spack.config.override('config:checksum', False):
             specs = [Spec(x).concretized() for x in repos]
-            spack.mirror.create(mirror_root, specs)
+            _, _, error = spack.mirror.create(mirror_root, specs)
+            assert not error
 
         # Stage directory exists
         assert os.path.isdir(mirror_root)
@@ -187,8 +195,9 @@ def successful_apply(*args, **kwargs):
         monkeypatch.setattr(spack.patch, 'apply_patch', successful_apply)
         monkeypatch.setattr(spack.caches.MirrorCache, 'store', record_store)
 
+        # The archives are recorded by this process
         with spack.config.override('config:checksum', False):
-            spack.mirror.create(mirror_root, list(spec.traverse()))
+            spack.mirror.create(mirror_root, list(spec.traverse()), jobs=1)
 
         assert not (set([
             'abcd1234abcd1234abcd1234abcd1234abcd1234abcd1234abcd1234abcd1234',
@@ -196,6 +205,66 @@ def successful_apply(*args, **kwargs):
         ]) - files_cached_in_mirror)
 
 
+def test_mirror_create_concurrent(mock_archive):
+    """Test mirroring packages concurrently, storing their shared archive
+    once, and adding them again to the mirror."""
+    set_up_package('b', mock_archive, 'url')
+    set_up_package('c', mock_archive, 'url')
+
+    with Stage('spack-mirror-test') as stage:
+        mirror_root = os.path.join(stage.path, 'test-mirror')
+        specs = [Spec('b').concretized(), Spec('c').concretized()]
+
+        with spack.config.override('config:checksum', False):
+            present, mirrored, error = spack.mirror.create(
+                mirror_root, specs, jobs=2)
+            assert (len(present), len(mirrored), len(error)) == (1, 1, 0)
+
+            present, mirrored, error = spack.mirror.create(
+                mirror_root, specs, jobs=2)
+            assert (len(present), len(mirrored), len(error)) == (2, 0, 0)
+
+        # The shared archive is stored once, without temporary files
+        mirror_paths = spack.mirror.mirror_archive_paths(
+            specs[0].package.fetcher[0], 'b/b-1.0')
+        storage_path = os.path.join(mirror_root, mirror_paths.storage_path)
+        assert os.listdir(os.path.dirname(storage_path)) == [
+            os.path.basename(storage_path)]
+
+    repos.clear()
+
+
+@pytest.mark.skipif(
+    not which('git'), reason='requires git to be installed')
+def test_mirror_create_concurrent_sources(
+        mock_archive, mock_git_repository, tmpdir):
+    """Test mirroring packages with different archives and a git
+    repository concurrently."""
+    tar = which('tar', required=True)
+    source_dir = os.path.basename(mock_archive.path)
+    for name in ('b', 'c', 'trivial-install-test-package'):
+        # Each package gets an archive with its own content and checksum
+        archive_dir = tmpdir.join(name)
+        shutil.copytree(mock_archive.path, str(archive_dir.join(source_dir)))
+        archive_dir.join(source_dir, name).write(name)
+        with archive_dir.as_cwd():
+            tar('-czf', 'archive.tar.gz', source_dir)
+        archive_file = str(archive_dir.join('archive.tar.gz'))
+        set_up_package(name, Archive(
+            url='file://' + archive_file,
+            path=str(archive_dir.join(source_dir))), 'url')
+
+        pkg = spack.repo.get(name)
+        version = next(iter(pkg.versions))
+        pkg.versions[version]['checksum'] = spack.util.crypto.checksum(
+            hashlib.md5, archive_file)
+
+    set_up_package('git-test', mock_git_repository, 'git')
+
+    check_mirror()
+    repos.clear()
+
+
 class MockFetcher(object):
     """Mock fetcher object which implements the necessary functionality for
        testing MirrorCache
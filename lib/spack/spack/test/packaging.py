@@ -244,6 +244,7 @@ def test_needs_relocation():
 
     assert needs_binary_relocation('application', 'x-sharedlib')
     assert needs_binary_relocation('application', 'x-executable')
+    assert needs_binary_relocation('application', 'x-pie-executable')
     assert not needs_binary_relocation('application', 'x-octet-stream')
     assert not needs_binary_relocation('text', 'x-')
 
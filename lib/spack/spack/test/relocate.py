@@ -10,10 +10,12 @@
 import pytest
 
 import llnl.util.filesystem
+import spack.binary_distribution
 import spack.paths
 import spack.relocate
 import spack.store
 import spack.tengine
+import spack.util.elf
 import spack.util.executable
 
 
@@ -48,13 +50,14 @@ def source_file(tmpdir, is_relocatable):
 @pytest.mark.requires_executables(
     '/usr/bin/gcc', 'patchelf', 'strings', 'file'
 )
-def test_file_is_relocatable(source_file, is_relocatable):
+@pytest.mark.parametrize('flags', [['-no-pie'], ['-pie', '-fPIE']])
+def test_file_is_relocatable(source_file, is_relocatable, flags):
     compiler = spack.util.executable.Executable('/usr/bin/gcc')
     executable = str(source_file).replace('.c', '.x')
     compiler_env = {
         'PATH': '/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin'
     }
-    compiler(str(source_file), '-o', executable, env=compiler_env)
+    compiler(str(source_file), '-o', executable, *flags, env=compiler_env)
 
     assert spack.relocate.is_binary(executable)
     assert spack.relocate.file_is_relocatable(executable) is is_relocatable
@@ -87,3 +90,252 @@ def test_file_is_relocatable_errors(tmpdir):
         with pytest.raises(ValueError) as exc_info:
             spack.relocate.file_is_relocatable('delete.me')
         assert 'is not an absolute path' in str(exc_info.value)
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc', 'file')
+@pytest.mark.parametrize('flags', [
+    ['-c'], ['-shared', '-fPIC'], ['-pie', '-fPIE'], ['-no-pie']
+])
+def test_mime_type_binaries(tmpdir, flags):
+    source = tmpdir.join('main.c')
+    source.write('int main() { return 0; }\n')
+    binary = str(tmpdir.join('main.bin'))
+    compiler = spack.util.executable.Executable('/usr/bin/gcc')
+    compiler(str(source), '-o', binary, *flags)
+
+    # The types of binaries are the same as with the file program
+    assert (spack.relocate.mime_type(binary) ==
+            spack.relocate.file_command_mime_type(binary))
+
+
+@pytest.mark.parametrize('content,expected', [
+    ('#!/bin/bash\necho hello\n', ('text', 'x-shellscript')),
+    ('#!/usr/bin/env python\nprint(1)\n', ('text', 'x-script.python')),
+    ('#!/usr/bin/perl\nprint 1;\n', ('text', 'x-perl')),
+    ('#!/opt/spack/bin/python3.8\nprint(1)\n', ('text', 'plain')),
+    ('prefix=/usr/local\n', ('text', 'plain')),
+    ('caf\xe9 cr\xe8me\n', ('text', 'plain')),
+    ('{"prefix": "/usr/local"}\n', ('application', 'json')),
+    ('hello\x00world', ('application', 'octet-stream')),
+    ('!<arch>\nfoo.o/', ('application', 'x-archive')),
+    ('\xca\xfe\xba\xbe\x00\x00\x00\x02', ('application', 'x-mach-binary')),
+    ('\xcf\xfa\xed\xfe\x07\x00\x00\x01', ('application', 'x-mach-binary')),
+    ('', ('inode', 'x-empty')),
+])
+def test_mime_type(tmpdir, content, expected):
+    path = tmpdir.join('file')
+    path.write_binary(bytes(bytearray(ord(c) for c in content)))
+
+    assert spack.relocate.mime_type(str(path)) == expected
+
+
+def test_mime_types(tmpdir):
+    tmpdir.join('script').write('#!/bin/sh\n')
+    tmpdir.join('data').write_binary(b'\x00\x01')
+    tmpdir.join('link').mksymlinkto(tmpdir.join('script'))
+    files = [str(tmpdir.join(f)) for f in ('script', 'data', 'link')]
+
+    assert spack.relocate.mime_types(files) == {
+        files[0]: ('text', 'x-shellscript'),
+        files[1]: ('application', 'octet-stream'),
+        files[2]: ('inode', 'symlink'),
+    }
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_relocate_elf_binaries_without_patchelf(tmpdir, monkeypatch):
+    old_dir = str(tmpdir.join('old', 'install', 'tree'))
+    new_dir = str(tmpdir.join('new'))
+    source = tmpdir.join('main.c')
+    source.write('const char *lib = "%s/lib";\n'
+                 'int main() { return 0; }\n' % old_dir)
+
+    compiler = spack.util.executable.Executable('/usr/bin/gcc')
+    binaries = [str(tmpdir.join('main%d.x' % i)) for i in range(3)]
+    for binary in binaries:
+        compiler(str(source), '-o', binary, '-Wl,--enable-new-dtags',
+                 '-Wl,-rpath,%s/lib:/usr/lib' % old_dir)
+
+    # The RPATHs are shortened in place
+    def no_patchelf():
+        raise AssertionError('patchelf is not needed')
+    monkeypatch.setattr(spack.relocate, 'get_patchelf', no_patchelf)
+
+    spack.relocate.relocate_elf_binaries(binaries, old_dir, new_dir, False)
+
+    for binary in binaries:
+        assert spack.relocate.get_existing_elf_rpaths(binary) == [
+            new_dir + '/lib', '/usr/lib']
+        with open(binary, 'rb') as f:
+            assert old_dir.encode('utf-8') not in f.read()
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_relocate_elf_binaries_at_offsets(tmpdir, monkeypatch):
+    old_dir = str(tmpdir.join('old', 'install', 'tree'))
+    new_dir = str(tmpdir.join('new'))
+    source = tmpdir.join('main.c')
+    source.write('const char *lib = "%s/lib";\n'
+                 'int main() { return 0; }\n' % old_dir)
+    binary = str(tmpdir.join('main.x'))
+    spack.util.executable.Executable('/usr/bin/gcc')(
+        str(source), '-o', binary, '-Wl,-rpath,%s/lib:/usr/lib' % old_dir)
+    scanned = binary + '.scanned'
+    shutil.copy(binary, scanned)
+
+    entries, offsets = spack.relocate.binary_relocation_offsets(
+        binary, old_dir)
+    assert [e[1] for e in entries] == [old_dir + '/lib:/usr/lib']
+    assert len(offsets) == 1
+
+    # Records that do not match the binary are ignored
+    stale_entries = [e[:3] + [e[3] + 1] + e[4:] for e in entries]
+    spack.relocate.relocate_elf_binaries(
+        [scanned], old_dir, new_dir, False,
+        rpath_entries={scanned: stale_entries},
+        offsets={scanned: [offsets[0] + 1]})
+
+    # The binary is neither parsed nor scanned with the right records
+    def fail(*args):
+        raise AssertionError('the binary is parsed or scanned')
+    monkeypatch.setattr(spack.util.elf, 'search_path_entries', fail)
+    monkeypatch.setattr(spack.relocate, '_replace_prefix_nullterm', fail)
+
+    spack.relocate.relocate_elf_binaries(
+        [binary], old_dir, new_dir, False,
+        rpath_entries={binary: entries}, offsets={binary: offsets})
+    monkeypatch.undo()
+
+    assert spack.relocate.get_existing_elf_rpaths(binary) == [
+        new_dir + '/lib', '/usr/lib']
+    with open(binary, 'rb') as f:
+        with open(scanned, 'rb') as g:
+            assert f.read() == g.read()
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_relocate_pie_binaries(tmpdir):
+    old_dir = str(tmpdir.join('old', 'install', 'tree'))
+    new_dir = str(tmpdir.join('new'))
+    source = tmpdir.join('main.c')
+    source.write('int main() { return 0; }\n')
+    prefix = tmpdir.ensure('prefix', dir=True)
+    binary = str(prefix.ensure('bin', dir=True).join('main.x'))
+    spack.util.executable.Executable('/usr/bin/gcc')(
+        str(source), '-o', binary, '-pie', '-fPIE',
+        '-Wl,-rpath,%s/lib' % old_dir)
+    assert spack.relocate.mime_type(binary) == (
+        'application', 'x-pie-executable')
+
+    # Position independent executables are relocated like other binaries
+    buildinfo = spack.binary_distribution.get_buildinfo_dict(str(prefix))
+    assert buildinfo['relocate_binaries'] == [os.path.join('bin', 'main.x')]
+
+    spack.relocate.relocate_elf_binaries([binary], old_dir, new_dir, False)
+    assert spack.relocate.get_existing_elf_rpaths(binary) == [
+        new_dir + '/lib']
+
+
+def test_relocate_text_in_one_pass(tmpdir):
+    old_prefix, new_prefix = '/old/spack', '/new/spack'
+    old_path, new_path = '/old/spack/opt/spack', '/old/spack/opt/new'
+    script = tmpdir.join('script')
+    script.write('#!/bin/bash /old/spack/bin/sbang\n'
+                 'LIBS=-L/old/spack/opt/spack/lib -L/old/spack/lib\n'
+                 '/not/old/spack/opt/spack\n')
+    unchanged = tmpdir.join('unchanged')
+    unchanged.write('/usr/lib /old/sp\n')
+    empty = tmpdir.join('empty')
+    empty.write('')
+    files = [str(script), str(unchanged), str(empty)]
+
+    stats = spack.relocate.relocate_text(
+        files, old_path, new_path, old_prefix, new_prefix)
+
+    # The new path is not relocated again, even if it is in the old prefix
+    assert script.read() == (
+        '#!/bin/bash /new/spack/bin/sbang\n'
+        'LIBS=-L/old/spack/opt/new/lib -L/new/spack/lib\n'
+        '/not/old/spack/opt/spack\n')
+    assert unchanged.read() == '/usr/lib /old/sp\n'
+    assert stats == {
+        str(script): (107, 105),
+        str(unchanged): (17, 0),
+        str(empty): (0, 0),
+    }
+
+
+def test_replace_prefix_bin(tmpdir):
+    binary = tmpdir.join('binary')
+    binary.write_binary(b'\x7fELF\0/old/prefix/lib\0/old/prefix:/old/prefix'
+                        b'\0/usr/lib\0')
+
+    stats = spack.relocate.replace_prefix_bins(
+        [str(binary)], '/old/prefix', '/new')
+
+    assert binary.read_binary() == (
+        b'\x7fELF\0/new/lib' + b'\0' * 8 + b'/new:/new' + b'\0' * 15 +
+        b'/usr/lib\0')
+    assert stats == {str(binary): (54, 40)}
+
+    with pytest.raises(spack.relocate.BinaryStringReplacementException):
+        spack.relocate.replace_prefix_bin(
+            str(binary), '/new', '/longer/prefix')
+
+
+@pytest.mark.parametrize('new_path,new_prefix', [
+    ('/old/spack/opt/new', '/new/spack'),
+    ('/old/spack/opt/new', '/old/spack'),
+    ('/old/spack/opt/spack', '/new/spack'),
+])
+def test_relocate_text_at_offsets(tmpdir, new_path, new_prefix):
+    old_prefix, old_path = '/old/spack', '/old/spack/opt/spack'
+    text = ('#!/bin/bash /old/spack/bin/sbang\n'
+            'LIBS=-L/old/spack/opt/spack/lib -L/old/spack/lib\n'
+            '/not/old/spack/opt/spack /old/spack/x/old/spack\n')
+    recorded, scanned, stale = [
+        tmpdir.join(name) for name in ('recorded', 'scanned', 'stale')]
+    unchanged = tmpdir.join('unchanged')
+    for f in (recorded, scanned, stale):
+        f.write(text)
+    unchanged.write('/usr/lib\n')
+
+    offsets = spack.relocate.text_prefix_offsets(
+        str(recorded), old_path, old_prefix)
+    assert offsets == [0, 40, 67, 107]
+    assert spack.relocate.text_prefix_offsets(
+        str(unchanged), old_path, old_prefix) == []
+    stale.write('\n' + text)
+
+    stats = spack.relocate.relocate_text(
+        [str(recorded), str(scanned), str(stale), str(unchanged)],
+        old_path, new_path, old_prefix, new_prefix,
+        offsets={str(recorded): offsets, str(stale): offsets,
+                 str(unchanged): []})
+
+    # The same paths are replaced, with or without the offsets
+    assert recorded.read() == scanned.read()
+    assert stale.read() == '\n' + scanned.read()
+    assert stats[str(recorded)] == (0, stats[str(scanned)][1])
+    assert stats[str(stale)][0] == len(text) + 1
+    assert stats[str(unchanged)] == (0, 0)
+
+
+def test_replace_prefix_bin_at_offsets(tmpdir):
+    content = (b'\x7fELF\0/old/prefix/lib\0/old/prefix:/old/prefix'
+               b'\0/usr/lib\0')
+    recorded, scanned = tmpdir.join('recorded'), tmpdir.join('scanned')
+    for f in (recorded, scanned):
+        f.write_binary(content)
+
+    entries, offsets = spack.relocate.binary_relocation_offsets(
+        str(recorded), '/old/prefix')
+    assert entries is None
+    assert offsets == [5, 21]
+
+    stats = spack.relocate.replace_prefix_bins(
+        [str(recorded), str(scanned)], '/old/prefix', '/new',
+        offsets={str(recorded): offsets, str(scanned): [6]})
+
+    assert recorded.read_binary() == scanned.read_binary()
+    assert stats == {str(recorded): (0, 40), str(scanned): (54, 40)}
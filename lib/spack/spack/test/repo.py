@@ -3,11 +3,17 @@
 #
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
+import multiprocessing
 import os
 import pytest
 
+import llnl.util.tty as tty
+
+import spack.caches
 import spack.repo
 import spack.paths
+import spack.spec
+import spack.util.file_cache
 
 
 @pytest.fixture()
@@ -62,3 +68,76 @@ def test_repo_invisibles(mutable_mock_repo, extra_repo):
     with open(os.path.join(extra_repo.root, 'packages', '.invisible'), 'w'):
         pass
     extra_repo.all_package_names()
+
+
+def test_repo_package_metadata(mock_packages):
+    metadata = spack.repo.path.package_metadata('mpileaks')
+    pkg_cls = spack.repo.path.get_pkg_class('mpileaks')
+
+    assert metadata['versions'] == [
+        str(v) for v in sorted(pkg_cls.versions)]
+    assert sorted(metadata['variants']) == sorted(pkg_cls.variants)
+    assert sorted(metadata['dependencies']) == sorted(pkg_cls.dependencies)
+    assert metadata['dependencies']['mpi'] == [['', 'mpi', ['build', 'link']]]
+
+    metadata = spack.repo.path.package_metadata('builtin.mock.extension1')
+    assert metadata['extends'] == {'extendee': 'extendee'}
+
+    metadata = spack.repo.path.package_metadata('mpich')
+    assert metadata['provides'] == {
+        'mpi@:3': ['mpich@3:'], 'mpi@:1': ['mpich@:1']}
+
+    with pytest.raises(spack.repo.UnknownPackageError):
+        spack.repo.path.package_metadata('nonexistentpackage')
+
+
+def test_repo_extensions_for(mock_packages):
+    extensions = spack.repo.path.extensions_for('extendee')
+    assert sorted(p.name for p in extensions) == sorted(
+        p.name for p in spack.repo.path.all_packages()
+        if p.extends(spack.spec.Spec('extendee')))
+    assert 'extension1' in [p.name for p in extensions]
+
+
+def test_repo_index_parallel_update(mock_packages, tmpdir, monkeypatch):
+    def build_indexes():
+        repo = spack.repo.Repo(mock_packages.first_repo().root)
+        return dict((name, repo.index[name]) for name in repo.index.indexers)
+
+    # Build the indexes sequentially, then in parallel in another cache
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir.join('a'))))
+    monkeypatch.setattr(spack.repo, 'parallel_index_threshold', 10 ** 6)
+    expected = build_indexes()
+
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir.join('b'))))
+    monkeypatch.setattr(spack.repo, 'parallel_index_threshold', 1)
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 4)
+    indexes = build_indexes()
+
+    assert indexes['providers'] == expected['providers']
+    assert indexes['patches'].index == expected['patches'].index
+    assert dict(indexes['metadata']) == dict(expected['metadata'])
+    assert (dict((t, sorted(p)) for t, p in indexes['tags'].items()) ==
+            dict((t, sorted(p)) for t, p in expected['tags'].items()))
+
+
+def test_repo_index_parallel_update_exits(mock_packages, tmpdir, monkeypatch):
+    monkeypatch.setattr(spack.caches, 'misc_cache',
+                        spack.util.file_cache.FileCache(str(tmpdir)))
+    monkeypatch.setattr(spack.repo, 'parallel_index_threshold', 1)
+    monkeypatch.setattr(multiprocessing, 'cpu_count', lambda: 4)
+
+    # Workers exiting do not hang the update, which is done sequentially
+    pid = os.getpid()
+    update = spack.repo.TagIndexer.update
+
+    def die_in_worker(self, pkg_fullname):
+        if os.getpid() != pid:
+            tty.die('cannot index {0}'.format(pkg_fullname))
+        update(self, pkg_fullname)
+    monkeypatch.setattr(spack.repo.TagIndexer, 'update', die_in_worker)
+
+    repo = spack.repo.Repo(mock_packages.first_repo().root)
+    assert 'tag1' in repo.index['tags']
@@ -89,3 +89,19 @@ def test_yaml_aliases():
 
     # ensure no YAML aliases appear in syaml dumps.
     assert '*id' not in string
+
+
+@pytest.mark.parametrize('obj', [
+    {'a': 'b', 'c': ['d', 1, True, False, None], 'e': {}, 'f': []},
+    syaml.syaml_dict([('version', '1.0'), ('compiler', '10.0.0-apple')]),
+    {'quoted': ['yes', 'null', '~', '0o17', '1:20', '2020-01-01', '.inf',
+                '', "it's", 'a, b', 'x #y', ' x', '@x', '[x]', 'x:']},
+    {'plain': ["it's", 'x#y', 'x y', '-x', '=x', 'on', 2 ** 70, -3]},
+    {'': 'empty key'},
+    {'k' * 128: 'long key'},
+    {'multi': 'line\nstring', 'tab': 'a\tb', 'float': 1.5},
+    [('tuple', 'item'), {'nested': [{'a': [[]]}]}],
+])
+def test_dump_flow(obj):
+    """Test that flow dumps are identical to the ones of ruamel."""
+    assert syaml.dump_flow(obj) == syaml.dump(obj, default_flow_style=True)
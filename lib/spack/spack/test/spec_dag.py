@@ -9,8 +9,10 @@
 import pytest
 import spack.architecture
 import spack.package
+import spack.spec
 
 from spack.spec import Spec
+from spack.version import Version
 from spack.dependency import all_deptypes, Dependency, canonical_deptype
 from spack.test.conftest import MockPackage, MockPackageMultiRepo
 
@@ -620,6 +622,46 @@ def test_copy_concretized(self):
         copy_ids = set(id(s) for s in copy.traverse())
         assert not orig_ids.intersection(copy_ids)
 
+    @pytest.mark.usefixtures('config')
+    def test_copy_concretized_shares_attributes(self):
+        orig = Spec('mpileaks')
+        orig.concretize()
+        copy = orig.copy()
+
+        for o, c in zip(orig.traverse(), copy.traverse()):
+            assert c._shared
+            assert c.versions is o.versions
+            assert c.architecture is o.architecture
+            assert c.compiler is o.compiler
+            assert c.variants is not o.variants
+            assert c.variants.spec is c
+            assert c.variants == o.variants
+
+        # Nodes that are no longer concrete get their own attributes
+        copy._mark_concrete(False)
+        for o, c in zip(orig.traverse(), copy.traverse()):
+            assert not c._shared
+            assert c.versions is not o.versions
+            assert c.versions == o.versions
+            assert c.architecture is not o.architecture
+            assert all(c.variants[name] is not o.variants[name]
+                       for name in o.variants)
+
+        copy['libelf'].versions.add(Version('0.0.1'))
+        assert orig['libelf'].versions.concrete
+
+    @pytest.mark.usefixtures('config')
+    def test_copy_concretized_without_sharing(self, monkeypatch):
+        monkeypatch.setattr(spack.spec, 'share_concrete_nodes', False)
+        orig = Spec('mpileaks')
+        orig.concretize()
+        copy = orig.copy()
+
+        assert orig.eq_dag(copy)
+        for o, c in zip(orig.traverse(), copy.traverse()):
+            assert not c._shared
+            assert c.versions is not o.versions
+
     """
     Here is the graph with deptypes labeled (assume all packages have a 'dt'
     prefix). Arrows are marked with the deptypes ('b' for 'build', 'l' for
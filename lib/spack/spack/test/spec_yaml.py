@@ -9,6 +9,8 @@
 
 """
 import ast
+import base64
+import hashlib
 import inspect
 import os
 
@@ -296,6 +298,30 @@ def check_specs_equal(original_spec, spec_yaml_path):
         return original_spec.eq_dag(spec_from_yaml)
 
 
+def test_hashes_of_yaml_text(config, mock_packages):
+    """Test that specs are still hashed from the YAML text of their nodes,
+    whether they are concrete or not."""
+    def yaml_hash(spec, hash):
+        # Hash of the nodes when they were dumped by ruamel
+        yaml_text = syaml.dump(
+            spec.to_node_dict(hash=hash), default_flow_style=True)
+        sha = hashlib.sha1(yaml_text.encode('utf-8'))
+        return base64.b32encode(sha.digest()).lower().decode('utf-8')
+
+    for spec in (Spec('mpileaks').normalized(),
+                 Spec('mpileaks').concretized()):
+        for node in spec.traverse():
+            for hash in (ht.dag_hash, ht.build_hash):
+                assert node._cached_hash(hash) == yaml_hash(node, hash)
+
+    # Hashes of abstract specs are not kept once they are computed
+    spec = Spec('mpileaks').normalized()
+    dag_hash = spec.dag_hash()
+    spec['callpath'].versions = spack.version.VersionList(['0.8'])
+    assert spec.dag_hash() != dag_hash
+    assert spack.spec._abstract_hashes.hashes is None
+
+
 def test_save_dependency_spec_yamls_subset(tmpdir, config):
     output_path = str(tmpdir.mkdir('spec_yamls'))
 
@@ -5,6 +5,7 @@
 
 """Test that the Stage class works correctly."""
 import errno
+import hashlib
 import os
 import collections
 import shutil
@@ -16,13 +17,17 @@
 
 from llnl.util.filesystem import mkdirp, partition_path, touch, working_dir
 
+import llnl.util.tty as tty
+
 import spack.paths
 import spack.stage
+import spack.util.crypto
 import spack.util.executable
 
 from spack.resource import Resource
 from spack.stage import Stage, StageComposite, ResourceStage, DIYStage
 from spack.util.path import canonicalize_path
+from spack.version import Version
 
 # The following values are used for common fetch and stage mocking fixtures:
 _archive_base = 'test-files'
@@ -935,3 +940,65 @@ def test_cannot_access(capsys):
 
     captured = capsys.readouterr()
     assert 'Insufficient permissions' in str(captured)
+
+
+@pytest.mark.disable_clean_stage_check
+def test_get_checksums_for_versions(mock_archive, monkeypatch, capfd, tmpdir):
+    """Test checksumming several versions concurrently, skipping the ones
+    that cannot be downloaded."""
+    monkeypatch.setattr(tty, 'get_number', lambda *args, **kwargs: 3)
+    monkeypatch.setattr(spack.stage, '_max_checksum_workers', 2)
+    missing_url = 'file:///no/such/dir/test-1.0.tar.gz'
+    archives = {}
+    for version in ('2.0', '3.0'):
+        archive = tmpdir.join('test-{0}.tar.gz'.format(version))
+        shutil.copy(mock_archive.archive_file, str(archive))
+        archive.write(version, mode='a')
+        archives[version] = str(archive)
+    url_dict = {
+        Version('1.0'): missing_url,
+        Version('2.0'): 'file://' + archives['2.0'],
+        Version('3.0'): 'file://' + archives['3.0'],
+    }
+    staged = []
+
+    version_lines = spack.stage.get_checksums_for_versions(
+        url_dict, 'test', first_stage_function=lambda stage, url: (
+            staged.append(os.path.exists(stage.archive_file))))
+
+    assert version_lines.split('\n') == [
+        "    version('{0}', sha256='{1}')".format(
+            version, spack.util.crypto.checksum(
+                hashlib.sha256, archives[version]))
+        for version in ('3.0', '2.0')
+    ]
+    assert staged == [True]
+    assert "Failed to fetch {0}".format(missing_url) in capfd.readouterr()[0]
+
+
+@pytest.mark.disable_clean_stage_check
+def test_get_checksums_for_versions_with_same_url(mock_archive, monkeypatch):
+    """Test fetching the archive of versions sharing a URL once."""
+    monkeypatch.setattr(tty, 'get_number', lambda *args, **kwargs: 2)
+    fetched = []
+    fetch_and_checksum = spack.stage._fetch_and_checksum
+
+    def record_fetch_and_checksum(url, *args):
+        fetched.append(url)
+        return fetch_and_checksum(url, *args)
+    monkeypatch.setattr(
+        spack.stage, '_fetch_and_checksum', record_fetch_and_checksum)
+
+    url_dict = {
+        Version('2.0'): mock_archive.url,
+        Version('3.0'): mock_archive.url,
+    }
+    version_lines = spack.stage.get_checksums_for_versions(url_dict, 'test')
+
+    sha256 = spack.util.crypto.checksum(
+        hashlib.sha256, mock_archive.archive_file)
+    assert version_lines.split('\n') == [
+        "    version('3.0', sha256='{0}')".format(sha256),
+        "    version('2.0', sha256='{0}')".format(sha256),
+    ]
+    assert fetched == [mock_archive.url]
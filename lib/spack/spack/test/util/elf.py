@@ -0,0 +1,118 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+import shutil
+
+import pytest
+
+import spack.util.elf as elf
+from spack.util.executable import Executable, which
+
+long_rpath = '/very/long/path/to/some/install/prefix/lib:/another/lib64'
+
+
+@pytest.fixture()
+def binary(tmpdir):
+    """Returns a function compiling an executable with the given flags."""
+    source = tmpdir.join('main.c')
+    source.write('int main() { return 0; }\n')
+
+    def _binary(*flags):
+        path = str(tmpdir.join('main.x'))
+        compiler = Executable('/usr/bin/gcc')
+        # Variables left by other tests, e.g. LD_RUN_PATH, change the rpaths
+        compiler(str(source), '-o', path, *flags,
+                 env={'PATH': '/usr/bin:/bin'})
+        return path
+    return _binary
+
+
+def dtags_flags(dtags, rpath):
+    return ['-Wl,--%s-new-dtags' % dtags, '-Wl,-rpath,%s' % rpath]
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+@pytest.mark.parametrize('dtags,tag', [
+    ('disable', elf.DT_RPATH), ('enable', elf.DT_RUNPATH)
+])
+def test_search_path_entries(binary, dtags, tag):
+    path = binary(*dtags_flags(dtags, long_rpath))
+
+    with open(path, 'rb') as f:
+        entries = elf.search_path_entries(f)
+
+    assert [(e.tag, e.value) for e in entries] == [(tag, long_rpath)]
+    assert elf.get_rpath(path) == long_rpath
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_get_rpath_without_search_path(binary):
+    assert elf.get_rpath(binary()) == ''
+    assert elf.get_rpath(binary('-c')) is None
+
+
+def test_get_rpath_of_other_files(tmpdir):
+    text = tmpdir.join('text')
+    text.write('#!/bin/sh\n')
+    truncated = tmpdir.join('truncated')
+    truncated.write(b'\x7fELF\x02\x01\x01', mode='wb')
+
+    for path in (text, truncated):
+        with pytest.raises(elf.ElfParsingError):
+            elf.get_rpath(str(path))
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+@pytest.mark.parametrize('dtags', ['disable', 'enable'])
+def test_set_rpath_in_place(binary, dtags):
+    path = binary(*dtags_flags(dtags, long_rpath))
+
+    assert elf.set_rpath_in_place(path, '/short/lib:$ORIGIN/../lib')
+
+    with open(path, 'rb') as f:
+        entries = elf.search_path_entries(f)
+        data = f.read()
+    assert [(e.tag, e.value) for e in entries] == [
+        (elf.DT_RPATH, '/short/lib:$ORIGIN/../lib')]
+    assert b'/very/long' not in data
+
+    # The binary still runs
+    Executable(path)()
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc')
+def test_set_rpath_in_place_needs_room(binary):
+    path = binary(*dtags_flags('enable', '/short/lib'))
+    assert not elf.set_rpath_in_place(path, long_rpath)
+    assert elf.get_rpath(path) == '/short/lib'
+
+    # An empty search path needs no room
+    path = binary()
+    assert elf.set_rpath_in_place(path, '')
+    assert not elf.set_rpath_in_place(path, '/short/lib')
+
+
+@pytest.mark.requires_executables('/usr/bin/gcc', 'patchelf')
+@pytest.mark.parametrize('dtags', ['disable', 'enable'])
+@pytest.mark.parametrize('rpath', [
+    long_rpath, '', '/short/lib', '$ORIGIN/../lib:/usr/lib'
+])
+def test_same_rpaths_as_patchelf(binary, dtags, rpath):
+    patchelf = which('patchelf')
+    path = binary(*dtags_flags(dtags, long_rpath))
+    patched = path + '.patchelf'
+    shutil.copy(path, patched)
+
+    assert elf.set_rpath_in_place(path, rpath)
+    patchelf('--force-rpath', '--set-rpath', rpath, patched)
+
+    for p in (path, patched):
+        assert patchelf('--print-rpath', p, output=str).strip() == rpath
+        assert elf.get_rpath(p) == rpath
+
+    def tags(p):
+        with open(p, 'rb') as f:
+            return [e.tag for e in elf.search_path_entries(f)]
+    assert tags(path) == tags(patched) == [elf.DT_RPATH]
@@ -106,3 +106,13 @@ def test_lock_checks_group(tmpdir):
     # safe
     tmpdir.chmod(0o477)
     lk.check_lock_safety(path)
+
+
+def test_blocking_locks(tmpdir):
+    """Ensure locks wait in lockf() when config:blocking_locks is set."""
+    lock_path = str(tmpdir.join('lockfile'))
+    assert not lk.Lock(lock_path).blocking
+
+    with spack.config.override('config:blocking_locks', True):
+        assert lk.Lock(lock_path).blocking
+        assert not lk.Lock(lock_path, blocking=False).blocking
@@ -5,13 +5,23 @@
 import sys
 import os
 
+from six.moves import cPickle
+
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
+
+import spack
+import spack.repo
 import spack.util.prefix as prefix
 import spack.util.environment as environment
-import spack.build_environment as build_env
 
 #: Environment variable name Spack uses to track individually loaded packages
 spack_loaded_hashes_var = 'SPACK_LOADED_HASHES'
 
+#: Directory of the ``misc_cache`` where ``spack load`` caches environment
+#: modifications, or None to compute them on every call
+load_cache_dir = 'load'
+
 
 def prefix_inspections(platform):
     """Get list of prefix inspections for platform
@@ -64,6 +74,8 @@ def environment_modifications_for_spec(spec, view=None):
 
     This list is specific to the location of the spec or its projection in
     the view."""
+    import spack.build_environment as build_env
+
     spec = spec.copy()
     if view and not spec.external:
         spec.prefix = prefix.Prefix(view.view().get_projection_for_spec(spec))
@@ -89,3 +101,83 @@ def environment_modifications_for_spec(spec, view=None):
     spec.package.setup_run_environment(env)
 
     return env
+
+
+def _file_stamp(path):
+    """Modification time, size and inode of a file, or None if the file
+    does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+def modifications_cache_key(specs, paths=()):
+    """Key of the environment modifications computed for ``specs``.
+
+    The modifications depend on the specs and their dependencies, on the
+    package files of all of them and on the version of Spack, as well as on
+    the files at ``paths``, e.g. the database telling which specs are
+    installed, so the key changes whenever any of these does.
+    """
+    nodes = {}
+    for spec in specs:
+        for node in spec.traverse():
+            nodes.setdefault(node.dag_hash(), node)
+
+    package_stamps = []
+    for dag_hash, node in sorted(nodes.items()):
+        try:
+            repo = spack.repo.path.repo_for_pkg(node)
+            stamp = _file_stamp(repo.filename_for_package_name(node.name))
+        except spack.repo.UnknownNamespaceError:
+            stamp = None
+        package_stamps.append((dag_hash, stamp))
+
+    return [spack.spack_version,
+            [spec.dag_hash() for spec in specs],
+            package_stamps,
+            [(path, _file_stamp(path)) for path in paths]]
+
+
+def cached_environment_modifications(path, key, compute):
+    """Environment modifications cached in the file at ``path``.
+
+    The modifications are read from the file if they were stored under
+    ``key``.  Otherwise they are computed by ``compute()`` and stored in
+    the file.  Only the modifications are cached, and not the shell
+    commands applying them, since these depend on the environment of the
+    shell that runs them.
+
+    Args:
+        path (str): file storing the modifications
+        key: key of the modifications, e.g. from
+            ``modifications_cache_key()``
+        compute (callable): function returning the modifications
+
+    Returns:
+        (EnvironmentModifications): the modifications
+    """
+    try:
+        with open(path, 'rb') as f:
+            cached_key, env_mod = cPickle.load(f)
+        if cached_key == key:
+            return env_mod
+    except Exception as e:
+        # Missing, truncated, or written by an incompatible Python
+        tty.debug('Not using cached environment modifications {0}: {1}'
+                  .format(path, str(e)))
+
+    env_mod = compute()
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        mkdirp(os.path.dirname(path))
+        with open(tmp, 'wb') as f:
+            cPickle.dump((key, env_mod), f, protocol=2)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        tty.debug('Cannot cache environment modifications {0}: {1}'
+                  .format(path, str(e)))
+    return env_mod
@@ -0,0 +1,266 @@
+# Copyright 2013-2020 Lawrence Livermore National Security, LLC and other
+# Spack Project Developers. See the top-level COPYRIGHT file for details.
+#
+# SPDX-License-Identifier: (Apache-2.0 OR MIT)
+
+"""Read and edit the RPATH and RUNPATH of ELF binaries in place.
+
+Only what is needed to find the search paths of a binary is parsed: the
+program headers, the dynamic section and the dynamic string table.  A
+search path is edited by overwriting its string in the string table, so
+the new path must not be longer than the old one.  Longer paths require
+the binary to be laid out again, which is left to ``patchelf``.
+"""
+import struct
+from collections import namedtuple
+
+from spack.error import SpackError
+
+#: Types of program headers
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+#: Tags of the entries of the dynamic section
+DT_NULL = 0
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+
+class ElfParsingError(SpackError):
+    """Raised when a file is not an ELF file, or a malformed one."""
+
+
+#: An entry of the dynamic section holding a search path.  ``offset`` and
+#: ``string_offset`` are the offsets of the entry and of its string in the
+#: file, and ``tag_format`` is the struct format of the tag of the entry.
+SearchPathEntry = namedtuple(
+    'SearchPathEntry',
+    ['tag', 'value', 'offset', 'string_offset', 'tag_format'])
+
+
+def _unpack(fmt, data, offset=0):
+    try:
+        return struct.unpack_from(fmt, data, offset)
+    except struct.error as e:
+        raise ElfParsingError('Truncated ELF file: {0}'.format(str(e)))
+
+
+def _read_at(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) < size:
+        raise ElfParsingError('Truncated ELF file')
+    return data
+
+
+def search_path_entries(f):
+    """The RPATH and RUNPATH entries of the dynamic section of an ELF file.
+
+    Args:
+        f: the ELF file, opened in binary mode
+
+    Returns:
+        (list or None): the ``SearchPathEntry`` of each RPATH and RUNPATH,
+            or None if the file is not dynamically linked
+
+    Raises:
+        ElfParsingError: if the file is not an ELF file, or is malformed
+    """
+    f.seek(0)
+    header = f.read(64)
+    if header[:4] != b'\x7fELF':
+        raise ElfParsingError('Not an ELF file')
+
+    ei_class, ei_data = bytearray(header[4:6])
+    if ei_data not in (1, 2) or ei_class not in (1, 2):
+        raise ElfParsingError('Unknown ELF class or byte order')
+    endian = '<' if ei_data == 1 else '>'
+
+    if ei_class == 2:
+        phoff, = _unpack(endian + 'Q', header, 32)
+        phentsize, phnum = _unpack(endian + 'HH', header, 54)
+        # p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz
+        phdr = struct.Struct(endian + 'IIQQQQ')
+        fields = (0, 2, 3, 5)
+        tag_format = endian + 'q'
+        dyn = struct.Struct(endian + 'qQ')
+    else:
+        phoff, = _unpack(endian + 'I', header, 28)
+        phentsize, phnum = _unpack(endian + 'HH', header, 42)
+        # p_type, p_offset, p_vaddr, p_paddr, p_filesz
+        phdr = struct.Struct(endian + 'IIIII')
+        fields = (0, 1, 2, 4)
+        tag_format = endian + 'i'
+        dyn = struct.Struct(endian + 'iI')
+
+    if phnum and phentsize < phdr.size:
+        raise ElfParsingError('Invalid size of program headers')
+
+    # The loadable segments map the addresses in the dynamic section
+    # to offsets in the file
+    loads, dynamic = [], None
+    headers = _read_at(f, phoff, phnum * phentsize)
+    for i in range(phnum):
+        values = phdr.unpack_from(headers, i * phentsize)
+        p_type, p_offset, p_vaddr, p_filesz = [values[j] for j in fields]
+        if p_type == PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+
+    if dynamic is None:
+        return None
+
+    dyn_offset, dyn_size = dynamic
+    data = _read_at(f, dyn_offset, dyn_size)
+    strtab = strsz = None
+    paths = []
+    for i in range(0, dyn_size - dyn.size + 1, dyn.size):
+        tag, value = dyn.unpack_from(data, i)
+        if tag == DT_NULL:
+            break
+        elif tag == DT_STRTAB:
+            strtab = value
+        elif tag == DT_STRSZ:
+            strsz = value
+        elif tag in (DT_RPATH, DT_RUNPATH):
+            paths.append((tag, value, dyn_offset + i))
+
+    if not paths:
+        return []
+    if strtab is None or strsz is None:
+        raise ElfParsingError('No dynamic string table')
+
+    for vaddr, offset, size in loads:
+        if vaddr <= strtab < vaddr + size:
+            strtab_offset = strtab - vaddr + offset
+            break
+    else:
+        raise ElfParsingError('Dynamic string table is not loaded')
+
+    strings = _read_at(f, strtab_offset, strsz)
+    entries = []
+    for tag, value, offset in paths:
+        end = strings.find(b'\0', value)
+        if value >= strsz or end < 0:
+            raise ElfParsingError('Search path out of the string table')
+        try:
+            string = strings[value:end].decode('utf-8')
+        except UnicodeDecodeError:
+            raise ElfParsingError('Search path is not valid UTF-8')
+        entries.append(SearchPathEntry(
+            tag, string, offset, strtab_offset + value, tag_format))
+    return entries
+
+
+def check_search_path_entries(f, entries):
+    """Whether the search path entries, recorded before, still describe
+    the ELF file.
+
+    Args:
+        f: the ELF file, opened in binary mode
+        entries (list): ``SearchPathEntry`` of the file
+
+    Returns:
+        (bool): whether the tag and the string of each entry are found at
+            their offsets in the file
+    """
+    for entry in entries:
+        value = entry.value.encode('utf-8') + b'\0'
+        tag_size = struct.calcsize(entry.tag_format)
+        f.seek(entry.offset)
+        tag = f.read(tag_size)
+        if len(tag) < tag_size or struct.unpack(
+                entry.tag_format, tag)[0] != entry.tag:
+            return False
+        f.seek(entry.string_offset)
+        if f.read(len(value)) != value:
+            return False
+    return True
+
+
+def _read_search_path_entries(f, entries):
+    """The search path entries of f: the given ones if they still match
+    the file, or else the ones parsed from it."""
+    if entries is not None and check_search_path_entries(f, entries):
+        return entries
+    return search_path_entries(f)
+
+
+def get_rpath(path, entries=None):
+    """The search path of an ELF file, like ``patchelf --print-rpath``.
+
+    This is the RUNPATH of the file or, if it has none, its RPATH.
+
+    Args:
+        path (str): path of the ELF file
+        entries (list): ``SearchPathEntry`` of the file recorded before,
+            which are used instead of parsing the file if they still match
+            it
+
+    Returns:
+        (str or None): the search path, empty if the file has none, or None
+            if the file is not dynamically linked
+
+    Raises:
+        ElfParsingError: if the file is not an ELF file, or is malformed
+    """
+    with open(path, 'rb') as f:
+        entries = _read_search_path_entries(f, entries)
+
+    if entries is None:
+        return None
+    for tag in (DT_RUNPATH, DT_RPATH):
+        for entry in entries:
+            if entry.tag == tag:
+                return entry.value
+    return ''
+
+
+def set_rpath_in_place(path, rpath, force_rpath=True, entries=None):
+    """Replace the search path of an ELF file, without moving anything in
+    the file.
+
+    The new path overwrites the old one, and the bytes left over are set
+    to zero.  This is only possible if the file has a single search path,
+    and the new one is not longer than the old one.
+
+    Args:
+        path (str): path of the ELF file
+        rpath (str): the new search path
+        force_rpath (bool): turn a RUNPATH into an RPATH, like
+            ``patchelf --force-rpath``
+        entries (list): ``SearchPathEntry`` of the file recorded before,
+            which are used instead of parsing the file if they still match
+            it
+
+    Returns:
+        (bool): whether the search path was replaced
+
+    Raises:
+        ElfParsingError: if the file is not an ELF file, or is malformed
+    """
+    new_value = rpath.encode('utf-8')
+    with open(path, 'rb+') as f:
+        entries = _read_search_path_entries(f, entries)
+        if entries is None:
+            return False
+        if not entries:
+            # Nothing to do to set an empty search path
+            return not new_value
+        if len(entries) > 1 or b'\0' in new_value:
+            return False
+
+        entry = entries[0]
+        old_value = entry.value.encode('utf-8')
+        if len(new_value) > len(old_value):
+            return False
+
+        f.seek(entry.string_offset)
+        f.write(new_value + b'\0' * (len(old_value) - len(new_value)))
+        if force_rpath and entry.tag == DT_RUNPATH:
+            f.seek(entry.offset)
+            f.write(struct.pack(entry.tag_format, DT_RPATH))
+    return True
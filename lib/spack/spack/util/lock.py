@@ -4,16 +4,27 @@
 # SPDX-License-Identifier: (Apache-2.0 OR MIT)
 
 """Wrapper for ``llnl.util.lock`` allows locking to be enabled/disabled."""
+import json
 import os
+import shutil
+import socket
 import stat
+import sys
+import time
 
 import llnl.util.lock
+import llnl.util.tty as tty
+from llnl.util.filesystem import mkdirp
 from llnl.util.lock import *  # noqa
 
 import spack.config
 import spack.error
 import spack.paths
 
+#: Directory of the ``misc_cache`` where Spack processes save the statistics
+#: of the locks they took
+statistics_dir = 'lock-statistics'
+
 
 class Lock(llnl.util.lock.Lock):
     """Lock that can be disabled.
@@ -21,8 +32,13 @@ class Lock(llnl.util.lock.Lock):
     This overrides the ``_lock()`` and ``_unlock()`` methods from
     ``llnl.util.lock`` so that all the lock API calls will succeed, but
     the actual locking mechanism can be disabled via ``_enable_locks``.
+
+    Locks wait in ``lockf()`` rather than polling if
+    ``config:blocking_locks`` is set.
     """
     def __init__(self, *args, **kwargs):
+        kwargs.setdefault(
+            'blocking', spack.config.get('config:blocking_locks', False))
         super(Lock, self).__init__(*args, **kwargs)
         self._enable = spack.config.get('config:locks', True)
 
@@ -72,3 +88,60 @@ def check_lock_safety(path):
                 "Running a shared spack without locks is unsafe. You must "
                 "restrict permissions on {0} or enable locks.").format(path)
             raise spack.error.SpackError(msg, long_msg)
+
+
+def _statistics_path():
+    import spack.caches as caches
+    return caches.misc_cache.cache_path(statistics_dir)
+
+
+def save_statistics():
+    """Save the statistics of the locks taken by this process, if
+    ``config:lock_statistics`` is set, for ``spack debug lock-report``."""
+    statistics = llnl.util.lock.lock_statistics()
+    if not statistics or not spack.config.get('config:lock_statistics'):
+        return
+
+    directory = _statistics_path()
+    path = os.path.join(directory, '{0}-{1}-{2}.json'.format(
+        socket.gethostname(), os.getpid(), int(time.time())))
+    tmp = path + '.tmp'
+    try:
+        mkdirp(directory)
+        with open(tmp, 'w') as f:
+            json.dump({'command': sys.argv[1:], 'statistics': statistics}, f)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        tty.debug('Cannot save the statistics of locks in {0}: {1}'
+                  .format(path, str(e)))
+
+
+def saved_statistics():
+    """The statistics of locks saved by Spack processes.
+
+    Returns:
+        (tuple): the statistics merged by lock and type of lock, as returned
+            by ``llnl.util.lock.merge_lock_statistics()``, and the number of
+            processes that saved them
+    """
+    directory = _statistics_path()
+    if not os.path.isdir(directory):
+        return [], 0
+
+    statistics, processes = [], 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                statistics.extend(json.load(f)['statistics'])
+            processes += 1
+        except (IOError, OSError, ValueError, KeyError) as e:
+            tty.debug('Ignoring the statistics of locks in {0}: {1}'
+                      .format(name, str(e)))
+    return llnl.util.lock.merge_lock_statistics(statistics), processes
+
+
+def clear_statistics():
+    """Remove the statistics of locks saved by Spack processes."""
+    shutil.rmtree(_statistics_path(), True)
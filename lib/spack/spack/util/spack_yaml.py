@@ -16,10 +16,11 @@
 
 
 from ordereddict_backport import OrderedDict
-from six import string_types, StringIO
+from six import integer_types, string_types, text_type, StringIO
 
 import ruamel.yaml as yaml
 from ruamel.yaml import RoundTripLoader, RoundTripDumper
+from ruamel.yaml.nodes import ScalarNode
 
 from llnl.util.tty.color import colorize, clen, cextra
 
@@ -207,6 +208,107 @@ def dump(obj, default_flow_style=False, stream=None):
                      Dumper=SafeDumper, stream=stream)
 
 
+class _NotFlowable(Exception):
+    """Raised by ``dump_flow`` helpers for data they cannot format."""
+
+
+#: Dumper whose scalar analysis and resolver ``dump_flow`` relies on
+_flow_dumper = SafeDumper(None)
+
+#: Formatted scalars of the documents dumped by ``dump_flow``, mapped to
+#: whether they can be used as mapping keys
+_flow_scalars = {}
+
+#: Number of entries of ``_flow_scalars`` after which it is emptied
+_max_flow_scalars = 100000
+
+#: Exact types of the data formatted by ``dump_flow``
+_flow_str_types = (str, syaml_str, text_type)
+_flow_int_types = (syaml_int,) + integer_types
+
+
+def _flow_scalar(value, key):
+    """Format a string as the SafeDumper does in a flow collection."""
+    scalar = _flow_scalars.get(value)
+    if scalar is None:
+        analysis = _flow_dumper.analyze_scalar(value)
+        if analysis.multiline:
+            raise _NotFlowable()
+
+        tag = _flow_dumper.resolve(ScalarNode, value, (True, False))
+        if (tag == _flow_dumper.DEFAULT_SCALAR_TAG and
+                analysis.allow_flow_plain and not analysis.empty):
+            text = value
+        elif analysis.allow_single_quoted:
+            text = u"'" + value.replace(u"'", u"''") + u"'"
+        else:
+            raise _NotFlowable()
+
+        # Longer keys and empty ones are written as complex keys
+        simple_key = not analysis.empty and len(value) < 128
+        scalar = (text, simple_key)
+        if len(_flow_scalars) >= _max_flow_scalars:
+            _flow_scalars.clear()
+        _flow_scalars[value] = scalar
+
+    text, simple_key = scalar
+    if key and not simple_key:
+        raise _NotFlowable()
+    return text
+
+
+def _write_flow(obj, out):
+    obj_type = type(obj)
+    if obj_type in _flow_str_types:
+        out.append(_flow_scalar(obj, False))
+    elif obj_type is bool:
+        out.append(u'true' if obj else u'false')
+    elif obj_type in _flow_int_types:
+        out.append(str(obj))
+    elif obj is None:
+        out.append(u"!!null ''")
+    elif obj_type in (dict, syaml_dict):
+        out.append(u'{')
+        for i, (key, value) in enumerate(obj.items()):
+            if type(key) not in _flow_str_types:
+                raise _NotFlowable()
+            if i:
+                out.append(u', ')
+            out.append(_flow_scalar(key, True))
+            out.append(u': ')
+            _write_flow(value, out)
+        out.append(u'}')
+    elif obj_type in (list, syaml_list, tuple):
+        out.append(u'[')
+        for i, item in enumerate(obj):
+            if i:
+                out.append(u', ')
+            _write_flow(item, out)
+        out.append(u']')
+    else:
+        raise _NotFlowable()
+
+
+def dump_flow(obj):
+    """Same as ``dump(obj, default_flow_style=True)``, but much faster.
+
+    The document is formatted directly when it only holds dictionaries,
+    lists, strings, integers, booleans and ``None``, which is the case of
+    the node dictionaries hashed by ``Spec``; any other document is dumped
+    by ruamel.  In both cases the text is identical, so that hashes of the
+    text do not depend on how it was produced.
+    """
+    if type(obj) in (dict, syaml_dict, list, syaml_list):
+        out = []
+        try:
+            _write_flow(obj, out)
+            out.append(u'\n')
+            return u''.join(out)
+        except _NotFlowable:
+            pass
+    return dump(obj, default_flow_style=True)
+
+
 def file_line(mark):
     """Format a mark as <file>:<line> information."""
     result = mark.name
@@ -33,7 +33,6 @@ class HTMLParseError(Exception):
 from llnl.util.filesystem import mkdirp
 import llnl.util.tty as tty
 
-import spack.cmd
 import spack.config
 import spack.error
 import spack.url
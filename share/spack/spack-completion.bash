@@ -375,14 +375,14 @@ _spack_buildcache() {
     then
         SPACK_COMPREPLY="-h --help"
     else
-        SPACK_COMPREPLY="create install list keys preview check download get-buildcache-name save-yaml copy update-index"
+        SPACK_COMPREPLY="create install list keys preview check download get-buildcache-name save-yaml copy update-index benchmark"
     fi
 }
 
 _spack_buildcache_create() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -r --rel -f --force -u --unsigned -a --allow-root -k --key -d --directory --no-rebuild-index -y --spec-yaml --no-deps"
+        SPACK_COMPREPLY="-h --help -r --rel -f --force -u --unsigned -a --allow-root -k --key -d --directory --no-rebuild-index -y --spec-yaml --no-deps -c --compression"
     else
         _all_packages
     fi
@@ -443,6 +443,15 @@ _spack_buildcache_update_index() {
     SPACK_COMPREPLY="-h --help -d --mirror-url"
 }
 
+_spack_buildcache_benchmark() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -c --compression -t --file-types"
+    else
+        _installed_packages
+    fi
+}
+
 _spack_cd() {
     if $list_options
     then
@@ -489,7 +498,7 @@ _spack_ci_rebuild() {
 _spack_clean() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -s --stage -d --downloads -m --misc-cache -p --python-cache -a --all"
+        SPACK_COMPREPLY="-h --help -s --stage -d --downloads -m --misc-cache -c --concretization-cache -p --python-cache -a --all"
     else
         _all_packages
     fi
@@ -576,7 +585,7 @@ _spack_compilers() {
 }
 
 _spack_concretize() {
-    SPACK_COMPREPLY="-h --help -f --force"
+    SPACK_COMPREPLY="-h --help -f --force -j --jobs --no-cache"
 }
 
 _spack_config() {
@@ -655,7 +664,7 @@ _spack_debug() {
     then
         SPACK_COMPREPLY="-h --help"
     else
-        SPACK_COMPREPLY="create-db-tarball"
+        SPACK_COMPREPLY="create-db-tarball hash-benchmark copy-benchmark import-time lock-report"
     fi
 }
 
@@ -663,6 +672,37 @@ _spack_debug_create_db_tarball() {
     SPACK_COMPREPLY="-h --help"
 }
 
+_spack_debug_hash_benchmark() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -n --number"
+    else
+        _all_packages
+    fi
+}
+
+_spack_debug_copy_benchmark() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -c --copies"
+    else
+        _all_packages
+    fi
+}
+
+_spack_debug_import_time() {
+    if $list_options
+    then
+        SPACK_COMPREPLY="-h --help -n --runs -t --top"
+    else
+        SPACK_COMPREPLY=""
+    fi
+}
+
+_spack_debug_lock_report() {
+    SPACK_COMPREPLY="-h --help -t --top --clear"
+}
+
 _spack_dependencies() {
     if $list_options
     then
@@ -945,7 +985,7 @@ _spack_info() {
 _spack_install() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help --only -u --until -j --jobs --overwrite --keep-prefix --keep-stage --dont-restage --use-cache --no-cache --cache-only --no-check-signature --show-log-on-error --source -n --no-checksum -v --verbose --fake --only-concrete -f --file --clean --dirty --test --run-tests --log-format --log-file --help-cdash --cdash-upload-url --cdash-build --cdash-site --cdash-track --cdash-buildstamp -y --yes-to-all"
+        SPACK_COMPREPLY="-h --help --only -u --until -j --jobs --concurrent-builds --jobs-total --fetch-ahead --overwrite --keep-prefix --keep-stage --dont-restage --use-cache --no-cache --cache-only --no-check-signature --show-log-on-error --source -n --no-checksum -v --verbose --fake --only-concrete -f --file --clean --dirty --test --run-tests --log-format --log-file --help-cdash --cdash-upload-url --cdash-build --cdash-site --cdash-track --cdash-buildstamp -y --yes-to-all"
     else
         _all_packages
     fi
@@ -1025,7 +1065,7 @@ _spack_mirror() {
 _spack_mirror_create() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -d --directory -a --all -f --file -D --dependencies -n --versions-per-spec"
+        SPACK_COMPREPLY="-h --help -d --directory -a --all -f --file -D --dependencies -n --versions-per-spec -j --jobs"
     else
         _all_packages
     fi
@@ -1092,7 +1132,7 @@ _spack_module_lmod() {
 _spack_module_lmod_refresh() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help --delete-tree --upstream-modules -y --yes-to-all"
+        SPACK_COMPREPLY="-h --help --delete-tree --upstream-modules --incremental -y --yes-to-all -j --jobs"
     else
         _installed_packages
     fi
@@ -1146,7 +1186,7 @@ _spack_module_tcl() {
 _spack_module_tcl_refresh() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help --delete-tree --upstream-modules -y --yes-to-all"
+        SPACK_COMPREPLY="-h --help --delete-tree --upstream-modules --incremental -y --yes-to-all -j --jobs"
     else
         _installed_packages
     fi
@@ -1392,7 +1432,7 @@ _spack_setup() {
 _spack_spec() {
     if $list_options
     then
-        SPACK_COMPREPLY="-h --help -l --long -L --very-long -I --install-status -y --yaml -j --json -c --cover -N --namespaces -t --types"
+        SPACK_COMPREPLY="-h --help -l --long -L --very-long -I --install-status -y --yaml -j --json -c --cover -N --namespaces -t --types --no-cache"
     else
         _all_packages
     fi